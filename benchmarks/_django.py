@@ -0,0 +1,28 @@
+"""
+Django setup of benchmarks which import the youtube app.
+"""
+import os
+
+import django
+
+# settings required by core.settings, a real .env file takes precedence
+ENV_DEFAULTS = {
+    'DJANGO_SETTINGS_MODULE': 'core.settings',
+    'SECRET_KEY': 'benchmark',
+    'ALLOWED_HOSTS': '*',
+    'YOUTUBE_API_CONFIG_CLIENT_SECRET_FILE': 'client_secret.json',
+    'YOUTUBE_API_CONFIG_SCOPES': 'https://www.googleapis.com/auth/youtube.upload',
+}
+
+
+def setup():
+    for name, value in ENV_DEFAULTS.items():
+        os.environ.setdefault(name, value)
+    django.setup()
+
+
+def use_fake_youtube(server):
+    """Make YTApi talk to the FakeYouTube `server` without credentials."""
+    from youtube.utils import api
+    api._service_cache.factory = server.service
+    api._service_cache.clear()
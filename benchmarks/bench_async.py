@@ -0,0 +1,91 @@
+"""
+Load test of the sync (YTApi) and async (AsyncYTApi) upload paths against
+the local fake YouTube server.
+
+    python -m benchmarks.bench_async --uploads 200 --size-kb 512 --latency 0.05
+
+The sync path needs a thread per in-flight upload (like a web worker per
+upload), the async path keeps all of them in flight on one event loop.
+"""
+import argparse
+import asyncio
+import os
+import tempfile
+import threading
+import time
+from concurrent.futures import ThreadPoolExecutor
+
+from . import _django
+from .fake_youtube import FakeYouTube
+
+KB = 1024
+
+
+def run_sync(video, path, uploads, threads):
+    from youtube.utils.api import YTApi
+
+    peak_threads = threading.active_count()
+    started = time.perf_counter()
+    with ThreadPoolExecutor(max_workers=threads) as pool:
+        futures = [pool.submit(YTApi().initialize_upload, video, path) for _ in range(uploads)]
+        peak_threads = max(peak_threads, threading.active_count())
+        results = [future.result() for future in futures]
+    elapsed = time.perf_counter() - started
+    assert all(success for success, _ in results)
+    return elapsed, peak_threads
+
+
+def run_async(video, path, uploads, root_url):
+    from youtube.utils.aio import AsyncYTApi
+
+    async def main():
+        api = AsyncYTApi(root_url=root_url, max_connections=uploads)
+        try:
+            started = time.perf_counter()
+            results = await asyncio.gather(
+                *(api.upload_file(video, path) for _ in range(uploads)))
+            elapsed = time.perf_counter() - started
+        finally:
+            await api.aclose()
+        assert all(success for success, _ in results)
+        return elapsed, threading.active_count()
+
+    return asyncio.run(main())
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.strip().splitlines()[0])
+    parser.add_argument('--uploads', type=int, default=200)
+    parser.add_argument('--size-kb', type=int, default=512)
+    parser.add_argument('--latency', type=float, default=0.05,
+                        help="seconds added to every response")
+    parser.add_argument('--bandwidth-mb', type=float, default=None,
+                        help="bandwidth cap of each connection, MB/s")
+    parser.add_argument('--threads', type=int, default=None,
+                        help="threads of the sync path, default: one per upload")
+    args = parser.parse_args()
+
+    _django.setup()
+    from youtube.models import YTVideo
+
+    video = YTVideo(title='benchmark', tags='benchmark')
+    bandwidth = args.bandwidth_mb * KB * KB if args.bandwidth_mb else None
+    with tempfile.NamedTemporaryFile(suffix='.mp4') as media, \
+            FakeYouTube(latency=args.latency, bandwidth=bandwidth) as server:
+        media.write(os.urandom(args.size_kb * KB))
+        media.flush()
+        _django.use_fake_youtube(server)
+
+        print(f"{args.uploads} concurrent uploads of {args.size_kb} KB, "
+              f"{args.latency * 1000:.0f} ms latency")
+        print(f"{'path':>6} {'seconds':>8} {'uploads/s':>10} {'threads':>8}")
+        results = {
+            'sync': run_sync(video, media.name, args.uploads, args.threads or args.uploads),
+            'async': run_async(video, media.name, args.uploads, server.url),
+        }
+        for path, (elapsed, threads) in results.items():
+            print(f"{path:>6} {elapsed:>8.2f} {args.uploads / elapsed:>10.2f} {threads:>8}")
+
+
+if __name__ == '__main__':
+    main()
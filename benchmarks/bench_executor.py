@@ -0,0 +1,87 @@
+"""
+Benchmark UploadExecutor against the local fake YouTube upload endpoint.
+
+    python -m benchmarks.bench_executor --uploads 16 --size-mb 4 --bandwidth-mb 8
+
+Every connection to the fake server is capped to `--bandwidth-mb` MB/s, so
+uploads/sec and bytes/sec should grow with the concurrency level until the
+per-channel limit is reached.
+"""
+import argparse
+import os
+import tempfile
+import threading
+import time
+
+from googleapiclient.http import MediaFileUpload, build_http
+
+from youtube.utils.executor import UploadExecutor
+
+from .fake_youtube import FakeYouTube
+
+MB = 1024 * 1024
+
+_thread_local = threading.local()
+
+
+def upload(service, path):
+    http = getattr(_thread_local, 'http', None)
+    if http is None:
+        http = _thread_local.http = build_http()
+    request = service.videos().insert(
+        part='snippet,status',
+        body={'snippet': {'title': 'benchmark'}, 'status': {'privacyStatus': 'private'}},
+        media_body=MediaFileUpload(path, chunksize=-1, resumable=True),
+    )
+    response = None
+    while response is None:
+        _, response = request.next_chunk(http=http)
+    return response['id']
+
+
+def run(service, path, uploads, concurrency, channels, per_channel):
+    started = time.perf_counter()
+    with UploadExecutor(max_workers=concurrency, per_channel=per_channel) as executor:
+        futures = [
+            executor.submit(upload, service, path, channel=f"channel-{i % channels}")
+            for i in range(uploads)
+        ]
+    for future in futures:
+        future.result()
+    return time.perf_counter() - started
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.strip().splitlines()[0])
+    parser.add_argument('--uploads', type=int, default=16)
+    parser.add_argument('--size-mb', type=float, default=4)
+    parser.add_argument('--bandwidth-mb', type=float, default=8,
+                        help="bandwidth cap of each connection, MB/s")
+    parser.add_argument('--latency', type=float, default=0.02,
+                        help="seconds added to every response")
+    parser.add_argument('--concurrency', default='1,2,4,8')
+    parser.add_argument('--channels', type=int, default=4)
+    parser.add_argument('--per-channel', type=int, default=None,
+                        help="per channel limit, default: no limit")
+    args = parser.parse_args()
+
+    size = int(args.size_mb * MB)
+    with tempfile.NamedTemporaryFile(suffix='.mp4') as media, \
+            FakeYouTube(latency=args.latency, bandwidth=args.bandwidth_mb * MB) as server:
+        media.write(os.urandom(size))
+        media.flush()
+        service = server.service()
+
+        print(f"{args.uploads} uploads of {args.size_mb} MB, "
+              f"{args.bandwidth_mb} MB/s per connection, {args.channels} channel(s)")
+        print(f"{'concurrency':>11} {'seconds':>8} {'uploads/s':>10} {'MB/s':>8}")
+        for concurrency in [int(c) for c in args.concurrency.split(',')]:
+            per_channel = args.per_channel or concurrency
+            elapsed = run(service, media.name, args.uploads,
+                          concurrency, args.channels, per_channel)
+            print(f"{concurrency:>11} {elapsed:>8.2f} {args.uploads / elapsed:>10.2f} "
+                  f"{args.uploads * size / elapsed / MB:>8.2f}")
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,113 @@
+"""
+Benchmark the media sources of an upload: memory and CPU of reading chunks.
+
+    python -m benchmarks.bench_media --uploads 4 --size-mb 256 --chunk-mb 8
+
+Every source uploads the same file to the local fake YouTube server from a
+child process of its own, so the max RSS of one doesn't hide the other's.
+Sources:
+    file   MediaFileUpload, http.client copies the chunk stream in 8 KiB blocks
+    mmap   MappedMediaUpload, one memoryview of the mapped file per chunk
+"""
+import argparse
+import json
+import os
+import resource
+import subprocess
+import sys
+import tempfile
+import time
+import tracemalloc
+
+from googleapiclient.discovery import build_from_document
+from googleapiclient.discovery_cache import get_static_doc
+from googleapiclient.http import MediaFileUpload, build_http
+
+from youtube.utils.media import MappedMediaUpload
+
+from .fake_youtube import FakeYouTube
+
+MB = 1024 * 1024
+
+SOURCES = {
+    'file': lambda path, chunksize: MediaFileUpload(path, chunksize=chunksize, resumable=True),
+    'mmap': lambda path, chunksize: MappedMediaUpload(path, chunksize=chunksize),
+}
+
+
+def upload(service, http, media):
+    request = service.videos().insert(
+        part='snippet,status',
+        body={'snippet': {'title': 'benchmark'}, 'status': {'privacyStatus': 'private'}},
+        media_body=media,
+    )
+    response = None
+    while response is None:
+        _, response = request.next_chunk(http=http)
+    return response['id']
+
+
+def child(args):
+    """Upload with one source and print its measurements as JSON."""
+    document = json.loads(get_static_doc('youtube', 'v3'))
+    document['rootUrl'] = document['baseUrl'] = args.url
+    http = build_http()
+    service = build_from_document(document, http=http)
+
+    tracemalloc.start()
+    started, usage = time.perf_counter(), resource.getrusage(resource.RUSAGE_SELF)
+    for _ in range(args.uploads):
+        media = SOURCES[args.child](args.path, int(args.chunk_mb * MB))
+        upload(service, http, media)
+        if hasattr(media, 'close'):
+            media.close()
+    elapsed = time.perf_counter() - started
+    _, traced = tracemalloc.get_traced_memory()
+    end = resource.getrusage(resource.RUSAGE_SELF)
+    print(json.dumps({
+        'seconds': elapsed,
+        'cpu': end.ru_utime + end.ru_stime - usage.ru_utime - usage.ru_stime,
+        'traced': traced,
+        # kilobytes on Linux
+        'rss': end.ru_maxrss * 1024,
+    }))
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.strip().splitlines()[0])
+    parser.add_argument('--uploads', type=int, default=4)
+    parser.add_argument('--size-mb', type=float, default=256)
+    parser.add_argument('--chunk-mb', type=float, default=8)
+    parser.add_argument('--sources', default=','.join(SOURCES))
+    parser.add_argument('--child', choices=SOURCES, help=argparse.SUPPRESS)
+    parser.add_argument('--url', help=argparse.SUPPRESS)
+    parser.add_argument('--path', help=argparse.SUPPRESS)
+    args = parser.parse_args()
+    if args.child:
+        return child(args)
+
+    size = int(args.size_mb * MB)
+    with tempfile.NamedTemporaryFile(suffix='.mp4') as media, FakeYouTube() as server:
+        for _ in range(0, size, MB):
+            media.write(os.urandom(min(MB, size - media.tell())))
+        media.flush()
+
+        print(f"{args.uploads} uploads of {args.size_mb} MB in chunks of {args.chunk_mb} MB")
+        print(f"{'source':>6} {'seconds':>8} {'MB/s':>8} {'cpu s':>8} "
+              f"{'traced MB':>10} {'max RSS MB':>11}")
+        for source in args.sources.split(','):
+            output = subprocess.run(
+                [sys.executable, '-m', 'benchmarks.bench_media', '--child', source,
+                 '--url', server.url, '--path', media.name,
+                 '--uploads', str(args.uploads), '--chunk-mb', str(args.chunk_mb)],
+                check=True, capture_output=True, text=True,
+            ).stdout
+            result = json.loads(output)
+            print(f"{source:>6} {result['seconds']:>8.2f} "
+                  f"{args.uploads * size / result['seconds'] / MB:>8.1f} "
+                  f"{result['cpu']:>8.2f} {result['traced'] / MB:>10.1f} "
+                  f"{result['rss'] / MB:>11.1f}")
+
+
+if __name__ == '__main__':
+    main()
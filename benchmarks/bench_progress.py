@@ -0,0 +1,75 @@
+"""
+Measure the per-chunk overhead of upload progress reporting.
+
+    python -m benchmarks.bench_progress --chunks 200000 --store-latency-ms 0.5
+
+ProgressReporter is called after every acknowledged chunk. It's compared to
+an empty callback and to publishing on every chunk; `--store-latency-ms`
+simulates the round trip of a shared cache (memcached, redis) per write.
+Chunks are fed faster than real uploads, so coalesced writes are a few per
+run while uncoalesced ones pay the round trip for every chunk.
+"""
+import argparse
+import time
+
+from youtube.utils.progress import ProgressReporter
+
+MB = 1024 * 1024
+
+
+class MemoryStore:
+    def __init__(self, latency=0.0):
+        self.latency = latency
+        self.writes = 0
+        self.states = {}
+
+    def set(self, job_id, state):
+        self.writes += 1
+        if self.latency:
+            time.sleep(self.latency)
+        self.states[job_id] = dict(state)
+
+    def get(self, job_id):
+        return self.states.get(job_id)
+
+
+def run(callback, chunks, chunk_size):
+    started = time.perf_counter()
+    for index in range(1, chunks + 1):
+        callback('https://upload.example/session', index * chunk_size, chunks * chunk_size)
+    return time.perf_counter() - started
+
+
+def report(name, seconds, chunks, writes=None):
+    writes = '' if writes is None else f"  store writes {writes}"
+    print(f"{name:<28} {seconds / chunks * 1e9:10.0f} ns/chunk{writes}")
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.strip().splitlines()[0])
+    parser.add_argument('--chunks', type=int, default=200000)
+    parser.add_argument('--chunk-size-mb', type=int, default=8)
+    parser.add_argument('--store-latency-ms', type=float, default=0.0)
+    args = parser.parse_args()
+    chunk_size = args.chunk_size_mb * MB
+    latency = args.store_latency_ms / 1000
+
+    def noop(resumable_uri, bytes_uploaded, total_bytes):
+        pass
+
+    report("no progress", run(noop, args.chunks, chunk_size), args.chunks)
+
+    persisted = []
+    store = MemoryStore(latency)
+    reporter = ProgressReporter(1, store, persist=lambda *progress: persisted.append(progress))
+    report("coalesced (1 s)", run(reporter, args.chunks, chunk_size), args.chunks, store.writes)
+
+    # uncoalesced writes are slow with latency, fewer chunks keep the run short
+    chunks = args.chunks if not latency else min(args.chunks, 2000)
+    store = MemoryStore(latency)
+    reporter = ProgressReporter(2, store, interval=0)
+    report("every chunk", run(reporter, chunks, chunk_size), chunks, store.writes)
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,72 @@
+"""
+Measure cold-start time of `core.wsgi` and of building the YouTube service.
+
+    python -m benchmarks.bench_startup --runs 5
+
+`import core.wsgi` does not build the YouTube service anymore. The service
+build (static discovery document vs. fetching it over network) is measured
+separately; before the lazy service cache it was paid on every import.
+"""
+import argparse
+import os
+import statistics
+import subprocess
+import sys
+
+from ._django import ENV_DEFAULTS
+
+BASE_DIR = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+
+WSGI_IMPORT = """
+import time
+started = time.perf_counter()
+import core.wsgi
+print(time.perf_counter() - started)
+"""
+
+SERVICE_BUILD = """
+import time
+from googleapiclient.discovery import build
+from googleapiclient.http import build_http
+started = time.perf_counter()
+build('youtube', 'v3', http=build_http(), static_discovery={static}, cache_discovery=False)
+print(time.perf_counter() - started)
+"""
+
+
+def measure(code, runs):
+    env = dict(ENV_DEFAULTS, **os.environ)
+    timings = []
+    for _ in range(runs):
+        output = subprocess.run(
+            [sys.executable, '-c', code], cwd=BASE_DIR, env=env,
+            check=True, capture_output=True, text=True).stdout
+        timings.append(float(output.strip().splitlines()[-1]))
+    return timings
+
+
+def report(name, timings):
+    print(f"{name:<34} median {statistics.median(timings) * 1000:8.1f} ms  "
+          f"min {min(timings) * 1000:8.1f} ms")
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.strip().splitlines()[0])
+    parser.add_argument('--runs', type=int, default=5)
+    parser.add_argument('--network', action='store_true',
+                        help="also measure build() fetching discovery document")
+    args = parser.parse_args()
+
+    report("import core.wsgi", measure(WSGI_IMPORT, args.runs))
+    report("build() static discovery", measure(SERVICE_BUILD.format(static=True), args.runs))
+    if args.network:
+        try:
+            timings = measure(SERVICE_BUILD.format(static=False), args.runs)
+        except subprocess.CalledProcessError:
+            print("build() network discovery         failed, no network access?")
+        else:
+            report("build() network discovery", timings)
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,65 @@
+"""
+Measure thumbnails prepared per second by ThumbnailPipeline.
+
+    python -m benchmarks.bench_thumbnail --images 64 --workers 1 2 4 8
+
+Source images are large photos-like JPEGs and PNGs, every run uses an empty
+cache directory so each image is processed. A second pass over the same
+images measures cache hits.
+"""
+import argparse
+import os
+import tempfile
+import time
+
+from PIL import Image
+
+from youtube.utils.thumbnail import ThumbnailPipeline
+
+
+def make_images(directory, count, size):
+    paths = []
+    for index in range(count):
+        # noise does not compress, the worst case of a photo
+        image = Image.frombytes('RGB', size, os.urandom(size[0] * size[1] * 3))
+        ext = 'png' if index % 2 else 'jpg'
+        path = os.path.join(directory, f'source-{index}.{ext}')
+        image.save(path, quality=95)
+        paths.append(path)
+    return paths
+
+
+def run(paths, warmup, workers, cache_dir):
+    pipeline = ThumbnailPipeline(cache_dir, max_workers=workers)
+    # start the processes before timing
+    for future in [pipeline.submit(warmup) for _ in range(workers)]:
+        future.result()
+    try:
+        started = time.perf_counter()
+        for future in [pipeline.submit(path) for path in paths]:
+            future.result()
+        return time.perf_counter() - started
+    finally:
+        pipeline.shutdown()
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.strip().splitlines()[0])
+    parser.add_argument('--images', type=int, default=64)
+    parser.add_argument('--width', type=int, default=4000)
+    parser.add_argument('--height', type=int, default=3000)
+    parser.add_argument('--workers', type=int, nargs='+', default=[1, 2, 4, os.cpu_count()])
+    args = parser.parse_args()
+
+    with tempfile.TemporaryDirectory() as directory:
+        warmup, *paths = make_images(directory, args.images + 1, (args.width, args.height))
+        for workers in args.workers:
+            cache_dir = tempfile.mkdtemp(dir=directory)
+            seconds = run(paths, warmup, workers, cache_dir)
+            cached = run(paths, warmup, workers, cache_dir)
+            print(f"{workers:3d} workers  {len(paths) / seconds:8.1f} images/s  "
+                  f"cached {len(paths) / cached:8.1f} images/s")
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,187 @@
+"""
+End-to-end upload benchmark of the upload engines against the local fake
+YouTube server, with injected faults.
+
+    python -m benchmarks.bench_upload --uploads 32 --size-mb 4 --concurrency 8 \\
+        --error-rate 0.02 --drop-rate 0.01
+
+For every engine it reports throughput, p50/p99 latency of an upload,
+retries and peak memory (traced Python allocations and max RSS). Run it
+before and after a change of the upload path to catch regressions; pass
+`--seed` for the same faults in every run.
+
+Engines:
+    sync   YTApi.initialize_upload() in threads, retried with RetryPolicy and
+           resumed from the upload session like UploadJob.run()
+    async  AsyncYTApi.upload_file() on one event loop
+"""
+import argparse
+import asyncio
+import os
+import resource
+import statistics
+import tempfile
+import threading
+import time
+import tracemalloc
+from concurrent.futures import ThreadPoolExecutor
+
+from . import _django
+from .fake_youtube import FakeYouTube
+
+MB = 1024 * 1024
+
+
+def retry_policy():
+    from youtube.utils.retry import Backoff, ErrorClass, RetryPolicy
+
+    # production backoffs wait seconds to minutes, scaled down for the benchmark
+    fast = Backoff(base=0.01, cap=0.5, max_retries=20)
+    return RetryPolicy(backoffs={ErrorClass.TRANSPORT: fast, ErrorClass.SERVER: fast})
+
+
+def run_sync(video, path, uploads, concurrency, server):
+    from youtube.utils.api import UploadRetryLater, YTApi
+
+    policy = retry_policy()
+    retries = []
+    lock = threading.Lock()
+
+    def upload():
+        started = time.perf_counter()
+        session = {'uri': None}
+
+        def on_progress(resumable_uri, bytes_uploaded, total_bytes):
+            session['uri'] = resumable_uri
+
+        attempt = 1
+        while True:
+            try:
+                success, response = YTApi().initialize_upload(
+                    video, path, resumable_uri=session['uri'], on_progress=on_progress)
+                break
+            except UploadRetryLater as retry:
+                delay = policy.next_delay(retry.error_class, attempt)
+                if delay is None:
+                    raise
+                attempt += 1
+                time.sleep(delay)
+        with lock:
+            retries.append(attempt - 1)
+        assert success, response
+        return time.perf_counter() - started
+
+    with ThreadPoolExecutor(max_workers=concurrency) as pool:
+        latencies = list(pool.map(lambda _: upload(), range(uploads)))
+    return latencies, sum(retries)
+
+
+def run_async(video, path, uploads, concurrency, server):
+    from googleapiclient.errors import HttpError
+    from youtube.utils.aio import ASYNC_RETRIABLE_EXCEPTIONS, AsyncYTApi
+    from youtube.utils.retry import ErrorClass
+
+    policy = retry_policy()
+
+    async def main():
+        api = AsyncYTApi(root_url=server.url, max_connections=concurrency, retry_policy=policy)
+        limit = asyncio.Semaphore(concurrency)
+
+        async def upload():
+            async with limit:
+                started = time.perf_counter()
+                attempt = 1
+                while True:
+                    # chunks are retried in place, starting the session is not
+                    try:
+                        success, response = await api.upload_file(video, path)
+                        break
+                    except (HttpError,) + ASYNC_RETRIABLE_EXCEPTIONS:
+                        delay = policy.next_delay(ErrorClass.SERVER, attempt)
+                        if delay is None:
+                            raise
+                        attempt += 1
+                        await asyncio.sleep(delay)
+                assert success, response
+                return time.perf_counter() - started
+
+        try:
+            return await asyncio.gather(*(upload() for _ in range(uploads)))
+        finally:
+            await api.aclose()
+
+    latencies = asyncio.run(main())
+    # every injected fault costs one retry
+    return latencies, server.errors + server.drops
+
+
+ENGINES = {
+    'sync': run_sync,
+    'async': run_async,
+}
+
+
+def percentile(values, percent):
+    values = sorted(values)
+    index = min(len(values) - 1, max(0, round(percent / 100 * len(values)) - 1))
+    return values[index]
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.strip().splitlines()[0])
+    parser.add_argument('--engines', nargs='+', choices=ENGINES, default=list(ENGINES))
+    parser.add_argument('--uploads', type=int, default=32)
+    parser.add_argument('--size-mb', type=float, default=4)
+    parser.add_argument('--chunk-mb', type=float, default=1)
+    parser.add_argument('--concurrency', type=int, default=8)
+    parser.add_argument('--latency', type=float, default=0.02,
+                        help="seconds added to every response")
+    parser.add_argument('--bandwidth-mb', type=float, default=None,
+                        help="bandwidth cap of each connection, MB/s")
+    parser.add_argument('--error-rate', type=float, default=0.0,
+                        help="fraction of requests answered 503")
+    parser.add_argument('--drop-rate', type=float, default=0.0,
+                        help="fraction of requests whose connection is dropped")
+    parser.add_argument('--seed', type=int, default=None)
+    args = parser.parse_args()
+
+    _django.setup()
+    from django.conf import settings
+    from youtube.models import YTVideo
+
+    # chunks of a multiple of 256 KiB, see MediaUpload
+    settings.YOUTUBE_API_CONFIG['UPLOAD_CHUNK_SIZE'] = int(args.chunk_mb * 4) * MB // 4
+    video = YTVideo(title='benchmark', tags='benchmark')
+    size = int(args.size_mb * MB)
+    bandwidth = args.bandwidth_mb * MB if args.bandwidth_mb else None
+
+    print(f"{args.uploads} uploads of {args.size_mb} MB, concurrency {args.concurrency}, "
+          f"{args.latency * 1000:.0f} ms latency, error rate {args.error_rate}, "
+          f"drop rate {args.drop_rate}")
+    print(f"{'engine':>6} {'seconds':>8} {'uploads/s':>10} {'MB/s':>8} {'p50 s':>7} "
+          f"{'p99 s':>7} {'retries':>8} {'traced MB':>10} {'rss MB':>8}")
+    with tempfile.NamedTemporaryFile(suffix='.mp4') as media:
+        media.write(os.urandom(size))
+        media.flush()
+        for engine in args.engines:
+            with FakeYouTube(latency=args.latency, bandwidth=bandwidth,
+                             error_rate=args.error_rate, drop_rate=args.drop_rate,
+                             seed=args.seed) as server:
+                _django.use_fake_youtube(server)
+                tracemalloc.start()
+                started = time.perf_counter()
+                latencies, retries = ENGINES[engine](
+                    video, media.name, args.uploads, args.concurrency, server)
+                elapsed = time.perf_counter() - started
+                _, traced_peak = tracemalloc.get_traced_memory()
+                tracemalloc.stop()
+            # ru_maxrss is in KiB on Linux, the peak of the whole run so far
+            rss = resource.getrusage(resource.RUSAGE_SELF).ru_maxrss / 1024
+            print(f"{engine:>6} {elapsed:>8.2f} {args.uploads / elapsed:>10.2f} "
+                  f"{args.uploads * size / elapsed / MB:>8.2f} "
+                  f"{statistics.median(latencies):>7.2f} {percentile(latencies, 99):>7.2f} "
+                  f"{retries:>8} {traced_peak / MB:>10.1f} {rss:>8.1f}")
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,388 @@
+"""
+Local fake of the YouTube Data API for benchmarks and tests: the resumable
+upload protocol of videos.insert, videos.list (with ETags), videos.update,
+thumbnails.set, batch requests of videos.list and videos.update, and the
+uploads playlist of the channel (channels.list and playlistItems.list).
+
+    server = FakeYouTube(bandwidth=8 * 1024 * 1024)
+    server.start()
+    service = server.service()  # googleapiclient resource talking to server
+    ...
+    server.stop()
+
+`bandwidth` caps the bytes/sec of every connection, like a real uplink does,
+and `latency` is added to every response. Faults are injected at random:
+`error_rate` of the requests are answered 503 and `drop_rate` of them get
+the connection closed without a response. Uploaded videos are processed
+after `processing_time` seconds, see videos.list processingDetails.
+"""
+import email
+import hashlib
+import json
+import os
+import random
+import threading
+import time
+import uuid
+from http import HTTPStatus
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+from urllib.parse import parse_qs, urlparse
+
+from googleapiclient.discovery import build_from_document
+from googleapiclient.discovery_cache import get_static_doc
+from googleapiclient.http import HttpRequest, build_http
+
+READ_BLOCK = 64 * 1024
+
+# uploads playlist of the channel of the fake
+UPLOADS_PLAYLIST_ID = 'UUfakechannel'
+
+
+class _Server(ThreadingHTTPServer):
+    daemon_threads = True
+    # listen backlog, the default 5 resets connections of concurrent clients
+    request_queue_size = 1024
+
+
+class UploadSession:
+    def __init__(self, size, metadata):
+        self.size = size
+        self.metadata = metadata
+        self.received = 0
+        self.video = None
+
+
+class FakeYouTube:
+    """
+    Threaded HTTP server speaking the resumable upload protocol of videos.insert.
+    """
+
+    def __init__(self, host='127.0.0.1', port=0, latency=0.0, bandwidth=None,
+                 error_rate=0.0, drop_rate=0.0, processing_time=0.0, seed=None):
+        self.latency = latency
+        self.bandwidth = bandwidth
+        self.error_rate = error_rate
+        self.drop_rate = drop_rate
+        self.processing_time = processing_time
+        self.random = random.Random(seed)
+        self.sessions = {}
+        # video id -> (resource, uploaded at)
+        self.videos = {}
+        self.thumbnails = {}
+        self.lock = threading.Lock()
+        self.uploads = 0
+        self.bytes_received = 0
+        self.requests = 0
+        self.batches = 0
+        self.errors = 0
+        self.drops = 0
+        self.not_modified = 0
+        self._httpd = _Server((host, port), _Handler)
+        self._httpd.fake = self
+        self._thread = None
+
+    @property
+    def url(self):
+        host, port = self._httpd.server_address[:2]
+        return f"http://{host}:{port}/"
+
+    def start(self):
+        self._thread = threading.Thread(
+            target=self._httpd.serve_forever, name='fake-youtube', daemon=True)
+        self._thread.start()
+        return self
+
+    def stop(self):
+        self._httpd.shutdown()
+        self._httpd.server_close()
+
+    def __enter__(self):
+        return self.start()
+
+    def __exit__(self, *exc_info):
+        self.stop()
+
+    def discovery_document(self):
+        """Bundled youtube v3 discovery document pointing to this server."""
+        document = json.loads(get_static_doc('youtube', 'v3'))
+        document['rootUrl'] = self.url
+        document['baseUrl'] = self.url
+        return document
+
+    def service(self, http=None, request_builder=HttpRequest):
+        return build_from_document(
+            self.discovery_document(), http=http or build_http(),
+            requestBuilder=request_builder)
+
+
+class _Handler(BaseHTTPRequestHandler):
+    # keep-alive, like googleapis.com
+    protocol_version = 'HTTP/1.1'
+
+    @property
+    def fake(self):
+        return self.server.fake
+
+    def log_message(self, format, *args):
+        pass
+
+    def do_GET(self):
+        if self._fault():
+            return
+        url = urlparse(self.path)
+        if url.path.endswith('/videos'):
+            data = self._list_videos(url.query)
+        elif url.path.endswith('/channels'):
+            data = self._list_channels()
+        elif url.path.endswith('/playlistItems'):
+            data = self._list_playlist_items(url.query)
+        else:
+            return self._send_json(404, {'error': {'code': 404, 'message': 'not found'}})
+        with self.fake.lock:
+            self.fake.requests += 1
+        body = json.dumps(data).encode()
+        etag = hashlib.sha1(body).hexdigest()
+        self._delay()
+        if self.headers.get('If-None-Match') == etag:
+            with self.fake.lock:
+                self.fake.not_modified += 1
+            return self._send(304, headers={'ETag': etag})
+        self._send(200, body, {'Content-Type': 'application/json', 'ETag': etag})
+
+    def do_POST(self):
+        if self._fault():
+            return
+        url = urlparse(self.path)
+        query = parse_qs(url.query)
+        body = self.rfile.read(int(self.headers.get('Content-Length') or 0))
+        if url.path.split('/')[1] == 'batch':
+            return self._batch(body)
+        if url.path.endswith('/thumbnails/set'):
+            return self._set_thumbnail(query.get('videoId', [''])[0], body)
+        if query.get('uploadType') != ['resumable']:
+            return self._send_json(400, {'error': {'code': 400, 'message': 'resumable only'}})
+
+        session_id = uuid.uuid4().hex
+        size = self.headers.get('X-Upload-Content-Length')
+        metadata = json.loads(body or b'{}')
+        with self.fake.lock:
+            self.fake.requests += 1
+            self.fake.sessions[session_id] = UploadSession(
+                int(size) if size else None, metadata)
+        self._delay()
+        self._send(200, headers={'Location': f"{self.fake.url}upload/session/{session_id}"})
+
+    def do_PUT(self):
+        if self._fault():
+            return
+        url = urlparse(self.path)
+        if url.path.endswith('/videos'):
+            return self._update_video()
+        session_id = url.path.rsplit('/', 1)[-1]
+        session = self.fake.sessions.get(session_id)
+        length = int(self.headers.get('Content-Length') or 0)
+        if session is None:
+            self._drain(length)
+            return self._send_json(404, {'error': {'code': 404, 'message': 'no session'}})
+
+        content_range = self.headers.get('Content-Range', '')
+        # "bytes 0-99/1000", "bytes 0-99/*" or "bytes */1000"
+        spec, _, total = content_range.replace('bytes ', '').partition('/')
+        if total and total != '*':
+            session.size = int(total)
+        if spec != '*' and length:
+            start = int(spec.split('-')[0])
+            if start != session.received:
+                self._drain(length)
+                return self._send_incomplete(session)
+            self._receive(session, length)
+
+        with self.fake.lock:
+            self.fake.requests += 1
+        self._delay()
+        if session.size is not None and session.received >= session.size:
+            if session.video is None:
+                session.video = self._video(session)
+                with self.fake.lock:
+                    self.fake.uploads += 1
+                    self.fake.videos[session.video['id']] = (session.video, time.monotonic())
+            return self._send_json(200, session.video)
+        self._send_incomplete(session)
+
+    def _fault(self):
+        """
+        Inject a fault of the configured rates, return True when injected.
+        """
+        fake = self.fake
+        with fake.lock:
+            roll = fake.random.random()
+        if roll < fake.drop_rate:
+            with fake.lock:
+                fake.drops += 1
+            # no response, the client sees the connection reset
+            self.close_connection = True
+            return True
+        if roll < fake.drop_rate + fake.error_rate:
+            with fake.lock:
+                fake.errors += 1
+            self._drain(int(self.headers.get('Content-Length') or 0))
+            self._send_json(503, {'error': {'code': 503, 'message': 'backendError', 'errors': [
+                {'reason': 'backendError', 'message': 'injected fault'}]}})
+            return True
+        return False
+
+    def _processed(self, video, uploaded_at, now):
+        processed = now - uploaded_at >= self.fake.processing_time
+        return dict(
+            video,
+            status=dict(video['status'], uploadStatus='processed' if processed else 'uploaded'),
+            processingDetails={'processingStatus': 'succeeded' if processed else 'processing'},
+        )
+
+    def _list_videos(self, query):
+        ids = parse_qs(query).get('id', [''])[0].split(',')
+        now = time.monotonic()
+        with self.fake.lock:
+            items = [self._processed(*self.fake.videos[video_id], now)
+                     for video_id in ids if video_id in self.fake.videos]
+        return {'kind': 'youtube#videoListResponse', 'items': items}
+
+    def _list_channels(self):
+        return {'kind': 'youtube#channelListResponse', 'items': [{
+            'kind': 'youtube#channel', 'id': UPLOADS_PLAYLIST_ID[2:],
+            'contentDetails': {'relatedPlaylists': {'uploads': UPLOADS_PLAYLIST_ID}},
+        }]}
+
+    def _list_playlist_items(self, query):
+        """Uploaded videos in upload order, the page token is an offset."""
+        query = parse_qs(query)
+        if query.get('playlistId') != [UPLOADS_PLAYLIST_ID]:
+            return {'kind': 'youtube#playlistItemListResponse', 'items': []}
+        offset = int(query.get('pageToken', ['0'])[0])
+        size = int(query.get('maxResults', ['5'])[0])
+        with self.fake.lock:
+            ids = list(self.fake.videos)
+        page = {'kind': 'youtube#playlistItemListResponse', 'items': [
+            {'kind': 'youtube#playlistItem', 'contentDetails': {'videoId': video_id}}
+            for video_id in ids[offset:offset + size]]}
+        if offset + size < len(ids):
+            page['nextPageToken'] = str(offset + size)
+        return page
+
+    def _update_video(self):
+        resource = json.loads(self.rfile.read(int(self.headers.get('Content-Length') or 0)))
+        with self.fake.lock:
+            self.fake.requests += 1
+        self._delay()
+        self._send_json(*self._update(resource))
+
+    def _update(self, resource):
+        """return: status, updated video resource or error"""
+        with self.fake.lock:
+            stored = self.fake.videos.get(resource.get('id'))
+            if stored is None:
+                return 404, {'error': {'code': 404, 'message': 'videoNotFound'}}
+            video, uploaded_at = stored
+            video = dict(video, etag=uuid.uuid4().hex,
+                         snippet=resource.get('snippet', video['snippet']),
+                         status=dict(video['status'], **resource.get('status', {})))
+            self.fake.videos[video['id']] = (video, uploaded_at)
+        return 200, video
+
+    def _batch(self, body):
+        """
+        A multipart/mixed batch request: every part is a videos.list or
+        videos.update call, answered in a part of the same Content-ID.
+        """
+        message = email.message_from_bytes(
+            f"Content-Type: {self.headers['Content-Type']}\r\n\r\n".encode() + body)
+        boundary = uuid.uuid4().hex
+        parts = []
+        for part in message.get_payload():
+            request_line, _, call = part.get_payload().partition('\n')
+            method, target, _ = request_line.split(' ', 2)
+            url = urlparse(target)
+            if method == 'GET' and url.path.endswith('/videos'):
+                status, data = 200, self._list_videos(url.query)
+            elif method == 'PUT' and url.path.endswith('/videos'):
+                status, data = self._update(json.loads(email.message_from_string(call).get_payload()))
+            else:
+                status, data = 404, {'error': {'code': 404, 'message': 'not found'}}
+            content_id = part['Content-ID'][1:-1]
+            parts.append(
+                f"--{boundary}\r\nContent-Type: application/http\r\n"
+                f"Content-ID: <response-{content_id}>\r\n\r\n"
+                f"HTTP/1.1 {status} {HTTPStatus(status).phrase}\r\n"
+                f"Content-Type: application/json\r\n\r\n{json.dumps(data)}\r\n")
+        with self.fake.lock:
+            self.fake.requests += 1
+            self.fake.batches += 1
+        self._delay()
+        self._send(200, (''.join(parts) + f"--{boundary}--\r\n").encode(),
+                   {'Content-Type': f'multipart/mixed; boundary={boundary}'})
+
+    def _set_thumbnail(self, video_id, body):
+        with self.fake.lock:
+            self.fake.requests += 1
+            found = video_id in self.fake.videos
+            if found:
+                self.fake.thumbnails[video_id] = len(body)
+        self._delay()
+        if not found:
+            return self._send_json(404, {'error': {'code': 404, 'message': 'videoNotFound'}})
+        self._send_json(200, {'kind': 'youtube#thumbnailSetResponse', 'items': [
+            {'default': {'url': f"{self.fake.url}vi/{video_id}/default.jpg"}}]})
+
+    def _receive(self, session, length):
+        started = time.monotonic()
+        received = 0
+        while received < length:
+            block = self.rfile.read(min(READ_BLOCK, length - received))
+            if not block:
+                break
+            received += len(block)
+            if self.fake.bandwidth:
+                ahead = received / self.fake.bandwidth - (time.monotonic() - started)
+                if ahead > 0:
+                    time.sleep(ahead)
+        session.received += received
+        with self.fake.lock:
+            self.fake.bytes_received += received
+
+    def _drain(self, length):
+        while length > 0:
+            block = self.rfile.read(min(READ_BLOCK, length))
+            if not block:
+                break
+            length -= len(block)
+
+    def _delay(self):
+        if self.fake.latency:
+            time.sleep(self.fake.latency)
+
+    def _video(self, session):
+        video_id = os.urandom(8).hex()[:11]
+        return {
+            'kind': 'youtube#video',
+            'etag': uuid.uuid4().hex,
+            'id': video_id,
+            'snippet': session.metadata.get('snippet', {}),
+            'status': dict(session.metadata.get('status', {}), uploadStatus='uploaded'),
+        }
+
+    def _send_incomplete(self, session):
+        headers = {}
+        if session.received:
+            headers['Range'] = f"bytes=0-{session.received - 1}"
+        self._send(308, headers=headers)
+
+    def _send_json(self, status, data):
+        self._send(status, json.dumps(data).encode(), {'Content-Type': 'application/json'})
+
+    def _send(self, status, body=b'', headers=None):
+        self.send_response(status)
+        for name, value in (headers or {}).items():
+            self.send_header(name, value)
+        self.send_header('Content-Length', str(len(body)))
+        self.end_headers()
+        self.wfile.write(body)
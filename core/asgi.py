@@ -13,4 +13,26 @@ from django.core.asgi import get_asgi_application
 
 os.environ.setdefault('DJANGO_SETTINGS_MODULE', 'core.settings')
 
-application = get_asgi_application()
+django_application = get_asgi_application()
+
+# imported once the apps are loaded
+from youtube.events import (JOB_PROGRESS_EVENTS_RE, VIDEO_EVENTS_RE,  # noqa: E402
+                            job_progress_events, video_events)
+
+EVENT_STREAMS = [
+    (VIDEO_EVENTS_RE, video_events),
+    (JOB_PROGRESS_EVENTS_RE, job_progress_events),
+]
+
+
+async def application(scope, receive, send):
+    """
+    Django, except the long-lived event streams of youtube.events which are
+    served without holding a Django request.
+    """
+    if scope['type'] == 'http':
+        for pattern, stream in EVENT_STREAMS:
+            match = pattern.match(scope['path'])
+            if match:
+                return await stream(scope, receive, send, int(match['pk']))
+    return await django_application(scope, receive, send)
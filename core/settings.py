@@ -94,6 +94,19 @@ DATABASES = {
     )
 }
 
+# Cache
+# The upload progress store needs a cache shared by web and worker processes,
+# i.e. django.core.cache.backends.db.DatabaseCache (LOCATION a table made by
+# `manage.py createcachetable`) or django.core.cache.backends.memcached.MemcachedCache
+# (python-memcached). The default is per process: progress of the upload workers
+# isn't seen by the web server, `manage.py check` warns about it (youtube.W001).
+CACHES = {
+    'default': {
+        'BACKEND': config('CACHE_BACKEND', default='django.core.cache.backends.locmem.LocMemCache'),
+        'LOCATION': config('CACHE_LOCATION', default=''),
+    }
+}
+
 
 # Password validation
 # https://docs.djangoproject.com/en/3.1/ref/settings/#auth-password-validators
@@ -136,6 +149,12 @@ STATIC_URL = '/static/'
 MEDIA_URL = '/media/'
 MEDIA_ROOT = BASE_DIR / 'media_root'
 
+# Uploaded files larger than this are written to a temporary file instead of
+# memory (the upload view always streams to the spool, see UPLOAD_SPOOL_DIR);
+# form fields other than files are refused above DATA_UPLOAD_MAX_MEMORY_SIZE.
+FILE_UPLOAD_MAX_MEMORY_SIZE = config('FILE_UPLOAD_MAX_MEMORY_SIZE', default=1024 * 1024, cast=int)
+DATA_UPLOAD_MAX_MEMORY_SIZE = config('DATA_UPLOAD_MAX_MEMORY_SIZE', default=1024 * 1024, cast=int)
+
 
 CRISPY_TEMPLATE_PACK = 'bootstrap4'
 
@@ -146,4 +165,77 @@ YOUTUBE_API_CONFIG = {
     'API_VERSION': config('YOUTUBE_API_CONFIG_API_VERSION', default='v3'),
     'SCOPES': config('YOUTUBE_API_CONFIG_SCOPES', cast=Csv(cast=str, post_process=list), default=['https://www.googleapis.com/auth/youtube.upload']),
     'CLIENT_ID': config('YOUTUBE_API_CONFIG_CLIENT_ID', default=None),
+    # bytes per resumable upload request (multiple of 256 KiB, -1 whole file)
+    'UPLOAD_CHUNK_SIZE': config('YOUTUBE_API_CONFIG_UPLOAD_CHUNK_SIZE', default=8 * 1024 * 1024, cast=int),
+    # size chunks from measured throughput and errors, starting at UPLOAD_CHUNK_SIZE
+    'UPLOAD_CHUNK_ADAPTIVE': config('YOUTUBE_API_CONFIG_UPLOAD_CHUNK_ADAPTIVE', default=False, cast=bool),
+    'UPLOAD_CHUNK_TARGET_SECONDS': config('YOUTUBE_API_CONFIG_UPLOAD_CHUNK_TARGET_SECONDS', default=10.0, cast=float),
+    # read uploaded files through an mmap (mmap) or a stream (file)
+    'UPLOAD_MEDIA_SOURCE': config('YOUTUBE_API_CONFIG_UPLOAD_MEDIA_SOURCE', default='mmap'),
+    # spool directory of uploaded videos, keep it on the file system of MEDIA_ROOT
+    'UPLOAD_SPOOL_DIR': config('YOUTUBE_API_CONFIG_UPLOAD_SPOOL_DIR', default=None),
+    # uploads larger than UPLOAD_MAX_SIZE bytes are refused (0 no limit), as are
+    # videos of other content types than UPLOAD_CONTENT_TYPES (patterns)
+    'UPLOAD_MAX_SIZE': config('YOUTUBE_API_CONFIG_UPLOAD_MAX_SIZE', default=256 * 1024 ** 3, cast=int),
+    'UPLOAD_CONTENT_TYPES': config('YOUTUBE_API_CONFIG_UPLOAD_CONTENT_TYPES', cast=Csv(cast=str, post_process=list), default='video/*,application/octet-stream'),
+    # an upload is admitted when it leaves UPLOAD_SPOOL_MIN_FREE bytes free on the spool
+    # file system and the spool files stay below UPLOAD_SPOOL_CAPACITY bytes (0 no limit),
+    # it waits up to UPLOAD_ADMISSION_WAIT seconds for room before it's refused
+    'UPLOAD_SPOOL_MIN_FREE': config('YOUTUBE_API_CONFIG_UPLOAD_SPOOL_MIN_FREE', default=1024 ** 3, cast=int),
+    'UPLOAD_SPOOL_CAPACITY': config('YOUTUBE_API_CONFIG_UPLOAD_SPOOL_CAPACITY', default=0, cast=int),
+    'UPLOAD_ADMISSION_WAIT': config('YOUTUBE_API_CONFIG_UPLOAD_ADMISSION_WAIT', default=10.0, cast=float),
+    # seconds after queueing an upload when retrying it is given up
+    'UPLOAD_RETRY_DEADLINE': config('YOUTUBE_API_CONFIG_UPLOAD_RETRY_DEADLINE', default=24 * 60 * 60, cast=float),
+    # quota units per day shared by all processes (0 no limit), see QuotaBucket
+    'QUOTA_DAILY_LIMIT': config('YOUTUBE_API_CONFIG_QUOTA_DAILY_LIMIT', default=10000, cast=int),
+    # API requests per second with bursts of QUOTA_BURST (0 no rate limit)
+    'QUOTA_REQUESTS_PER_SECOND': config('YOUTUBE_API_CONFIG_QUOTA_REQUESTS_PER_SECOND', default=0, cast=float),
+    'QUOTA_BURST': config('YOUTUBE_API_CONFIG_QUOTA_BURST', default=10, cast=int),
+    # seconds a call waits for the rate limit before it's deferred
+    'QUOTA_MAX_WAIT': config('YOUTUBE_API_CONFIG_QUOTA_MAX_WAIT', default=1.0, cast=float),
+    # ETag cache of GET responses: memory, django (CACHES alias RESPONSE_CACHE_ALIAS), file or empty
+    'RESPONSE_CACHE': config('YOUTUBE_API_CONFIG_RESPONSE_CACHE', default='memory'),
+    'RESPONSE_CACHE_MAX_BYTES': config('YOUTUBE_API_CONFIG_RESPONSE_CACHE_MAX_BYTES', default=32 * 1024 * 1024, cast=int),
+    'RESPONSE_CACHE_DIR': config('YOUTUBE_API_CONFIG_RESPONSE_CACHE_DIR', default=None),
+    'RESPONSE_CACHE_ALIAS': config('YOUTUBE_API_CONFIG_RESPONSE_CACHE_ALIAS', default='default'),
+    # processing status checks: first after PROCESSING_POLL_INITIAL seconds, then
+    # PROCESSING_POLL_FACTOR times longer every time, up to PROCESSING_POLL_MAX seconds
+    'PROCESSING_POLL_INITIAL': config('YOUTUBE_API_CONFIG_PROCESSING_POLL_INITIAL', default=10.0, cast=float),
+    'PROCESSING_POLL_FACTOR': config('YOUTUBE_API_CONFIG_PROCESSING_POLL_FACTOR', default=1.5, cast=float),
+    'PROCESSING_POLL_MAX': config('YOUTUBE_API_CONFIG_PROCESSING_POLL_MAX', default=600.0, cast=float),
+    # upload progress is published to the PROGRESS_CACHE_ALIAS cache at most every
+    # PROGRESS_INTERVAL seconds, saved to the database at most every PROGRESS_PERSIST_INTERVAL
+    'PROGRESS_CACHE_ALIAS': config('YOUTUBE_API_CONFIG_PROGRESS_CACHE_ALIAS', default='default'),
+    'PROGRESS_INTERVAL': config('YOUTUBE_API_CONFIG_PROGRESS_INTERVAL', default=1.0, cast=float),
+    'PROGRESS_PERSIST_INTERVAL': config('YOUTUBE_API_CONFIG_PROGRESS_PERSIST_INTERVAL', default=30.0, cast=float),
+    # scheduled private videos are made public by `manage.py publish_scheduler`
+    # instead of sending publishAt to YouTube
+    'PUBLISH_SCHEDULER': config('YOUTUBE_API_CONFIG_PUBLISH_SCHEDULER', default=False, cast=bool),
+    # processes preparing thumbnails (0 number of CPUs) and their output cache directory
+    'THUMBNAIL_WORKERS': config('YOUTUBE_API_CONFIG_THUMBNAIL_WORKERS', default=0, cast=int),
+    'THUMBNAIL_CACHE_DIR': config('YOUTUBE_API_CONFIG_THUMBNAIL_CACHE_DIR', default=None),
+    # remux videos to faststart MP4s (a stream copy) or transcode them above TRANSCODE_MAX_BITRATE
+    # bits/s (0 only remux) with ffmpeg before the upload, in TRANSCODE_WORKERS processes (0 from
+    # the number of CPUs and TRANSCODE_THREADS, the threads of one ffmpeg with 0 all CPUs)
+    'TRANSCODE': config('YOUTUBE_API_CONFIG_TRANSCODE', default=False, cast=bool),
+    'TRANSCODE_MAX_BITRATE': config('YOUTUBE_API_CONFIG_TRANSCODE_MAX_BITRATE', default=0, cast=int),
+    'TRANSCODE_CRF': config('YOUTUBE_API_CONFIG_TRANSCODE_CRF', default=20, cast=int),
+    'TRANSCODE_PRESET': config('YOUTUBE_API_CONFIG_TRANSCODE_PRESET', default='medium'),
+    'TRANSCODE_WORKERS': config('YOUTUBE_API_CONFIG_TRANSCODE_WORKERS', default=0, cast=int),
+    'TRANSCODE_THREADS': config('YOUTUBE_API_CONFIG_TRANSCODE_THREADS', default=0, cast=int),
+    'TRANSCODE_DIR': config('YOUTUBE_API_CONFIG_TRANSCODE_DIR', default=None),
+    'FFMPEG': config('YOUTUBE_API_CONFIG_FFMPEG', default='ffmpeg'),
+    'FFPROBE': config('YOUTUBE_API_CONFIG_FFPROBE', default='ffprobe'),
+    # Fernet keys encrypting the credentials of channels (YTChannel), the first one
+    # encrypts and all decrypt; derived from SECRET_KEY when empty
+    'TOKEN_KEYS': config('YOUTUBE_API_CONFIG_TOKEN_KEYS', cast=Csv(cast=str, post_process=list), default=''),
+    # seconds before expiry the credentials of channels are refreshed in background
+    'CREDENTIAL_REFRESH_AHEAD': config('YOUTUBE_API_CONFIG_CREDENTIAL_REFRESH_AHEAD', default=600, cast=float),
+    # per-stage timings and counters of the upload pipeline served on /metrics,
+    # METRICS_LOG logs every stage to the `youtube.metrics` logger as well
+    'METRICS': config('YOUTUBE_API_CONFIG_METRICS', default=False, cast=bool),
+    'METRICS_LOG': config('YOUTUBE_API_CONFIG_METRICS_LOG', default=False, cast=bool),
+    # bearer token of the scraper of /metrics and upload_worker --metrics-port,
+    # without it /metrics is served to staff users only
+    'METRICS_TOKEN': config('YOUTUBE_API_CONFIG_METRICS_TOKEN', default=''),
 }
\ No newline at end of file
@@ -6,7 +6,10 @@ The `urlpatterns` list routes URLs to views. For more information please see:
 from django.contrib import admin
 from django.urls import include, path
 
+from youtube.views import prometheus_metrics
+
 urlpatterns = [
     path('admin/', admin.site.urls),
     path('youtube/', include('youtube.urls', namespace='youtube')),
+    path('metrics', prometheus_metrics, name='metrics'),
 ]
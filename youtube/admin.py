@@ -1,5 +1,71 @@
-from django.contrib import admin
+from django.contrib import admin, messages
 
-from .models import YTVideo
+from .models import BulkImport, QuotaBucket, QuotaUsage, UploadJob, YTChannel, YTVideo
+from .utils.pagination import EstimatedCountPaginator
 
-admin.site.register(YTVideo)
+
+@admin.register(YTVideo)
+class YTVideoAdmin(admin.ModelAdmin):
+    actions = ['push_to_youtube', 'pull_from_youtube']
+    list_display = ['id', 'title', 'user', 'privacy_status', 'publish_at', 'upload_status',
+                    'video_id', 'created']
+    # filters without a SELECT DISTINCT over the table
+    list_filter = ['privacy_status', 'transcode_action', ('publish_at', admin.DateFieldListFilter)]
+    list_select_related = ['user']
+    raw_id_fields = ['user', 'channel', 'duplicate_of', 'bulk_import']
+    ordering = ['-created']
+    # counting large tables is estimated, the unfiltered total isn't shown
+    paginator = EstimatedCountPaginator
+    show_full_result_count = False
+    # set from `tags` on save
+    exclude = ['tag_set']
+    search_fields = ['title']
+
+    def get_search_results(self, request, queryset, search_term):
+        # the full-text index instead of icontains scans of search_fields
+        return queryset.search(search_term), False
+
+    def push_to_youtube(self, request, queryset):
+        updated, errors = queryset.push_to_youtube()
+        self.message_user(request, f"{updated} videos updated on YouTube")
+        for pk, error in errors.items():
+            self.message_user(request, f"YTVideo {pk}: {error}", messages.ERROR)
+    push_to_youtube.short_description = "Update selected videos on YouTube"
+
+    def pull_from_youtube(self, request, queryset):
+        updated, errors = queryset.pull_from_youtube()
+        self.message_user(request, f"{updated} videos updated from YouTube")
+        for error in errors:
+            self.message_user(request, str(error), messages.ERROR)
+    pull_from_youtube.short_description = "Update selected videos from YouTube"
+
+
+@admin.register(YTChannel)
+class YTChannelAdmin(admin.ModelAdmin):
+    list_display = ['id', 'channel_id', 'title', 'user', 'token_expiry']
+    raw_id_fields = ['user']
+    readonly_fields = ['token_expiry']
+
+
+@admin.register(BulkImport)
+class BulkImportAdmin(admin.ModelAdmin):
+    list_display = ['id', 'manifest', 'user', 'channel', 'rows_done', 'rows', 'created', 'finished_at']
+    raw_id_fields = ['user']
+
+
+@admin.register(UploadJob)
+class UploadJobAdmin(admin.ModelAdmin):
+    list_display = ['id', 'video', 'status', 'attempts', 'worker_id', 'created', 'finished_at']
+    list_filter = ['status']
+    raw_id_fields = ['video']
+
+
+@admin.register(QuotaBucket)
+class QuotaBucketAdmin(admin.ModelAdmin):
+    list_display = ['key', 'day', 'used', 'tokens', 'refilled_at']
+
+
+@admin.register(QuotaUsage)
+class QuotaUsageAdmin(admin.ModelAdmin):
+    list_display = ['day', 'method', 'calls', 'units', 'key']
+    list_filter = ['day', 'method']
@@ -1,5 +1,49 @@
 from django.apps import AppConfig
+from django.core import checks
+from django.db.models.signals import post_migrate
+
+# cache backends which aren't shared by the processes of a host
+PROCESS_LOCAL_CACHES = {
+    'django.core.cache.backends.locmem.LocMemCache',
+    'django.core.cache.backends.dummy.DummyCache',
+}
+
+
+def install_search_index(using, **kwargs):
+    """
+    Put back the full-text search triggers of SQLite, they are dropped when
+    a migration remakes the youtube_ytvideo table.
+    """
+    from django.db import connections
+
+    from .utils.search import install_search
+    install_search(connections[using])
+
+
+def check_progress_cache(app_configs, **kwargs):
+    """
+    Warn when the progress store is local to a process: the progress
+    published by the upload workers is never seen by the web processes.
+    """
+    from django.conf import settings
+
+    alias = settings.YOUTUBE_API_CONFIG.get('PROGRESS_CACHE_ALIAS', 'default')
+    backend = settings.CACHES.get(alias, {}).get('BACKEND')
+    if backend in PROCESS_LOCAL_CACHES:
+        return [checks.Warning(
+            f"The upload progress cache '{alias}' ({backend}) is local to every process, "
+            "progress of the upload workers is not seen by the web server.",
+            hint="Set CACHE_BACKEND to a shared cache, i.e. "
+                 "django.core.cache.backends.db.DatabaseCache (run `manage.py createcachetable`) "
+                 "or django.core.cache.backends.memcached.MemcachedCache.",
+            id='youtube.W001',
+        )]
+    return []
 
 
 class YoutubeConfig(AppConfig):
     name = 'youtube'
+
+    def ready(self):
+        post_migrate.connect(install_search_index, sender=self)
+        checks.register(check_progress_cache, checks.Tags.caches)
@@ -0,0 +1,164 @@
+"""
+Server-sent event streams served by core.asgi:
+
+    GET /youtube/aio/videos/<pk>/events/            processing status of a video
+    GET /youtube/aio/jobs/<pk>/progress/events/     progress of an upload job
+
+An event `status` is sent whenever the state changes and the stream ends when
+the video is processed / the job finished, so a client opens one connection
+instead of polling the web tier. The states are written by other processes
+(`manage.py track_processing`, the upload workers), so a stream looks at them
+once per interval: one primary key query for a video, one cache read for the
+progress of a job.
+"""
+import asyncio
+import io
+import json
+import re
+
+from asgiref.sync import sync_to_async
+from django.conf import settings
+from django.contrib.auth import get_user
+from django.core.exceptions import DisallowedHost
+from django.core.handlers.asgi import ASGIRequest
+from django.utils.module_loading import import_string
+
+from .models import UploadJob, YTVideo
+from .utils.progress import ProgressStore
+
+VIDEO_EVENTS_RE = re.compile(r'^/youtube/aio/videos/(?P<pk>\d+)/events/$')
+JOB_PROGRESS_EVENTS_RE = re.compile(r'^/youtube/aio/jobs/(?P<pk>\d+)/progress/events/$')
+
+# job statuses ending a progress stream
+JOB_DONE_STATUSES = {UploadJob.Status.SUCCEEDED, UploadJob.Status.FAILED}
+
+# seconds between two looks at the state and between two keep-alive comments
+EVENTS_INTERVAL = 2.0
+KEEPALIVE_INTERVAL = 15.0
+
+
+def video_status(video):
+    return {
+        'id': video.id,
+        'video_id': video.video_id,
+        'youtube_url': video.youtube_url,
+        'upload_status': video.upload_status,
+        'processing_status': video.processing_status,
+        'done': video.processing_done,
+    }
+
+
+@sync_to_async
+def _session_user_id(scope):
+    """
+    Id of the user of the session of the request `scope`, None when it's
+    anonymous. The streams bypass the middleware, so the Host header is
+    checked against ALLOWED_HOSTS here and the user is loaded as
+    AuthenticationMiddleware does: get_user() verifies the session hash
+    and the authentication backend refuses inactive users.
+
+    Raises:
+        DisallowedHost: on a Host not in ALLOWED_HOSTS
+    """
+    request = ASGIRequest(scope, io.BytesIO())
+    request.get_host()
+    session_key = request.COOKIES.get(settings.SESSION_COOKIE_NAME)
+    if not session_key:
+        return None
+    request.session = import_string(f'{settings.SESSION_ENGINE}.SessionStore')(session_key)
+    user = get_user(request)
+    return user.pk if user.is_authenticated else None
+
+
+@sync_to_async
+def _video_status(pk, user_id):
+    video = YTVideo.objects.filter(pk=pk, user_id=user_id).first()
+    return None if video is None else video_status(video)
+
+
+@sync_to_async
+def _job_progress(pk, user_id):
+    state = ProgressStore().get(pk)
+    if state is None or state['user_id'] != user_id:
+        job = UploadJob.objects.filter(
+            pk=pk, video__user_id=user_id).select_related('video').first()
+        state = None if job is None else job.progress()
+    if state is not None:
+        state['done'] = state['status'] in JOB_DONE_STATUSES
+    return state
+
+
+async def _respond(send, status, body):
+    await send({'type': 'http.response.start', 'status': status,
+                'headers': [(b'content-type', b'application/json')]})
+    await send({'type': 'http.response.body', 'body': json.dumps(body).encode()})
+
+
+async def video_events(scope, receive, send, pk):
+    """
+    ASGI app of the processing status stream of video `pk`.
+    """
+    await _event_stream(scope, receive, send, lambda user_id: _video_status(pk, user_id))
+
+
+async def job_progress_events(scope, receive, send, pk):
+    """
+    ASGI app of the progress stream of upload job `pk`.
+    """
+    await _event_stream(scope, receive, send, lambda user_id: _job_progress(pk, user_id))
+
+
+async def _event_stream(scope, receive, send, get_state):
+    """
+    Stream the state returned by `get_state(user_id)` until its `done`.
+    """
+    if scope['method'] != 'GET':
+        return await _respond(send, 405, {'error': "Method not allowed."})
+    try:
+        user_id = await _session_user_id(scope)
+    except DisallowedHost:
+        return await _respond(send, 400, {'error': "Bad request."})
+    if user_id is None:
+        return await _respond(send, 401, {'error': "Authentication is required."})
+    status = await get_state(user_id)
+    if status is None:
+        return await _respond(send, 404, {'error': "Not found."})
+
+    disconnected = asyncio.Event()
+
+    async def watch_disconnect():
+        while (await receive())['type'] != 'http.disconnect':
+            pass
+        disconnected.set()
+
+    watcher = asyncio.ensure_future(watch_disconnect())
+    await send({'type': 'http.response.start', 'status': 200, 'headers': [
+        (b'content-type', b'text/event-stream'),
+        (b'cache-control', b'no-cache'),
+        # no buffering by nginx
+        (b'x-accel-buffering', b'no'),
+    ]})
+    try:
+        last, idle = None, 0.0
+        while status is not None:
+            if status != last:
+                data = json.dumps(status)
+                await send({'type': 'http.response.body',
+                            'body': f'event: status\ndata: {data}\n\n'.encode(),
+                            'more_body': True})
+                last, idle = status, 0.0
+                if status['done']:
+                    break
+            elif idle >= KEEPALIVE_INTERVAL:
+                await send({'type': 'http.response.body', 'body': b': keep-alive\n\n',
+                            'more_body': True})
+                idle = 0.0
+            try:
+                await asyncio.wait_for(disconnected.wait(), EVENTS_INTERVAL)
+                return
+            except asyncio.TimeoutError:
+                idle += EVENTS_INTERVAL
+            status = await get_state(user_id)
+        await send({'type': 'http.response.body', 'body': b''})
+    finally:
+        watcher.cancel()
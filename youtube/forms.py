@@ -2,12 +2,37 @@ from django.forms import ModelForm
 
 from .models import YTVideo
 
+# YTVideo fields set from YouTube, never by the uploader
+YOUTUBE_FIELDS = ['video_id', 'youtube_url', 'upload_status', 'processing_status',
+                  'processing_checks', 'processing_check_at', 'thumbnail_set_at',
+                  'content_hash', 'duplicate_of', 'published_at', 'publish_error',
+                  'transcode_action', 'original_bytes', 'uploaded_bytes', 'probe_seconds',
+                  'transcode_seconds']
+
 
 class YTVideoForm(ModelForm):
     class Meta:
         model = YTVideo
         # fields = '__all__'
-        exclude = ['user', 'video_id', 'youtube_url']
+        exclude = ['user', 'channel', 'bulk_import', 'import_line', 'tag_set'] + YOUTUBE_FIELDS
 
     def save(self, commit=True):
-        return super().save(commit=commit)
+        video = super().save(commit=False)
+        # hashed while the file was received, see SpoolFileUploadHandler
+        content_hash = getattr(self.cleaned_data.get('file_on_server'), 'content_hash', '')
+        if content_hash:
+            video.content_hash = content_hash
+        if commit:
+            video.save()
+        return video
+
+
+class YTVideoStreamForm(ModelForm):
+    """
+    Video metadata of a streamed upload, the file is sent chunk by chunk
+    afterwards.
+    """
+    class Meta:
+        model = YTVideo
+        exclude = ['user', 'channel', 'bulk_import', 'import_line', 'tag_set', 'file_on_server',
+                   'thumbnail'] + YOUTUBE_FIELDS
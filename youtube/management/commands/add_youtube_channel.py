@@ -0,0 +1,65 @@
+import pickle
+
+from django.conf import settings
+from django.contrib.auth import get_user_model
+from django.core.management.base import BaseCommand, CommandError
+from google_auth_oauthlib.flow import InstalledAppFlow
+from googleapiclient.errors import HttpError
+
+from youtube.models import YTChannel
+from youtube.utils.api import YTApi, thread_http
+
+
+class Command(BaseCommand):
+    help = (
+        "Authorize a YouTube channel for a user and store its credentials "
+        "encrypted in the database (YTChannel)."
+    )
+
+    def add_arguments(self, parser):
+        parser.add_argument('username', help="Owner of the channel.")
+        parser.add_argument(
+            '--token-file', default=None,
+            help="Import the credentials of a pickle token file (i.e. of .yt_secrets) "
+                 "instead of authorizing in the browser.")
+        parser.add_argument(
+            '--channel-id', default=None,
+            help="YouTube channel id, looked up with channels.list when missing "
+                 "(needs the youtube.readonly or youtube scope).")
+
+    def handle(self, *args, **options):
+        User = get_user_model()
+        try:
+            user = User.objects.get(**{User.USERNAME_FIELD: options['username']})
+        except User.DoesNotExist:
+            raise CommandError(f"No user {options['username']}")
+
+        if options['token_file']:
+            with open(options['token_file'], 'rb') as token:
+                cred = pickle.load(token)
+        else:
+            flow = InstalledAppFlow.from_client_secrets_file(
+                settings.BASE_DIR / '.yt_secrets' / settings.YOUTUBE_API_CONFIG['CLIENT_SECRET_FILE'],
+                settings.YOUTUBE_API_CONFIG['SCOPES'])
+            cred = flow.run_local_server()
+
+        channel_id, title = options['channel_id'], ''
+        if not channel_id:
+            try:
+                response = YTApi.request_service.channels().list(
+                    part='snippet', mine=True, fields='items(id,snippet/title)',
+                ).execute(http=thread_http(cred))
+            except HttpError as error:
+                raise CommandError(
+                    f"The channel can't be looked up, pass --channel-id: {error}")
+            if not response.get('items'):
+                raise CommandError("The authorized account has no YouTube channel")
+            channel_id = response['items'][0]['id']
+            title = response['items'][0]['snippet']['title']
+
+        channel = YTChannel.objects.filter(channel_id=channel_id).first() or \
+            YTChannel(channel_id=channel_id)
+        channel.user = user
+        channel.title = title or channel.title
+        channel.store_credentials(cred)
+        self.stdout.write(self.style.SUCCESS(f"Stored the credentials of channel {channel}."))
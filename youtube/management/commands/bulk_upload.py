@@ -0,0 +1,183 @@
+import os
+
+from django.contrib.auth import get_user_model
+from django.core.management.base import BaseCommand, CommandError
+from django.utils.dateparse import parse_datetime
+from django.utils.timezone import is_naive, make_aware, now, timedelta
+
+from youtube.models import BulkImport, YTChannel, YTVideo
+from youtube.utils.batch import chunked
+from youtube.utils.manifest import ManifestError, manifest_hash, read_manifest
+from youtube.utils.quota import QuotaConfig, next_quota_reset, quota_cost
+
+# invalid rows reported before the validation gives up listing them
+MAX_REPORTED_ERRORS = 100
+
+
+class Command(BaseCommand):
+    help = (
+        "Queue the uploads of the videos of a CSV, JSON Lines or JSON manifest. "
+        "Columns: file (required), title (required), description, tags, category_id, "
+        "privacy_status, publish_at, embeddable, made_for_kids, notify_subscribers, "
+        "thumbnail. Private videos without publish_at are scheduled in spread slots. "
+        "Run it again with the same manifest to resume an interrupted import."
+    )
+
+    def add_arguments(self, parser):
+        parser.add_argument('manifest', help="Manifest of the videos, paths are relative to it.")
+        parser.add_argument('username', help="Owner of the videos.")
+        parser.add_argument(
+            '--format', choices=['csv', 'jsonl', 'json'], default=None,
+            help="Format of the manifest, default: from its extension.")
+        parser.add_argument(
+            '--channel', default=None,
+            help="YouTube channel id of a YTChannel of the user, default: the user's first "
+                 "channel or the channel of YOUTUBE_API_CONFIG.")
+        parser.add_argument(
+            '--start', default=None,
+            help="publish_at of the first spread video (ISO 8601), "
+                 "default: the next quota reset.")
+        parser.add_argument(
+            '--per-day', type=int, default=None,
+            help="Spread videos published per day, default: the uploads allowed by "
+                 "YOUTUBE_API_CONFIG_QUOTA_DAILY_LIMIT, so a video is published after its upload.")
+        parser.add_argument(
+            '--interval', type=float, default=None,
+            help="Minutes between spread videos, overrides --per-day.")
+        parser.add_argument(
+            '--batch-size', type=int, default=500,
+            help="Videos created per transaction, an interrupted import resumes after the last one.")
+        parser.add_argument(
+            '--workers', type=int, default=4,
+            help="Threads linking, copying and hashing the files of a batch.")
+        parser.add_argument(
+            '--dry-run', action='store_true',
+            help="Validate the manifest without importing it.")
+
+    def handle(self, *args, **options):
+        User = get_user_model()
+        try:
+            user = User.objects.get(**{User.USERNAME_FIELD: options['username']})
+        except User.DoesNotExist:
+            raise CommandError(f"No user {options['username']}")
+        if options['channel']:
+            try:
+                channel = YTChannel.objects.get(channel_id=options['channel'], user=user)
+            except YTChannel.DoesNotExist:
+                raise CommandError(f"No YTChannel {options['channel']} of {user}")
+        else:
+            channel = YTChannel.objects.default_for(user)
+
+        path = os.path.abspath(options['manifest'])
+        try:
+            digest = manifest_hash(path)
+        except OSError as error:
+            raise CommandError(f"Can't read the manifest: {error}")
+        bulk_import = BulkImport.objects.filter(user=user, manifest_hash=digest).first()
+        if bulk_import is not None and bulk_import.finished_at is not None:
+            raise CommandError(
+                f"The manifest was imported by BulkImport {bulk_import.pk} at {bulk_import.finished_at}")
+
+        rows = self.validate(path, options['format'], bulk_import.rows_done if bulk_import else 0)
+        self.stdout.write(f"{path}: {rows} valid videos.")
+        if options['dry_run']:
+            self.stdout.write("Dry run, nothing was imported.")
+            return
+        if not rows:
+            return
+
+        if bulk_import is None:
+            bulk_import = BulkImport.objects.create(
+                user=user, channel=channel, manifest=path, manifest_hash=digest, rows=rows,
+                publish_start=self.publish_start(options['start']),
+                publish_interval=self.publish_interval(options['per_day'], options['interval']))
+        else:
+            self.stdout.write(
+                f"Resuming BulkImport {bulk_import.pk} after {bulk_import.rows_done} videos.")
+
+        imported = 0
+        try:
+            for batch in chunked(self.pending_rows(bulk_import, options['format']),
+                                 options['batch_size']):
+                imported += bulk_import.import_batch(batch, workers=options['workers'])
+                self.stdout.write(f"Imported {bulk_import.rows_done}/{bulk_import.rows} videos.")
+        except (Exception, ManifestError) as error:
+            raise CommandError(
+                f"Import stopped after {bulk_import.rows_done} videos, run the command "
+                f"again to resume: {error}")
+
+        bulk_import.finished_at = now()
+        bulk_import.save(update_fields=['finished_at', 'modified'])
+        spread = bulk_import.videos.filter(
+            privacy_status=YTVideo.PrivacyStatus.PRIVATE).order_by('publish_at')
+        first, last = spread.first(), spread.last()
+        self.stdout.write(self.style.SUCCESS(
+            f"Queued {imported} uploads of BulkImport {bulk_import.pk}, run `manage.py upload_worker`."))
+        if first is not None:
+            self.stdout.write(f"Private videos are published from {first.publish_at} to {last.publish_at}.")
+
+    def validate(self, path, format, rows_done=0):
+        """
+        Validate every row of the manifest in one streaming pass, the first
+        `rows_done` ones were imported by an interrupted run.
+
+        return: number of videos
+        Raises:
+            CommandError: when a row is invalid, no video is imported
+        """
+        base_dir = os.path.dirname(path)
+        rows = errors = 0
+        try:
+            for index, (line, row) in enumerate(read_manifest(path, format)):
+                try:
+                    BulkImport.clean_row(row, line, base_dir, imported=index < rows_done)
+                    rows += 1
+                except ManifestError as error:
+                    errors += 1
+                    if errors <= MAX_REPORTED_ERRORS:
+                        self.stderr.write(str(error))
+        except (OSError, ManifestError) as error:
+            raise CommandError(f"Can't read the manifest: {error}")
+        if errors:
+            raise CommandError(f"{errors} invalid rows, nothing was imported.")
+        return rows
+
+    def pending_rows(self, bulk_import, format):
+        """
+        Cleaned rows (line, values) of the manifest not imported yet, with
+        the publish_at slots of private videos without one.
+        """
+        base_dir = os.path.dirname(bulk_import.manifest)
+        slot = 0
+        for index, (line, row) in enumerate(read_manifest(bulk_import.manifest, format)):
+            imported = index < bulk_import.rows_done
+            values = BulkImport.clean_row(row, line, base_dir, imported=imported)
+            if 'publish_at' not in values and \
+                    values['privacy_status'] == YTVideo.PrivacyStatus.PRIVATE:
+                # slots are counted over all rows so a resumed import gets the same ones
+                values['publish_at'] = bulk_import.publish_at(slot)
+                slot += 1
+            if not imported:
+                yield line, values
+
+    def publish_start(self, start):
+        if start is None:
+            return next_quota_reset()
+        publish_start = parse_datetime(start)
+        if publish_start is None:
+            raise CommandError(f"Invalid --start {start}")
+        if is_naive(publish_start):
+            publish_start = make_aware(publish_start)
+        return publish_start
+
+    def publish_interval(self, per_day, interval):
+        if interval is not None:
+            if interval <= 0:
+                raise CommandError("--interval must be positive")
+            return timedelta(minutes=interval)
+        if per_day is None:
+            daily_limit = QuotaConfig.from_settings().daily_limit
+            per_day = max(1, daily_limit // quota_cost('youtube.videos.insert')) if daily_limit else 24
+        if per_day <= 0:
+            raise CommandError("--per-day must be positive")
+        return timedelta(days=1) / per_day
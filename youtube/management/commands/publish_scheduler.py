@@ -0,0 +1,80 @@
+import datetime
+
+from django.conf import settings
+from django.core.management.base import BaseCommand, CommandError
+
+from django.utils.timezone import now
+
+from youtube.models import YTVideo
+from youtube.utils.scheduler import MAX_ATTEMPTS, PublishScheduler
+
+
+class Command(BaseCommand):
+    help = (
+        "Make scheduled private YouTube videos public at their publish_at, with "
+        "batched videos.update calls fired from a timing wheel. Run one process "
+        "with YOUTUBE_API_CONFIG_PUBLISH_SCHEDULER=True."
+    )
+
+    def add_arguments(self, parser):
+        parser.add_argument(
+            '--once', action='store_true',
+            help="Publish the videos which are due and exit.")
+        parser.add_argument(
+            '--tick', type=float, default=1.0,
+            help="Seconds of a slot of the timing wheel, videos are published up to a tick early.")
+        parser.add_argument(
+            '--horizon', type=float, default=60 * 60.0,
+            help="Seconds ahead the videos to publish are loaded.")
+        parser.add_argument(
+            '--refill-interval', type=float, default=60.0,
+            help="Seconds between two loads of the videos to publish, "
+                 "changes of publish_at are seen after at most this time.")
+        parser.add_argument(
+            '--batch-size', type=int, default=500,
+            help="Videos published together, in batch requests of 50 videos.")
+        parser.add_argument(
+            '--max-attempts', type=int, default=MAX_ATTEMPTS,
+            help="Failed publishes of a video before it's given up, see YTVideo.publish_error.")
+
+    def handle(self, *args, **options):
+        if not settings.YOUTUBE_API_CONFIG.get('PUBLISH_SCHEDULER'):
+            # uploads carry publishAt, publishing them here too spends the quota twice
+            raise CommandError(
+                "YOUTUBE_API_CONFIG_PUBLISH_SCHEDULER is off, uploads are scheduled with "
+                "publishAt and YouTube publishes them. Turn it on to run the scheduler.")
+        if options['tick'] <= 0 or options['horizon'] < options['tick']:
+            raise CommandError("--tick must be positive and --horizon at least one tick")
+        scheduler = PublishScheduler(
+            self.load, self.publish,
+            tick=options['tick'], horizon=options['horizon'],
+            refill_interval=options['refill_interval'], batch_size=options['batch_size'],
+            max_attempts=options['max_attempts'], give_up=self.give_up)
+
+        if options['once']:
+            scheduler.run_once()
+            return
+        self.stdout.write("Publish scheduler started.")
+        scheduler.run()
+
+    @staticmethod
+    def load(until):
+        videos = YTVideo.objects.publish_due(
+            until=datetime.datetime.fromtimestamp(until, tz=datetime.timezone.utc))
+        return [(pk, publish_at.timestamp())
+                for pk, publish_at in videos.values_list('pk', 'publish_at').iterator()]
+
+    def publish(self, keys):
+        published, failed = YTVideo.objects.filter(pk__in=keys).publish()
+        for video in published:
+            self.stdout.write(self.style.SUCCESS(
+                f"Video {video.video_id} published, scheduled at {video.publish_at}"))
+        if failed:
+            self.stderr.write(f"{len(failed)} video(s) not published, they are retried.")
+        return {pk: retry_at and retry_at.timestamp() for pk, retry_at in failed.items()}
+
+    def give_up(self, pk, failures):
+        # publish_due() leaves the video out until publish_error is cleared
+        YTVideo.objects.filter(pk=pk).update(
+            publish_error=f"Publishing failed {failures} times, gave up at {now().isoformat()}")
+        self.stderr.write(f"YTVideo {pk} not published after {failures} attempts, gave up.")
@@ -0,0 +1,69 @@
+from django.core.management.base import BaseCommand, CommandError
+from django.db import transaction
+
+from youtube.models import YTChannel, YTVideo
+from youtube.utils.api import QuotaExhausted, YTApi, response_cache_stats
+from youtube.utils.quota import quota_cost
+
+
+class Command(BaseCommand):
+    help = (
+        "Reconcile YTVideo rows with the videos of the authenticated YouTube channel, "
+        "page by page of its uploads playlist."
+    )
+
+    def add_arguments(self, parser):
+        parser.add_argument(
+            '--create', action='store_true',
+            help="Create YTVideo rows for channel videos missing in the database.")
+        parser.add_argument(
+            '--dry-run', action='store_true',
+            help="Report the changes without saving them.")
+        parser.add_argument(
+            '--channel', default=None,
+            help="YouTube channel id of a YTChannel to sync, "
+                 "default: the channel of YOUTUBE_API_CONFIG.")
+
+    def handle(self, *args, **options):
+        channel = None
+        if options['channel']:
+            try:
+                channel = YTChannel.objects.get(channel_id=options['channel'])
+            except YTChannel.DoesNotExist:
+                raise CommandError(f"No YTChannel with channel id {options['channel']}")
+        api = YTApi(channel_id=channel.pk if channel else None)
+        pages = updated = missing = videos = 0
+        try:
+            for resources in api.channel_video_pages():
+                # every page is saved on its own, an interrupted sync keeps its progress
+                with transaction.atomic():
+                    page_updated, page_missing = YTVideo.objects.sync_page(
+                        resources, create=options['create'], channel_id=api.channel_id)
+                    if options['dry_run']:
+                        transaction.set_rollback(True)
+                pages += 1
+                videos += len(resources)
+                updated += page_updated
+                missing += len(page_missing)
+                self.stdout.write(
+                    f"Page {pages}: {len(resources)} videos, {page_updated} updated, "
+                    f"{len(page_missing)} missing in the database.")
+        except QuotaExhausted as error:
+            raise CommandError(
+                f"Quota exhausted after {pages} pages, run the sync again after the quota "
+                f"reset at {error.retry_at.isoformat()}.")
+
+        created = missing if options['create'] else 0
+        self.stdout.write(self.style.SUCCESS(
+            f"Synced {videos} videos: {updated} updated, {missing} missing, {created} created."))
+        for method_id, calls in sorted(api.calls.items()):
+            self.stdout.write(
+                f"{method_id}: {calls} calls, {calls * quota_cost(method_id)} quota units")
+        units = sum(calls * quota_cost(method_id) for method_id, calls in api.calls.items())
+        self.stdout.write(f"Total: {sum(api.calls.values())} calls, {units} quota units")
+        stats = response_cache_stats.as_dict()
+        self.stdout.write(
+            f"Response cache: {stats['hits']} hits, {stats['misses']} misses, "
+            f"{stats['bytes_saved']} bytes not transferred")
+        if options['dry_run']:
+            self.stdout.write("Dry run, nothing was saved.")
@@ -0,0 +1,67 @@
+import time
+
+from django.core.management.base import BaseCommand, CommandError
+from django.utils.timezone import now
+
+from youtube.models import YTVideo
+from youtube.utils.api import QuotaExhausted, YTApiError
+from youtube.utils.credentials import TokenError
+
+# longest wait after rounds of checks failed one after another
+MAX_ERROR_BACKOFF = 600.0
+
+
+class Command(BaseCommand):
+    help = (
+        "Track the processing status of uploaded YouTube videos until they are "
+        "processed, checking many videos per videos.list call."
+    )
+
+    def add_arguments(self, parser):
+        parser.add_argument(
+            '--once', action='store_true',
+            help="Check the videos which are due and exit.")
+        parser.add_argument(
+            '--poll-interval', type=float, default=30.0,
+            help="Longest wait between two rounds of checks.")
+
+    def handle(self, *args, **options):
+        self.stdout.write("Processing tracker started.")
+        failures = 0
+        while True:
+            try:
+                checked, done = YTVideo.objects.poll_processing()
+            except QuotaExhausted as error:
+                if options['once']:
+                    raise CommandError(str(error))
+                self.stderr.write(f"{error}, waiting.")
+                time.sleep(max((error.retry_at - now()).total_seconds(), options['poll_interval']))
+                continue
+            except (Exception, YTApiError, TokenError) as error:
+                # the videos stay due, they are checked again after the backoff
+                if options['once']:
+                    raise CommandError(f"{type(error).__name__}: {error}")
+                failures += 1
+                wait = min(options['poll_interval'] * 2 ** (failures - 1), MAX_ERROR_BACKOFF)
+                self.stderr.write(
+                    f"Checks failed ({type(error).__name__}: {error}), retrying in {wait:.0f}s.")
+                time.sleep(wait)
+                continue
+            failures = 0
+            for video in done:
+                self.stdout.write(self.style.SUCCESS(
+                    f"Video {video.video_id}: {video.upload_status}/{video.processing_status}"))
+            if checked:
+                self.stdout.write(f"Checked {checked} video(s), {len(done)} done.")
+                continue
+            if options['once']:
+                break
+            time.sleep(self.idle_seconds(options['poll_interval']))
+
+    @staticmethod
+    def idle_seconds(poll_interval):
+        # wake up for the next due check
+        next_at = YTVideo.objects.next_processing_check_at()
+        if next_at is None:
+            return poll_interval
+        return min(poll_interval, max((next_at - now()).total_seconds(), 0.1))
@@ -0,0 +1,127 @@
+import os
+import socket
+import time
+
+from django.conf import settings
+from django.core.management.base import BaseCommand
+from django.db import connections
+from django.utils.timezone import now, timedelta
+
+from youtube.models import UploadJob
+from youtube.utils.api import credential_pool
+from youtube.utils.executor import UploadExecutor
+from youtube.utils.metrics import metrics, serve
+from youtube.utils.thumbnail import thumbnail_pipeline
+from youtube.utils.transcode import transcode_pipeline
+
+# shortest wait between two claims of an idle worker
+MIN_IDLE_SECONDS = 1.0
+
+
+class Command(BaseCommand):
+    help = (
+        "Process queued YouTube upload jobs. "
+        "Run as many worker processes as needed to scale uploads."
+    )
+
+    def add_arguments(self, parser):
+        parser.add_argument(
+            '--once', action='store_true',
+            help="Process the currently pending jobs and exit.")
+        parser.add_argument(
+            '--concurrency', type=int, default=4,
+            help="Number of uploads running at the same time.")
+        parser.add_argument(
+            '--per-channel', type=int, default=2,
+            help="Number of uploads running at the same time for one channel.")
+        parser.add_argument(
+            '--poll-interval', type=float, default=5.0,
+            help="Seconds to wait when there is no pending job.")
+        parser.add_argument(
+            '--stale-after', type=int, default=6 * 60 * 60,
+            help="Seconds without progress after which a running job of a dead worker "
+                 "is released.")
+        parser.add_argument(
+            '--metrics-port', type=int, default=None,
+            help="Serve the metrics of this worker on this port (YOUTUBE_API_CONFIG_METRICS).")
+        parser.add_argument(
+            '--metrics-address', default='127.0.0.1',
+            help="Address the metrics server listens on, 0.0.0.0 for all interfaces.")
+        parser.add_argument(
+            '--credential-refresh-interval', type=float, default=60.0,
+            help="Seconds between checks for channel credentials to refresh in background.")
+
+    def handle(self, *args, **options):
+        worker_id = f"{socket.gethostname()}:{os.getpid()}"
+        stale_after = timedelta(seconds=options['stale_after'])
+        executor = UploadExecutor(
+            max_workers=options['concurrency'],
+            per_channel=min(options['per_channel'], options['concurrency']),
+        )
+        self.stdout.write(f"Upload worker {worker_id} started.")
+        # tokens of channels are refreshed before an upload has to wait for it
+        credential_pool.start_refresher(
+            options['credential_refresh_interval'],
+            on_error=lambda key, error: self.stderr.write(
+                f"Refreshing the credentials of channel {key} failed: {error}"))
+        if options['metrics_port'] is not None:
+            if metrics().enabled:
+                serve(options['metrics_port'], options['metrics_address'],
+                      token=settings.YOUTUBE_API_CONFIG.get('METRICS_TOKEN'))
+                self.stdout.write(
+                    f"Serving metrics on {options['metrics_address']}:{options['metrics_port']}.")
+            else:
+                self.stderr.write("Metrics are disabled, set YOUTUBE_API_CONFIG_METRICS=True.")
+
+        try:
+            while True:
+                released = UploadJob.objects.release_stale(now() - stale_after)
+                if released:
+                    self.stdout.write(f"Released {released} stale job(s).")
+
+                # claim only what can be started or queued right now, the rest
+                # stays claimable by other workers
+                free_slots = executor.free_slots
+                if not free_slots:
+                    # woken up by a finished upload, not by polling the queue
+                    executor.wait_for_slot(options['poll_interval'])
+                    continue
+                jobs = UploadJob.objects.claim(worker_id, limit=free_slots)
+                for job in jobs:
+                    executor.submit(self.process, job, channel=job.channel_key)
+
+                if not jobs:
+                    if options['once'] and not executor.in_flight:
+                        break
+                    time.sleep(self.idle_seconds(options['poll_interval']))
+        finally:
+            executor.shutdown(wait=True)
+            thumbnail_pipeline().shutdown()
+            transcode_pipeline().shutdown()
+            credential_pool.stop_refresher()
+
+    @staticmethod
+    def idle_seconds(poll_interval):
+        # wake up early for a job rescheduled by a retry; a job which is due
+        # but wasn't claimed (locked by another worker) is looked at again
+        # after a second, not in a busy loop
+        next_at = UploadJob.objects.next_available_at()
+        if next_at is None:
+            return poll_interval
+        return min(poll_interval, max((next_at - now()).total_seconds(), MIN_IDLE_SECONDS))
+
+    def process(self, job):
+        try:
+            self.stdout.write(f"Uploading job {job}...")
+            if job.run():
+                self.stdout.write(self.style.SUCCESS(
+                    f"Job {job.id} done, video_id={job.video.youtube_video_id}"))
+            else:
+                if job.status == UploadJob.Status.PENDING:
+                    self.stderr.write(
+                        f"Job {job.id} will be retried at {job.available_at}: {job.last_error}")
+                else:
+                    self.stderr.write(f"Job {job.id} failed: {job.last_error}")
+        finally:
+            # the connections of this upload thread
+            connections.close_all()
@@ -0,0 +1,40 @@
+# Generated by Django 3.1.7 on 2026-10-17 16:05
+
+from django.db import migrations, models
+import django.db.models.deletion
+import django.utils.timezone
+import model_utils.fields
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('youtube', '0002_auto_20210718_1234'),
+    ]
+
+    operations = [
+        migrations.AlterField(
+            model_name='ytvideo',
+            name='video_id',
+            field=models.CharField(blank=True, help_text='YouTube video id', max_length=255, null=True, unique=True),
+        ),
+        migrations.CreateModel(
+            name='UploadJob',
+            fields=[
+                ('id', models.AutoField(auto_created=True, primary_key=True, serialize=False, verbose_name='ID')),
+                ('created', model_utils.fields.AutoCreatedField(default=django.utils.timezone.now, editable=False, verbose_name='created')),
+                ('modified', model_utils.fields.AutoLastModifiedField(default=django.utils.timezone.now, editable=False, verbose_name='modified')),
+                ('status', models.CharField(choices=[('pending', 'Pending'), ('running', 'Running'), ('succeeded', 'Succeeded'), ('failed', 'Failed')], default='pending', help_text='Status of the upload job', max_length=10)),
+                ('attempts', models.PositiveIntegerField(default=0, help_text='Number of times the job was claimed by a worker')),
+                ('worker_id', models.CharField(blank=True, help_text='Worker which claimed the job', max_length=255)),
+                ('claimed_at', models.DateTimeField(blank=True, null=True)),
+                ('finished_at', models.DateTimeField(blank=True, null=True)),
+                ('last_error', models.TextField(blank=True)),
+                ('video', models.ForeignKey(help_text='Video to upload', on_delete=django.db.models.deletion.CASCADE, related_name='upload_jobs', to='youtube.ytvideo')),
+            ],
+        ),
+        migrations.AddIndex(
+            model_name='uploadjob',
+            index=models.Index(fields=['status', 'created'], name='youtube_upl_status_080192_idx'),
+        ),
+    ]
@@ -0,0 +1,28 @@
+# Generated by Django 3.1.7 on 2026-10-17 16:10
+
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('youtube', '0003_uploadjob'),
+    ]
+
+    operations = [
+        migrations.AddField(
+            model_name='uploadjob',
+            name='bytes_uploaded',
+            field=models.BigIntegerField(default=0, help_text='Last byte offset acknowledged by YouTube'),
+        ),
+        migrations.AddField(
+            model_name='uploadjob',
+            name='session_uri',
+            field=models.TextField(blank=True, help_text='Resumable upload session URI, used to resume an interrupted upload'),
+        ),
+        migrations.AddField(
+            model_name='uploadjob',
+            name='total_bytes',
+            field=models.BigIntegerField(blank=True, null=True),
+        ),
+    ]
@@ -0,0 +1,32 @@
+# Generated by Django 3.1.7 on 2026-10-17 16:18
+
+from django.db import migrations, models
+import django.utils.timezone
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('youtube', '0004_uploadjob_session'),
+    ]
+
+    operations = [
+        migrations.RemoveIndex(
+            model_name='uploadjob',
+            name='youtube_upl_status_080192_idx',
+        ),
+        migrations.AddField(
+            model_name='uploadjob',
+            name='available_at',
+            field=models.DateTimeField(default=django.utils.timezone.now, help_text="The job is not claimed before this time, it's postponed by retries"),
+        ),
+        migrations.AddField(
+            model_name='uploadjob',
+            name='failure',
+            field=models.JSONField(blank=True, help_text='Details of the error the job failed with', null=True),
+        ),
+        migrations.AddIndex(
+            model_name='uploadjob',
+            index=models.Index(fields=['status', 'available_at'], name='youtube_upl_status_2cb4b0_idx'),
+        ),
+    ]
@@ -0,0 +1,40 @@
+# Generated by Django 3.1.7 on 2026-10-17 16:20
+
+from django.db import migrations, models
+import django.utils.timezone
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('youtube', '0005_uploadjob_retry'),
+    ]
+
+    operations = [
+        migrations.CreateModel(
+            name='QuotaBucket',
+            fields=[
+                ('id', models.AutoField(auto_created=True, primary_key=True, serialize=False, verbose_name='ID')),
+                ('key', models.CharField(help_text='Google Cloud project of the quota, see quota_key()', max_length=255, unique=True)),
+                ('day', models.DateField(help_text='Quota day (Pacific Time) of `used`')),
+                ('used', models.PositiveIntegerField(default=0, help_text='Quota units used on the day')),
+                ('tokens', models.FloatField(default=0, help_text='Requests left in the bucket')),
+                ('refilled_at', models.DateTimeField(default=django.utils.timezone.now)),
+                ('version', models.PositiveIntegerField(default=0)),
+            ],
+        ),
+        migrations.CreateModel(
+            name='QuotaUsage',
+            fields=[
+                ('id', models.AutoField(auto_created=True, primary_key=True, serialize=False, verbose_name='ID')),
+                ('key', models.CharField(max_length=255)),
+                ('day', models.DateField()),
+                ('method', models.CharField(help_text='API method, i.e. youtube.videos.insert', max_length=255)),
+                ('calls', models.PositiveIntegerField(default=0)),
+                ('units', models.PositiveIntegerField(default=0)),
+            ],
+            options={
+                'unique_together': {('key', 'day', 'method')},
+            },
+        ),
+    ]
@@ -0,0 +1,23 @@
+# Generated by Django 3.1.7 on 2026-10-17 16:40
+
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('youtube', '0006_quota'),
+    ]
+
+    operations = [
+        migrations.AddField(
+            model_name='ytvideo',
+            name='processing_status',
+            field=models.CharField(blank=True, help_text="The video's processing status on YouTube, i.e. processing or succeeded.", max_length=20),
+        ),
+        migrations.AddField(
+            model_name='ytvideo',
+            name='upload_status',
+            field=models.CharField(blank=True, help_text='The status of the uploaded video on YouTube, i.e. uploaded or processed.', max_length=20),
+        ),
+    ]
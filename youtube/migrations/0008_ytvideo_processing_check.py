@@ -0,0 +1,23 @@
+# Generated by Django 3.1.7 on 2026-10-17 17:00
+
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('youtube', '0007_ytvideo_status'),
+    ]
+
+    operations = [
+        migrations.AddField(
+            model_name='ytvideo',
+            name='processing_check_at',
+            field=models.DateTimeField(blank=True, db_index=True, help_text='Time of the next processing status check, empty when processing is done', null=True),
+        ),
+        migrations.AddField(
+            model_name='ytvideo',
+            name='processing_checks',
+            field=models.PositiveIntegerField(default=0, help_text='Number of processing status checks since the upload'),
+        ),
+    ]
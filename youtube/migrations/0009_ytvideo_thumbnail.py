@@ -0,0 +1,23 @@
+# Generated by Django 3.1.7 on 2026-10-17 17:30
+
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('youtube', '0008_ytvideo_processing_check'),
+    ]
+
+    operations = [
+        migrations.AddField(
+            model_name='ytvideo',
+            name='thumbnail',
+            field=models.ImageField(blank=True, help_text="Custom thumbnail, it's resized to 1280x720 and recompressed before the upload", null=True, upload_to='youtube/thumbnails'),
+        ),
+        migrations.AddField(
+            model_name='ytvideo',
+            name='thumbnail_set_at',
+            field=models.DateTimeField(blank=True, help_text='Time the thumbnail was set on YouTube', null=True),
+        ),
+    ]
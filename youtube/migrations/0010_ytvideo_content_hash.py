@@ -0,0 +1,24 @@
+# Generated by Django 3.1.7 on 2026-10-17 17:45
+
+from django.db import migrations, models
+import django.db.models.deletion
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('youtube', '0009_ytvideo_thumbnail'),
+    ]
+
+    operations = [
+        migrations.AddField(
+            model_name='ytvideo',
+            name='content_hash',
+            field=models.CharField(blank=True, db_index=True, help_text='SHA-256 of the video file, an identical file is not uploaded again', max_length=64),
+        ),
+        migrations.AddField(
+            model_name='ytvideo',
+            name='duplicate_of',
+            field=models.ForeignKey(blank=True, help_text='Uploaded video with the same file, this one is not uploaded', null=True, on_delete=django.db.models.deletion.SET_NULL, related_name='duplicates', to='youtube.ytvideo'),
+        ),
+    ]
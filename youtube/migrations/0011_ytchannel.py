@@ -0,0 +1,39 @@
+# Generated by Django 3.1.7 on 2026-10-17 18:30
+
+from django.conf import settings
+from django.db import migrations, models
+import django.db.models.deletion
+import django.utils.timezone
+import model_utils.fields
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        migrations.swappable_dependency(settings.AUTH_USER_MODEL),
+        ('youtube', '0010_ytvideo_content_hash'),
+    ]
+
+    operations = [
+        migrations.CreateModel(
+            name='YTChannel',
+            fields=[
+                ('id', models.AutoField(auto_created=True, primary_key=True, serialize=False, verbose_name='ID')),
+                ('created', model_utils.fields.AutoCreatedField(default=django.utils.timezone.now, editable=False, verbose_name='created')),
+                ('modified', model_utils.fields.AutoLastModifiedField(default=django.utils.timezone.now, editable=False, verbose_name='modified')),
+                ('channel_id', models.CharField(help_text='YouTube channel id', max_length=64, unique=True)),
+                ('title', models.CharField(blank=True, max_length=100)),
+                ('token', models.BinaryField(help_text='Encrypted OAuth 2.0 credentials')),
+                ('token_expiry', models.DateTimeField(blank=True, help_text="Expiry of the access token, it's refreshed before", null=True)),
+                ('user', models.ForeignKey(help_text='Owner of the channel', on_delete=django.db.models.deletion.CASCADE, related_name='youtube_channels', to=settings.AUTH_USER_MODEL)),
+            ],
+            options={
+                'abstract': False,
+            },
+        ),
+        migrations.AddField(
+            model_name='ytvideo',
+            name='channel',
+            field=models.ForeignKey(blank=True, help_text='Channel of the video, empty for the channel of YOUTUBE_API_CONFIG', null=True, on_delete=django.db.models.deletion.PROTECT, related_name='videos', to='youtube.ytchannel'),
+        ),
+    ]
@@ -0,0 +1,52 @@
+# Generated by Django 3.1.7 on 2026-10-17 19:40
+
+from django.conf import settings
+from django.db import migrations, models
+import django.db.models.deletion
+import django.utils.timezone
+import model_utils.fields
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        migrations.swappable_dependency(settings.AUTH_USER_MODEL),
+        ('youtube', '0011_ytchannel'),
+    ]
+
+    operations = [
+        migrations.CreateModel(
+            name='BulkImport',
+            fields=[
+                ('id', models.AutoField(auto_created=True, primary_key=True, serialize=False, verbose_name='ID')),
+                ('created', model_utils.fields.AutoCreatedField(default=django.utils.timezone.now, editable=False, verbose_name='created')),
+                ('modified', model_utils.fields.AutoLastModifiedField(default=django.utils.timezone.now, editable=False, verbose_name='modified')),
+                ('manifest', models.CharField(help_text='Path of the manifest', max_length=1024)),
+                ('manifest_hash', models.CharField(db_index=True, help_text='SHA-256 of the manifest, importing the same manifest again resumes this import', max_length=64)),
+                ('rows', models.PositiveIntegerField(default=0, help_text='Number of videos in the manifest')),
+                ('rows_done', models.PositiveIntegerField(default=0, help_text='Number of videos imported, the first rows of the manifest')),
+                ('publish_start', models.DateTimeField(help_text='publish_at of the first spread video')),
+                ('publish_interval', models.DurationField(help_text='Time between the publish_at of spread videos')),
+                ('finished_at', models.DateTimeField(blank=True, null=True)),
+                ('channel', models.ForeignKey(blank=True, help_text='Channel of the imported videos', null=True, on_delete=django.db.models.deletion.PROTECT, related_name='imports', to='youtube.ytchannel')),
+                ('user', models.ForeignKey(help_text='Owner of the imported videos', on_delete=django.db.models.deletion.CASCADE, related_name='youtube_imports', to=settings.AUTH_USER_MODEL)),
+            ],
+            options={
+                'abstract': False,
+            },
+        ),
+        migrations.AddField(
+            model_name='ytvideo',
+            name='bulk_import',
+            field=models.ForeignKey(blank=True, help_text='Bulk import that created the video, see `manage.py bulk_upload`', null=True, on_delete=django.db.models.deletion.SET_NULL, related_name='videos', to='youtube.bulkimport'),
+        ),
+        migrations.AddField(
+            model_name='ytvideo',
+            name='import_line',
+            field=models.PositiveIntegerField(blank=True, help_text='Line of the video in the manifest of its bulk import', null=True),
+        ),
+        migrations.AddConstraint(
+            model_name='ytvideo',
+            constraint=models.UniqueConstraint(fields=('bulk_import', 'import_line'), name='unique_bulk_import_line'),
+        ),
+    ]
@@ -0,0 +1,21 @@
+# Generated by Django 3.1.7 on 2026-10-17 20:15
+
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('youtube', '0012_bulkimport'),
+    ]
+
+    operations = [
+        migrations.AddIndex(
+            model_name='ytvideo',
+            index=models.Index(fields=['user', 'created'], name='youtube_ytv_user_id_bf0fc4_idx'),
+        ),
+        migrations.AddIndex(
+            model_name='ytvideo',
+            index=models.Index(fields=['privacy_status', 'publish_at'], name='youtube_ytv_privacy_8e1106_idx'),
+        ),
+    ]
@@ -0,0 +1,48 @@
+# Generated by Django 3.1.7 on 2026-10-17 21:05
+
+from django.db import migrations, models
+
+from youtube.utils.search import install_search, normalized_tags, uninstall_search
+
+
+def create_search_index(apps, schema_editor):
+    install_search(schema_editor.connection)
+
+
+def drop_search_index(apps, schema_editor):
+    uninstall_search(schema_editor.connection)
+
+
+def index_tags(apps, schema_editor):
+    YTVideo = apps.get_model('youtube', 'YTVideo')
+    YTTag = apps.get_model('youtube', 'YTTag')
+    tags = {}
+    for video in YTVideo.objects.exclude(tags='').only('pk', 'tags').iterator():
+        for name in normalized_tags(video.tags):
+            if name not in tags:
+                tags[name] = YTTag.objects.get_or_create(name=name)[0]
+            video.tag_set.add(tags[name])
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('youtube', '0013_ytvideo_listing_indexes'),
+    ]
+
+    operations = [
+        migrations.CreateModel(
+            name='YTTag',
+            fields=[
+                ('id', models.AutoField(auto_created=True, primary_key=True, serialize=False, verbose_name='ID')),
+                ('name', models.CharField(max_length=255, unique=True)),
+            ],
+        ),
+        migrations.AddField(
+            model_name='ytvideo',
+            name='tag_set',
+            field=models.ManyToManyField(blank=True, help_text='Normalized tags of `tags`, set when the video is saved', related_name='videos', to='youtube.YTTag'),
+        ),
+        migrations.RunPython(index_tags, migrations.RunPython.noop),
+        migrations.RunPython(create_search_index, drop_search_index),
+    ]
@@ -0,0 +1,28 @@
+# Generated by Django 3.1.7 on 2026-10-17 21:50
+
+from django.db import migrations, models
+import youtube.models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('youtube', '0014_yttag_search'),
+    ]
+
+    operations = [
+        migrations.AlterField(
+            model_name='ytvideo',
+            name='publish_at',
+            field=models.DateTimeField(default=youtube.models.default_publish_at, help_text='The date and time when the video is scheduled to publish. It can be set only if the privacy status of the video is private. The value is specified in ISO 8601 format.'),
+        ),
+        migrations.AddField(
+            model_name='ytvideo',
+            name='published_at',
+            field=models.DateTimeField(blank=True, help_text='Time the publish scheduler made the video public on YouTube', null=True),
+        ),
+        migrations.AddIndex(
+            model_name='ytvideo',
+            index=models.Index(condition=models.Q(('privacy_status', 'private'), ('published_at', None)), fields=['publish_at'], name='youtube_ytvideo_publish_due'),
+        ),
+    ]
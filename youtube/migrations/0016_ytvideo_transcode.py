@@ -0,0 +1,38 @@
+# Generated by Django 3.1.7 on 2026-10-17 23:10
+
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('youtube', '0015_ytvideo_publish_scheduler'),
+    ]
+
+    operations = [
+        migrations.AddField(
+            model_name='ytvideo',
+            name='original_bytes',
+            field=models.BigIntegerField(blank=True, help_text='Size of file_on_server before the pre-upload stage', null=True),
+        ),
+        migrations.AddField(
+            model_name='ytvideo',
+            name='probe_seconds',
+            field=models.FloatField(blank=True, help_text='Duration of probing the file with ffprobe', null=True),
+        ),
+        migrations.AddField(
+            model_name='ytvideo',
+            name='transcode_action',
+            field=models.CharField(blank=True, choices=[('none', 'None'), ('remux', 'Remux'), ('transcode', 'Transcode'), ('failed', 'Failed')], help_text='Pre-upload stage of the file: remuxed to a faststart MP4, transcoded or uploaded as it is, see YOUTUBE_API_CONFIG TRANSCODE', max_length=10),
+        ),
+        migrations.AddField(
+            model_name='ytvideo',
+            name='transcode_seconds',
+            field=models.FloatField(blank=True, help_text='Duration of remuxing or transcoding the file with ffmpeg', null=True),
+        ),
+        migrations.AddField(
+            model_name='ytvideo',
+            name='uploaded_bytes',
+            field=models.BigIntegerField(blank=True, help_text='Size of the file sent to YouTube', null=True),
+        ),
+    ]
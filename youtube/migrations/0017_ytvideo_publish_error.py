@@ -0,0 +1,18 @@
+# Generated by Django 3.1.7 on 2026-10-17 23:40
+
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('youtube', '0016_ytvideo_transcode'),
+    ]
+
+    operations = [
+        migrations.AddField(
+            model_name='ytvideo',
+            name='publish_error',
+            field=models.CharField(blank=True, help_text='Why the publish scheduler gave up making the video public, clear it to retry', max_length=255),
+        ),
+    ]
@@ -1,15 +1,401 @@
+import logging
+import os
+import time
+from collections import Counter
+from concurrent.futures import ThreadPoolExecutor
+
+from django.conf import settings
 from django.contrib.auth import get_user_model
-from django.db import models
+from django.db import IntegrityError, models, transaction
+from django.db.models import F
 from django.db.models.signals import post_save, pre_save, pre_delete
 from django.dispatch import receiver
-from django.utils.timezone import now, timedelta
+from django.utils.dateparse import parse_datetime
+from django.utils.timezone import is_naive, make_aware, now, timedelta, utc
 from django.utils.translation import ugettext as _
 from model_utils.models import TimeStampedModel
 
-from .utils.api import YTApi
+from .utils.api import (OperationError, QuotaExhausted, UploadRetryLater, YTApi, YTApiError,
+                        credential_pool)
+from .utils.batch import MAX_BATCH_SIZE, MAX_LIST_IDS, chunked
+from .utils.credentials import TokenError, decrypt_credentials, encrypt_credentials
+from .utils.manifest import ManifestError, place_file, publish_slot
+from .utils.metrics import metrics
+from .utils.progress import ProgressReporter, ProgressStore
+from .utils.quota import QuotaConfig, next_quota_reset, quota_cost, quota_day
+from .utils.retry import ErrorClass, RetryPolicy, failure_details
+from .utils.search import normalize_tag, normalized_tags, search_backend, search_words
+from .utils.thumbnail import ThumbnailError, prepare_thumbnail, thumbnail_pipeline
+from .utils.tracker import PROCESSING_FIELDS, PROCESSING_PART, PollSchedule, processing_done
+from .utils.transcode import NONE, REMUX, TRANSCODE, TranscodeError, transcode_pipeline
+
+logger = logging.getLogger(__name__)
 
 User = get_user_model()
 
+# values of an IN lookup, below the 999 variables of a SQLite query
+MAX_QUERY_PARAMS = 500
+
+
+class YTChannelQuerySet(models.QuerySet):
+    def default_for(self, user):
+        """
+        Channel the videos of `user` are uploaded to: the first one they
+        added, None when they have none.
+        """
+        if not user.is_authenticated:
+            return None
+        return self.filter(user=user).order_by('pk').first()
+
+
+class YTChannel(TimeStampedModel):
+    """YTChannel
+    YouTube channel videos are uploaded to, with the OAuth 2.0 credentials
+    of its owner encrypted in the database (see utils.credentials).
+    Videos without a channel use the credentials of YOUTUBE_API_CONFIG.
+    """
+    user = models.ForeignKey(
+        User, on_delete=models.CASCADE, related_name='youtube_channels',
+        help_text=_("Owner of the channel"))
+    channel_id = models.CharField(max_length=64, unique=True, help_text=_("YouTube channel id"))
+    title = models.CharField(max_length=100, blank=True)
+    token = models.BinaryField(help_text=_("Encrypted OAuth 2.0 credentials"))
+    token_expiry = models.DateTimeField(null=True, blank=True, help_text=_(
+        "Expiry of the access token, it's refreshed before"))
+
+    objects = YTChannelQuerySet.as_manager()
+
+    def __str__(self):
+        return f"{self.id}:{self.title or self.channel_id}"
+
+    def credentials(self):
+        """
+        Raises:
+            TokenError: when the token can't be decrypted
+        """
+        return decrypt_credentials(self.token)
+
+    def store_credentials(self, cred):
+        """
+        Encrypt and save `cred`, the processes reload them on their next refresh.
+        """
+        self.token = encrypt_credentials(cred)
+        self.token_expiry = cred.expiry.replace(tzinfo=utc) if cred.expiry else None
+        self.save()
+        credential_pool.discard(self.pk)
+
+
+class YTTagQuerySet(models.QuerySet):
+    def index(self, videos):
+        """
+        Set the tag_set of `videos` (with pk and tags) to their normalized
+        tags with a few bulk queries, the tags of YTVideo.tags are looked up
+        through the tag_set index.
+        """
+        names = {video.pk: normalized_tags(video.tags) for video in videos}
+        if not names:
+            return
+        Tagging = YTVideo.tag_set.through
+        with transaction.atomic():
+            all_names = set().union(*names.values())
+            self.bulk_create([YTTag(name=name) for name in all_names], ignore_conflicts=True)
+            ids = {}
+            for chunk in chunked(all_names, MAX_QUERY_PARAMS):
+                ids.update(self.filter(name__in=chunk).values_list('name', 'pk'))
+            for chunk in chunked(names, MAX_QUERY_PARAMS):
+                Tagging.objects.filter(ytvideo_id__in=chunk).delete()
+            Tagging.objects.bulk_create([
+                Tagging(ytvideo_id=pk, yttag_id=ids[name])
+                for pk, video_names in names.items() for name in video_names
+            ])
+
+
+class YTTag(models.Model):
+    """YTTag
+    Normalized tag (lowercase, whitespace collapsed) of videos, see
+    YTVideo.tag_set.
+    """
+    name = models.CharField(max_length=255, unique=True)
+
+    objects = YTTagQuerySet.as_manager()
+
+    def __str__(self):
+        return self.name
+
+
+class YTVideoQuerySet(models.QuerySet):
+    # fields of the video listing, read with values() instead of whole rows
+    LISTING_FIELDS = ['id', 'video_id', 'title', 'privacy_status', 'publish_at', 'upload_status',
+                      'processing_status', 'youtube_url', 'channel_id', 'duplicate_of_id',
+                      'created']
+    # orderings of the video listing, each one served by an index
+    LISTING_ORDERINGS = ['-created', 'created', 'publish_at', '-publish_at']
+
+    def uploaded(self):
+        return self.exclude(video_id=None).exclude(video_id='')
+
+    def search(self, query, rank=False):
+        """
+        Videos with all words of `query` (prefixes) in their title,
+        description or tags, through the full-text index of the database,
+        see utils.search. With `rank`, sorted by relevance in `rank`.
+        """
+        words = search_words(query)
+        if not words:
+            return self
+        return search_backend(self.db).filter(self, words, rank=rank)
+
+    def tagged(self, *tags):
+        """Videos with all of `tags` (compared normalized)."""
+        queryset = self
+        for tag in tags:
+            queryset = queryset.filter(tag_set__name=normalize_tag(tag))
+        return queryset
+
+    def listing(self, user=None, privacy_status=None, upload_status=None, uploaded=None,
+                publish_after=None, publish_before=None, channel_id=None, query=None, tags=()):
+        """
+        Videos of the listing API with the given filters, as dicts of
+        LISTING_FIELDS. The index (user, created) serves the videos of a
+        user by creation time, (privacy_status, publish_at) the videos of a
+        privacy status by publish time; page them with keyset_page().
+        """
+        queryset = self
+        if query:
+            queryset = queryset.search(query)
+        if tags:
+            queryset = queryset.tagged(*tags)
+        if user is not None:
+            queryset = queryset.filter(user=user)
+        if privacy_status:
+            queryset = queryset.filter(privacy_status=privacy_status)
+        if upload_status:
+            queryset = queryset.filter(upload_status=upload_status)
+        if uploaded:
+            queryset = queryset.uploaded()
+        elif uploaded is not None:
+            queryset = queryset.filter(models.Q(video_id=None) | models.Q(video_id=''))
+        if publish_after is not None:
+            queryset = queryset.filter(publish_at__gte=publish_after)
+        if publish_before is not None:
+            queryset = queryset.filter(publish_at__lt=publish_before)
+        if channel_id:
+            queryset = queryset.filter(channel__channel_id=channel_id)
+        return queryset.values(*self.LISTING_FIELDS)
+
+    def by_channel(self):
+        """
+        (channel_id, queryset) of every channel of this queryset, API calls
+        of a channel are sent with its own credentials.
+        """
+        for channel_id in self.order_by().values_list('channel_id', flat=True).distinct():
+            yield channel_id, self.filter(channel_id=channel_id)
+
+    def push_to_youtube(self, batch_size=MAX_BATCH_SIZE):
+        """
+        Update the YouTube videos of this queryset from their YTVideo
+        (videos.update in batches of `batch_size`) and store the video
+        resources YouTube returned with one bulk_update per batch.
+
+        return: updated, errors
+            updated: number of updated videos
+            errors: {YTVideo.pk: exception} of the failed ones
+        """
+        updated, errors = 0, {}
+        for channel_id, queryset in self.uploaded().by_channel():
+            api = YTApi(channel_id=channel_id)
+            for videos in chunked(queryset.iterator(), batch_size):
+                changed = []
+
+                def callback(video, response, exception):
+                    if exception is not None:
+                        errors[video.pk] = exception
+                    else:
+                        video.update_from_resource(response)
+                        changed.append(video)
+
+                api.update_videos(videos, callback, batch_size=batch_size)
+                self.model.objects.bulk_update(changed, YTVideo.RESOURCE_FIELDS)
+                YTTag.objects.index(changed)
+                updated += len(changed)
+        return updated, errors
+
+    def pull_from_youtube(self, batch_size=MAX_BATCH_SIZE):
+        """
+        Update YTVideo of this queryset from their YouTube videos, fetched
+        by batched videos.list calls, with one bulk_update per batch.
+
+        return: updated, errors
+            updated: number of updated videos
+            errors: list of exceptions of failed videos.list calls
+        """
+        updated, errors = 0, []
+        for channel_id, queryset in self.uploaded().by_channel():
+            api = YTApi(channel_id=channel_id)
+            for videos in chunked(queryset.iterator(), batch_size * MAX_LIST_IDS):
+                by_video_id = {video.video_id: video for video in videos}
+                changed = []
+
+                def callback(response, exception):
+                    if exception is not None:
+                        errors.append(exception)
+                        return
+                    for resource in response.get('items', []):
+                        video = by_video_id.get(resource['id'])
+                        if video is not None:
+                            video.update_from_resource(resource)
+                            changed.append(video)
+
+                api.list_videos(list(by_video_id), callback, batch_size=batch_size)
+                self.model.objects.bulk_update(changed, YTVideo.RESOURCE_FIELDS)
+                YTTag.objects.index(changed)
+                updated += len(changed)
+        return updated, errors
+
+    def sync_page(self, resources, create=False, channel_id=None):
+        """
+        Reconcile YTVideo rows with a page of YouTube video resources, see
+        YTApi.channel_video_pages(). The rows of the page are fetched with
+        one query on the video_id index and only changed rows are written,
+        with one bulk_update.
+
+        With `create`, rows are created for videos missing in the database,
+        on the YTChannel `channel_id`.
+
+        return: updated, missing
+            updated: number of updated rows
+            missing: ids of videos which have no row
+        """
+        by_video_id = {resource['id']: resource for resource in resources}
+        changed = []
+        for video in self.filter(video_id__in=list(by_video_id)):
+            before = video.resource_values()
+            video.update_from_resource(by_video_id.pop(video.video_id))
+            if video.resource_values() != before:
+                changed.append(video)
+        self.model.objects.bulk_update(changed, YTVideo.RESOURCE_FIELDS)
+        YTTag.objects.index(changed)
+
+        if create and by_video_id:
+            created = []
+            for video_id, resource in by_video_id.items():
+                video = self.model(video_id=video_id, channel_id=channel_id)
+                video.update_from_resource(resource)
+                created.append(video)
+            self.model.objects.bulk_create(created)
+            # pks aren't set by bulk_create on every backend
+            YTTag.objects.index(
+                self.model.objects.filter(video_id__in=list(by_video_id)).only('pk', 'tags'))
+        return len(changed), list(by_video_id)
+
+    def processing_due(self):
+        return self.uploaded().filter(processing_check_at__lte=now())
+
+    def poll_processing(self, limit=MAX_BATCH_SIZE * MAX_LIST_IDS, schedule=None):
+        """
+        Check the processing status of up to `limit` videos whose check is
+        due, with batched videos.list calls of MAX_LIST_IDS videos, and
+        store it with one bulk_update. Videos which are not done yet are
+        checked again after the delay of `schedule`.
+
+        return: checked, done
+            checked: number of checked videos
+            done: YTVideo which finished processing
+        """
+        schedule = schedule or PollSchedule.from_settings()
+        videos = list(self.processing_due().order_by('processing_check_at')[:limit])
+        if not videos:
+            return 0, []
+        by_video_id = {video.video_id: video for video in videos}
+
+        def callback(response, exception):
+            # failed calls are checked again with the next interval
+            if exception is None:
+                for resource in response.get('items', []):
+                    video = by_video_id.get(resource['id'])
+                    if video is not None:
+                        video.update_from_resource(resource)
+
+        by_channel = {}
+        for video in videos:
+            by_channel.setdefault(video.channel_id, []).append(video.video_id)
+        for channel_id, video_ids in by_channel.items():
+            YTApi(channel_id=channel_id).list_videos(
+                video_ids, callback, part=PROCESSING_PART, fields=PROCESSING_FIELDS)
+
+        done = []
+        for video in videos:
+            video.processing_checks += 1
+            if video.processing_done:
+                video.processing_check_at = None
+                done.append(video)
+            else:
+                video.processing_check_at = now() + timedelta(
+                    seconds=schedule.delay(video.processing_checks))
+        self.model.objects.bulk_update(
+            videos, YTVideo.RESOURCE_FIELDS + ['processing_checks', 'processing_check_at'])
+        return len(videos), done
+
+    def next_processing_check_at(self):
+        return self.uploaded().aggregate(next=models.Min('processing_check_at'))['next']
+
+    def publish_due(self, until=None):
+        """
+        Uploaded private videos whose publish_at is before `until` (default:
+        now) and which weren't published by the scheduler yet, a range scan
+        of the partial index youtube_ytvideo_publish_due. Videos the
+        scheduler gave up on (publish_error) are left out.
+        """
+        return self.uploaded().filter(
+            privacy_status=YTVideo.PrivacyStatus.PRIVATE, published_at=None,
+            publish_at__lte=until or now(), publish_error='')
+
+    def publish(self, batch_size=MAX_BATCH_SIZE):
+        """
+        Make the videos of this queryset which are due public on YouTube:
+        batched videos.update calls of the status part, then one
+        bulk_update of the published videos.
+
+        return: published, failed
+            published: YTVideo made public
+            failed: {YTVideo.pk: retry_at} of the videos that weren't,
+                retry_at is set when the quota was exhausted
+        """
+        published, failed = [], {}
+        for channel_id, queryset in self.publish_due().by_channel():
+            videos = list(queryset)
+            answered = set()
+
+            def callback(video, response, exception):
+                answered.add(video.pk)
+                if exception is not None:
+                    failed[video.pk] = None
+                else:
+                    video.update_from_resource(response)
+                    video.published_at = now()
+                    published.append(video)
+
+            for video in videos:
+                video.privacy_status = YTVideo.PrivacyStatus.PUBLIC
+            try:
+                YTApi(channel_id=channel_id).update_video_statuses(
+                    videos, callback, batch_size=batch_size)
+            except QuotaExhausted as error:
+                for video in videos:
+                    if video.pk not in answered:
+                        failed[video.pk] = error.retry_at
+            except (Exception, YTApiError):
+                for video in videos:
+                    if video.pk not in answered:
+                        failed[video.pk] = None
+        self.model.objects.bulk_update(published, YTVideo.RESOURCE_FIELDS + ['published_at'])
+        return published, failed
+
+
+def default_publish_at():
+    """publish_at of a new video, YTVideo.publish_at_day_after days from now."""
+    return now() + timedelta(days=YTVideo.publish_at_day_after)
+
 
 class YTVideo(TimeStampedModel):
     """Video
@@ -24,10 +410,24 @@ class YTVideo(TimeStampedModel):
         UNLISTED = 'unlisted', _('Unlisted')
         PUBLIC = 'public', _('Public')
 
+    class TranscodeAction(models.TextChoices):
+        NONE = 'none', _('None')
+        REMUX = 'remux', _('Remux')
+        TRANSCODE = 'transcode', _('Transcode')
+        FAILED = 'failed', _('Failed')
+
     publish_at_day_after = 15
 
+    # fields set from the YouTube video resource, see update_from_resource()
+    RESOURCE_FIELDS = ['title', 'description', 'tags', 'category_id', 'privacy_status',
+                       'embeddable', 'made_for_kids', 'publish_at', 'youtube_url',
+                       'upload_status', 'processing_status']
+
     user = models.ForeignKey(
         User, on_delete=models.SET_NULL, null=True, help_text=_("User who uploaded video"))
+    channel = models.ForeignKey(
+        YTChannel, on_delete=models.PROTECT, null=True, blank=True, related_name='videos',
+        help_text=_("Channel of the video, empty for the channel of YOUTUBE_API_CONFIG"))
     video_id = models.CharField(
         max_length=255, unique=True, null=True, blank=True, help_text=_("YouTube video id"))
     title = models.CharField(max_length=100, blank=False, help_text=_(
@@ -38,6 +438,9 @@ class YTVideo(TimeStampedModel):
         "and may contain all valid UTF-8 characters except < and >."))
     tags = models.CharField(
         max_length=255, blank=True, help_text=_("Comma seperated tags"))
+    tag_set = models.ManyToManyField(
+        YTTag, blank=True, related_name='videos', help_text=_(
+            "Normalized tags of `tags`, set when the video is saved"))
     category_id = models.SmallIntegerField(choices=VideoCategory.choices,
                                            default=VideoCategory.PEOPLE_AND_BLOG, help_text=_(
                                                "The YouTube video category associated with the video."
@@ -45,10 +448,14 @@ class YTVideo(TimeStampedModel):
                                                "and are updating the snippet part of a video resource."))
     privacy_status = models.CharField(max_length=10, choices=PrivacyStatus.choices,
                                       default=PrivacyStatus.PRIVATE, help_text=_("The video's privacy status."))
-    publish_at = models.DateTimeField(default=now() + timedelta(days=publish_at_day_after), help_text=_(
+    publish_at = models.DateTimeField(default=default_publish_at, help_text=_(
         "The date and time when the video is scheduled to publish. "
         "It can be set only if the privacy status of the video is private. "
         "The value is specified in ISO 8601 format."))
+    published_at = models.DateTimeField(null=True, blank=True, help_text=_(
+        "Time the publish scheduler made the video public on YouTube"))
+    publish_error = models.CharField(max_length=255, blank=True, help_text=_(
+        "Why the publish scheduler gave up making the video public, clear it to retry"))
     embeddable = models.BooleanField(default=True, help_text=_(
         "This value indicates whether the video can be embedded on another website."))
     made_for_kids = models.BooleanField(default=False, help_text=_(
@@ -60,59 +467,841 @@ class YTVideo(TimeStampedModel):
         "parameter value of True indicates that subscribers will be notified of newly uploaded videos."))
 
     youtube_url = models.URLField(max_length=255, null=True, blank=True)
+    upload_status = models.CharField(max_length=20, blank=True, help_text=_(
+        "The status of the uploaded video on YouTube, i.e. uploaded or processed."))
+    processing_status = models.CharField(max_length=20, blank=True, help_text=_(
+        "The video's processing status on YouTube, i.e. processing or succeeded."))
+    processing_checks = models.PositiveIntegerField(default=0, help_text=_(
+        "Number of processing status checks since the upload"))
+    processing_check_at = models.DateTimeField(null=True, blank=True, db_index=True, help_text=_(
+        "Time of the next processing status check, empty when processing is done"))
 
     file_on_server = models.FileField(upload_to='youtube/videos', null=True,
                                       help_text=_("Temporary file on server for \
                                               using in `direct upload` from \
                                               your server to youtube"))
+    thumbnail = models.ImageField(upload_to='youtube/thumbnails', null=True, blank=True, help_text=_(
+        "Custom thumbnail, it's resized to 1280x720 and recompressed before the upload"))
+    thumbnail_set_at = models.DateTimeField(null=True, blank=True, help_text=_(
+        "Time the thumbnail was set on YouTube"))
+    content_hash = models.CharField(max_length=64, blank=True, db_index=True, help_text=_(
+        "SHA-256 of the video file, an identical file is not uploaded again"))
+    duplicate_of = models.ForeignKey(
+        'self', on_delete=models.SET_NULL, null=True, blank=True, related_name='duplicates',
+        help_text=_("Uploaded video with the same file, this one is not uploaded"))
+    transcode_action = models.CharField(
+        max_length=10, choices=TranscodeAction.choices, blank=True, help_text=_(
+            "Pre-upload stage of the file: remuxed to a faststart MP4, transcoded or "
+            "uploaded as it is, see YOUTUBE_API_CONFIG TRANSCODE"))
+    original_bytes = models.BigIntegerField(null=True, blank=True, help_text=_(
+        "Size of file_on_server before the pre-upload stage"))
+    uploaded_bytes = models.BigIntegerField(null=True, blank=True, help_text=_(
+        "Size of the file sent to YouTube"))
+    probe_seconds = models.FloatField(null=True, blank=True, help_text=_(
+        "Duration of probing the file with ffprobe"))
+    transcode_seconds = models.FloatField(null=True, blank=True, help_text=_(
+        "Duration of remuxing or transcoding the file with ffmpeg"))
+    bulk_import = models.ForeignKey(
+        'BulkImport', on_delete=models.SET_NULL, null=True, blank=True, related_name='videos',
+        help_text=_("Bulk import that created the video, see `manage.py bulk_upload`"))
+    import_line = models.PositiveIntegerField(null=True, blank=True, help_text=_(
+        "Line of the video in the manifest of its bulk import"))
+
+    objects = YTVideoQuerySet.as_manager()
+
+    class Meta:
+        constraints = [
+            models.UniqueConstraint(fields=['bulk_import', 'import_line'],
+                                    name='unique_bulk_import_line'),
+        ]
+        # listing orders, see YTVideoQuerySet.listing()
+        indexes = [
+            models.Index(fields=['user', 'created']),
+            models.Index(fields=['privacy_status', 'publish_at']),
+            # only the videos waiting to be published, see YTVideoQuerySet.publish_due()
+            models.Index(fields=['publish_at'], name='youtube_ytvideo_publish_due',
+                         condition=models.Q(privacy_status='private', published_at=None)),
+        ]
 
     def __str__(self):
         return f"{self.id}:{self.title}"
 
+    @classmethod
+    def from_db(cls, db, field_names, values):
+        instance = super().from_db(db, field_names, values)
+        # tags of the tag_set, see save()
+        instance._indexed_tags = instance.__dict__.get('tags')
+        return instance
+
     def save(self, *args, **kwargs):
+        indexed_tags = getattr(self, '_indexed_tags', '')
         super().save(*args, **kwargs)
+        update_fields = kwargs.get('update_fields')
+        if self.tags != indexed_tags and (update_fields is None or 'tags' in update_fields):
+            YTTag.objects.index([self])
+            self._indexed_tags = self.tags
         if not self.video_id and self.file_on_server:
-            try:
-                self.upload_to_youtube()
-            except Exception as error:
-                raise error
+            self.enqueue_upload()
 
+    def enqueue_upload(self):
+        """
+        Queue this video for upload by the background upload worker.
 
-    def upload_to_youtube(self):
+        Upload is not done in the request worker anymore, see
+        `manage.py upload_worker`. It returns the active UploadJob of this
+        video, a new one is created only if there is no active job.
+        """
+        job = self.upload_jobs.active().first()
+        if job is None:
+            job = self.upload_jobs.create()
+        return job
+
+    def upload_to_youtube(self, job=None, on_progress=None):
         """
         Upload video file to Youtube and update YTVideo instance.
 
-        If raised any exception it delete the instance including video file 
-        because this function may be called after super().save() method.
+        It is called by UploadJob.run() from the upload worker. Any exception
+        is propagated to the caller so that the job can record the failure;
+        the instance and the video file are kept for a later retry.
+
+        The upload session of `job` is persisted by `on_progress` (default:
+        after every chunk), so an upload interrupted by a worker restart
+        resumes from the last acknowledged byte.
+
+        A file with the content hash of an uploaded video is not uploaded
+        again, the video is linked to that one (`duplicate_of`).
 
         If upload success then it delete video file from server and update 
         YTVideo instance
         """
-        if not self.video_id and self.file_on_server.path:
-            api = YTApi()
-            try:
+        if not self.video_id and not self.file_on_server:
+            raise OperationError(f"YTVideo {self.id} has no file to upload")
+        if not self.video_id and self.link_duplicate():
+            return
+        thumbnail = None
+        if not self.video_id and self.file_on_server:
+            # the thumbnail is prepared by another process during the upload
+            thumbnail = self.submit_thumbnail()
+            resumable_uri = job.session_uri if job else None
+            media_file, fresh = self.prepare_media()
+            if fresh and resumable_uri:
+                # the session was started with other bytes
+                resumable_uri = None
+            api = YTApi(channel_id=self.channel_id)
+            with metrics().stage('upload', video=self.id, job=job.id if job else None):
                 success, response = api.initialize_upload(
-                    self, self.file_on_server.path)
-            except Exception as error:
-                self.delete()
-                raise error
-            if success:
-                self.video_id = response['id']
-                try:
-                    self.file_on_server.delete(save=False)
-                except Exception as error:
-                    raise error
-                self.save()
+                    self, media_file, resumable_uri=resumable_uri,
+                    on_progress=on_progress or (job.save_upload_progress if job else None))
+            if not success:
+                raise YTApiError(
+                    f"YouTube upload failed with unexpected response: {response}")
+            self.video_id = response['id']
+            self.track_processing()
+            if media_file != self.file_on_server.path:
+                transcode_pipeline().discard(self.pk)
+            self.file_on_server.delete(save=False)
+            self.save()
+        if self.thumbnail and self.thumbnail_set_at is None:
+            try:
+                self.set_thumbnail(thumbnail)
+            except ThumbnailError as error:
+                # the video is on YouTube, it keeps the default thumbnail
+                logger.warning("Thumbnail of YTVideo %s not set: %s", self.pk, error)
+
+    def prepare_media(self):
+        """
+        Path of the file to upload: with YOUTUBE_API_CONFIG TRANSCODE,
+        file_on_server remuxed to a faststart MP4 or transcoded when it's
+        over TRANSCODE_MAX_BITRATE by the TranscodePipeline, file_on_server
+        otherwise or when that failed. The sizes and durations are saved.
+
+        return: (path, fresh) where `fresh` tells the file to upload differs
+            from the one of an earlier attempt
+        """
+        path = self.file_on_server.path
+        if not settings.YOUTUBE_API_CONFIG.get('TRANSCODE', False):
+            return path, False
+        previous = self.transcode_action
+        try:
+            with metrics().stage('transcode', video=self.id) as stage:
+                prepared = transcode_pipeline().submit(path, self.pk).result()
+                stage.bytes = prepared.source_bytes
+        except (Exception, TranscodeError) as error:
+            logger.warning("YTVideo %s is uploaded as it is, transcoding failed: %s", self.pk, error)
+            self.transcode_action = YTVideo.TranscodeAction.FAILED
+            self.original_bytes = self.uploaded_bytes = self.file_on_server.size
+            self.save(update_fields=['transcode_action', 'original_bytes', 'uploaded_bytes'])
+            return path, previous in (REMUX, TRANSCODE)
+        if not prepared.reused:
+            self.transcode_action = prepared.action
+            self.original_bytes = prepared.source_bytes
+            self.uploaded_bytes = prepared.output_bytes
+            self.probe_seconds = prepared.probe_seconds
+            self.transcode_seconds = prepared.ffmpeg_seconds
+            self.save(update_fields=['transcode_action', 'original_bytes', 'uploaded_bytes',
+                                     'probe_seconds', 'transcode_seconds'])
+            metrics().inc('youtube_transcode_saved_bytes_total',
+                          max(0, prepared.source_bytes - prepared.output_bytes),
+                          action=prepared.action)
+        fresh = not prepared.reused and (prepared.action != NONE or previous in (REMUX, TRANSCODE))
+        return prepared.path, fresh
+
+    @property
+    def saved_bytes(self):
+        """Bytes the pre-upload stage saved, None when it didn't run."""
+        if self.original_bytes is None or self.uploaded_bytes is None:
+            return None
+        return self.original_bytes - self.uploaded_bytes
+
+    def link_duplicate(self):
+        """
+        Link this video to an uploaded video of its channel with the same
+        content hash instead of uploading the file again.
+
+        return: True when linked
+        """
+        if not self.content_hash:
+            return False
+        original = YTVideo.objects.uploaded().filter(
+            content_hash=self.content_hash, channel_id=self.channel_id,
+        ).exclude(pk=self.pk).order_by('pk').first()
+        if original is None:
+            return False
+        self.duplicate_of = original
+        self.youtube_url = original.youtube_url
+        if self.file_on_server:
+            self.file_on_server.delete(save=False)
+        self.save()
+        return True
+
+    @property
+    def youtube_video_id(self):
+        """YouTube video id of this video or of the video it duplicates."""
+        if self.video_id or self.duplicate_of_id is None:
+            return self.video_id
+        return self.duplicate_of.video_id
+
+    def submit_thumbnail(self):
+        """
+        Start preparing the thumbnail in the ThumbnailPipeline.
+
+        return: Future of the prepared thumbnail path, None if there is
+            no thumbnail to set
+        """
+        if not self.thumbnail or self.thumbnail_set_at is not None:
+            return None
+        return thumbnail_pipeline().submit(self.thumbnail.path)
+
+    def set_thumbnail(self, prepared=None):
+        """
+        Set the thumbnail of the uploaded video on YouTube.
+
+        `prepared` is the Future of submit_thumbnail(), without it the
+        thumbnail is prepared in this thread (or taken from the cache).
+        Raises:
+            ThumbnailError: on an invalid or too large image
+        """
+        # waiting for the pipeline is the time the upload didn't hide
+        with metrics().stage('thumbnail_prepare', video=self.id):
+            if prepared is None:
+                path = prepare_thumbnail(self.thumbnail.path, thumbnail_pipeline().cache_dir)
             else:
-                self.delete()
-                raise Exception(
-                    "YouTube upload failed! Then YTVideo instance deleted.")
+                path = prepared.result()
+        YTApi(channel_id=self.channel_id).set_video_thumbnail(self.video_id, path)
+        self.thumbnail_set_at = now()
+        self.save(update_fields=['thumbnail_set_at'])
+
+    def track_processing(self):
+        """
+        Schedule processing status checks of a just uploaded video, see
+        `manage.py track_processing`. It's not saved.
+        """
+        self.upload_status = 'uploaded'
+        self.processing_status = 'processing'
+        self.processing_checks = 0
+        self.processing_check_at = now() + timedelta(seconds=PollSchedule.from_settings().delay(0))
+
+    @property
+    def processing_done(self):
+        return processing_done(self.upload_status, self.processing_status)
+
+    def update_from_resource(self, resource):
+        """
+        Set RESOURCE_FIELDS from the snippet and status of a YouTube video resource.
+        See: https://developers.google.com/youtube/v3/docs/videos#resource
+        """
+        snippet = resource.get('snippet', {})
+        status = resource.get('status', {})
+        self.title = snippet.get('title', self.title)
+        self.description = snippet.get('description', self.description)
+        if 'tags' in snippet:
+            self.tags = ','.join(snippet['tags'])[:self._meta.get_field('tags').max_length]
+        if 'categoryId' in snippet:
+            self.category_id = int(snippet['categoryId'])
+        self.privacy_status = status.get('privacyStatus', self.privacy_status)
+        self.embeddable = status.get('embeddable', self.embeddable)
+        self.made_for_kids = status.get('madeForKids', self.made_for_kids)
+        if status.get('publishAt'):
+            self.publish_at = parse_datetime(status['publishAt'])
+        self.upload_status = status.get('uploadStatus', self.upload_status)
+        self.processing_status = resource.get('processingDetails', {}).get(
+            'processingStatus', self.processing_status)
+        if resource.get('id'):
+            self.youtube_url = f"https://www.youtube.com/watch?v={resource['id']}"
+
+    def resource_values(self):
+        return [getattr(self, field) for field in YTVideo.RESOURCE_FIELDS]
 
     @property
     def publish_at_iso(self):
         return self.publish_at.isoformat()
 
 
+# worker_id of jobs whose file is streamed by the browser to YouTube through
+# the web workers, see UploadJob.upload_stream_chunk()
+STREAM_WORKER_ID = 'stream'
+
+
+class UploadJobQuerySet(models.QuerySet):
+    def active(self):
+        return self.filter(status__in=[UploadJob.Status.PENDING, UploadJob.Status.RUNNING])
+
+    def claim(self, worker_id, limit=1):
+        """
+        Claim up to `limit` pending jobs for `worker_id`.
+
+        Candidates are selected with `SELECT ... FOR UPDATE SKIP LOCKED` so
+        concurrent workers never wait on each other's rows. The conditional
+        UPDATE makes the claim safe on backends without row locking
+        (i.e. SQLite) as well. Jobs rescheduled by a retry are not claimed
+        before their `available_at`.
+
+        return: list of claimed UploadJob with related video
+        """
+        with transaction.atomic():
+            ids = list(
+                self.filter(status=UploadJob.Status.PENDING, available_at__lte=now())
+                .order_by('available_at')
+                .select_for_update(skip_locked=True)
+                .values_list('pk', flat=True)[:limit]
+            )
+            if not ids:
+                return []
+            self.filter(pk__in=ids, status=UploadJob.Status.PENDING).update(
+                status=UploadJob.Status.RUNNING,
+                worker_id=worker_id,
+                claimed_at=now(),
+                attempts=F('attempts') + 1,
+            )
+        return list(
+            self.filter(pk__in=ids, status=UploadJob.Status.RUNNING,
+                        worker_id=worker_id).select_related('video')
+        )
+
+    def next_available_at(self):
+        """
+        Time the next pending job can be claimed at, None if there is none.
+        """
+        return self.filter(status=UploadJob.Status.PENDING).aggregate(
+            next=models.Min('available_at'))['next']
+
+    def release_stale(self, older_than):
+        """
+        Put back RUNNING jobs without a heartbeat since `older_than` (i.e.
+        their worker died) to PENDING. `claimed_at` is refreshed whenever an
+        upload saves its progress, see UploadJob.save_upload_progress().
+        Streamed uploads are driven by their client, not by a worker, they
+        are left alone.
+
+        return: number of released jobs
+        """
+        return self.filter(status=UploadJob.Status.RUNNING, claimed_at__lt=older_than).exclude(
+            worker_id=STREAM_WORKER_ID).update(status=UploadJob.Status.PENDING, worker_id='')
+
+
+class UploadJob(TimeStampedModel):
+    """UploadJob
+    Durable queue entry of a YTVideo waiting to be uploaded to YouTube.
+    Jobs are claimed and processed by `manage.py upload_worker`.
+    """
+    class Status(models.TextChoices):
+        PENDING = 'pending', _('Pending')
+        RUNNING = 'running', _('Running')
+        SUCCEEDED = 'succeeded', _('Succeeded')
+        FAILED = 'failed', _('Failed')
+
+    video = models.ForeignKey(
+        YTVideo, on_delete=models.CASCADE, related_name='upload_jobs', help_text=_("Video to upload"))
+    status = models.CharField(max_length=10, choices=Status.choices,
+                              default=Status.PENDING, help_text=_("Status of the upload job"))
+    attempts = models.PositiveIntegerField(
+        default=0, help_text=_("Number of times the job was claimed by a worker"))
+    worker_id = models.CharField(max_length=255, blank=True, help_text=_(
+        "Worker which claimed the job"))
+    claimed_at = models.DateTimeField(null=True, blank=True)
+    finished_at = models.DateTimeField(null=True, blank=True)
+    last_error = models.TextField(blank=True)
+    session_uri = models.TextField(blank=True, help_text=_(
+        "Resumable upload session URI, used to resume an interrupted upload"))
+    bytes_uploaded = models.BigIntegerField(default=0, help_text=_(
+        "Last byte offset acknowledged by YouTube"))
+    total_bytes = models.BigIntegerField(null=True, blank=True)
+    available_at = models.DateTimeField(default=now, help_text=_(
+        "The job is not claimed before this time, it's postponed by retries"))
+    failure = models.JSONField(null=True, blank=True, help_text=_(
+        "Details of the error the job failed with"))
+
+    objects = UploadJobQuerySet.as_manager()
+
+    class Meta:
+        indexes = [
+            models.Index(fields=['status', 'available_at']),
+        ]
+
+    def __str__(self):
+        return f"{self.id}:{self.video_id}:{self.status}"
+
+    @property
+    def duration(self):
+        """Seconds from queueing the upload until it finished on YouTube."""
+        if self.finished_at is None:
+            return None
+        return (self.finished_at - self.created).total_seconds()
+
+    @property
+    def channel_key(self):
+        """
+        Key of the YouTube channel (credential) the video is uploaded with,
+        used to limit concurrent uploads per channel.
+        """
+        if self.video.channel_id is not None:
+            return f'channel:{self.video.channel_id}'
+        return settings.YOUTUBE_API_CONFIG.get('CLIENT_SECRET_FILE')
+
+    def run(self, retry_policy=None):
+        """
+        Upload the video of this job and record the result.
+
+        A retriable error reschedules the job to PENDING after the delay
+        told by `retry_policy`, the next attempt resumes the upload session.
+        A job denied by the quota ledger is postponed until quota is available.
+        When the policy gives up, or on any other error, the job FAILED
+        and `failure` tells why.
+
+        return: True on success otherwise False
+        """
+        retry_policy = retry_policy or RetryPolicy.from_settings()
+        update_fields = ['status', 'last_error', 'failure', 'finished_at']
+        self.failure = None
+        progress = self.progress_reporter()
+        progress.publish()
+        try:
+            self.video.upload_to_youtube(job=self, on_progress=progress)
+        except QuotaExhausted as deferral:
+            # not a failed attempt, the upload was not sent
+            self.status = UploadJob.Status.PENDING
+            self.last_error = str(deferral)
+            self.worker_id = ''
+            self.available_at = deferral.retry_at
+            self.attempts = max(self.attempts - 1, 0)
+            update_fields = ['status', 'last_error', 'failure', 'worker_id', 'available_at',
+                             'attempts']
+        except UploadRetryLater as retry:
+            elapsed = (now() - self.created).total_seconds()
+            delay = retry_policy.next_delay(retry.error_class, self.attempts, elapsed)
+            self.last_error = f"{type(retry.error).__name__}: {retry.error}"
+            if delay is None:
+                self.status = UploadJob.Status.FAILED
+                self.failure = failure_details(
+                    retry.error, retry.error_class, self.attempts, elapsed)
+            else:
+                self.status = UploadJob.Status.PENDING
+                self.worker_id = ''
+                self.available_at = now() + timedelta(seconds=delay)
+                update_fields = ['status', 'last_error', 'failure', 'worker_id', 'available_at']
+        except (Exception, OperationError, YTApiError, ThumbnailError, TokenError) as error:
+            self.status = UploadJob.Status.FAILED
+            self.last_error = f"{type(error).__name__}: {error}"
+            self.failure = getattr(error, 'failure', None) or failure_details(
+                error, ErrorClass.FATAL, self.attempts, (now() - self.created).total_seconds())
+        else:
+            self.status = UploadJob.Status.SUCCEEDED
+            self.last_error = ''
+        if self.status != UploadJob.Status.PENDING:
+            self.finished_at = now()
+        # progress since the last coalesced save
+        self.bytes_uploaded = progress.state['bytes_uploaded']
+        if self.status == UploadJob.Status.SUCCEEDED and self.total_bytes:
+            self.bytes_uploaded = self.total_bytes
+        self.save(update_fields=update_fields + ['bytes_uploaded'])
+        metrics().inc('youtube_upload_jobs_total', status=self.status)
+        progress.publish(status=self.status, bytes_uploaded=self.bytes_uploaded,
+                         retries=max(self.attempts - 1, 0), error=self.last_error)
+        return self.status == UploadJob.Status.SUCCEEDED
+
+    def progress_reporter(self, **kwargs):
+        """
+        ProgressReporter of an upload of this job, it publishes to the
+        ProgressStore and persists the upload session with coalesced writes.
+        """
+        config = settings.YOUTUBE_API_CONFIG
+        kwargs.setdefault('interval', config.get('PROGRESS_INTERVAL', 1.0))
+        kwargs.setdefault('persist_interval', config.get('PROGRESS_PERSIST_INTERVAL', 30.0))
+        progress = ProgressReporter(
+            self.id, ProgressStore(), persist=self.save_upload_progress,
+            user_id=self.video.user_id, attempts=self.attempts, **kwargs)
+        progress.state.update(bytes_uploaded=self.bytes_uploaded, total_bytes=self.total_bytes)
+        return progress
+
+    def progress(self):
+        """
+        Live progress of this job, see ProgressReporter.state.
+        """
+        state = ProgressStore().get(self.id)
+        if state is None:
+            state = self.progress_reporter().state
+        state.update(status=self.status, error=self.last_error)
+        return state
+
+    def upload_stream_chunk(self, data, offset, mimetype):
+        """
+        Forward a chunk of a file streamed by the browser to the YouTube
+        upload session of this job, see YTApi.upload_chunk().
+
+        return: True when the upload is complete otherwise False
+        """
+        api = YTApi(channel_id=self.video.channel_id)
+        session_uri, bytes_uploaded, response = api.upload_chunk(
+            self.video, data, offset, self.total_bytes, mimetype,
+            resumable_uri=self.session_uri or None)
+        self.save_stream_progress(session_uri, bytes_uploaded, self.total_bytes)
+        if response is None:
+            return False
+        self.finish_stream_upload(response)
+        return True
+
+    def finish_stream_upload(self, response):
+        """
+        Store the video resource YouTube returned after the last chunk of a
+        streamed upload.
+        """
+        if 'id' not in response:
+            raise YTApiError(
+                f"YouTube upload failed with unexpected response: {response}")
+        self.video.video_id = response['id']
+        self.video.track_processing()
+        self.video.save()
+        self.status = UploadJob.Status.SUCCEEDED
+        self.finished_at = now()
+        self.bytes_uploaded = self.total_bytes or self.bytes_uploaded
+        self.save(update_fields=['status', 'finished_at', 'bytes_uploaded'])
+        progress = self.progress_reporter()
+        progress.continue_from(ProgressStore().get(self.id))
+        progress.publish(status=self.status, bytes_uploaded=self.bytes_uploaded, eta=0)
+
+    def save_stream_progress(self, session_uri, bytes_uploaded, total_bytes):
+        """
+        Persist and publish the progress of a streamed upload after a chunk.
+
+        Every chunk is persisted, the next chunk request is checked against
+        `bytes_uploaded`. The rate continues the one published after the
+        previous chunk, possibly by another web process.
+        """
+        progress = self.progress_reporter(interval=0, persist_interval=0, clock=time.time)
+        progress.continue_from(ProgressStore().get(self.id))
+        progress(session_uri, bytes_uploaded, total_bytes)
+
+    def save_upload_progress(self, session_uri, bytes_uploaded, total_bytes):
+        """
+        Persist the resumable upload session, see YTApi.initialize_upload().
+        It's the heartbeat of the job too: a running job is released as
+        stale only when its claimed_at isn't refreshed.
+        """
+        self.session_uri = session_uri or ''
+        self.bytes_uploaded = bytes_uploaded
+        self.total_bytes = total_bytes
+        self.claimed_at = now()
+        self.save(update_fields=['session_uri', 'bytes_uploaded', 'total_bytes', 'claimed_at'])
+
+
+class BulkImport(TimeStampedModel):
+    """BulkImport
+    Videos of a manifest imported by `manage.py bulk_upload`. The rows are
+    created batch by batch, the number of imported rows is saved with every
+    batch so an interrupted import resumes after the last saved batch.
+    """
+    # manifest columns, `file` and `thumbnail` are paths relative to the manifest
+    MANIFEST_COLUMNS = ['file', 'title', 'description', 'tags', 'category_id', 'privacy_status',
+                        'publish_at', 'embeddable', 'made_for_kids', 'notify_subscribers',
+                        'thumbnail']
+    BOOLEAN_COLUMNS = ['embeddable', 'made_for_kids', 'notify_subscribers']
+    MAX_DESCRIPTION_BYTES = 5000
+
+    user = models.ForeignKey(
+        User, on_delete=models.CASCADE, related_name='youtube_imports',
+        help_text=_("Owner of the imported videos"))
+    channel = models.ForeignKey(
+        YTChannel, on_delete=models.PROTECT, null=True, blank=True, related_name='imports',
+        help_text=_("Channel of the imported videos"))
+    manifest = models.CharField(max_length=1024, help_text=_("Path of the manifest"))
+    manifest_hash = models.CharField(max_length=64, db_index=True, help_text=_(
+        "SHA-256 of the manifest, importing the same manifest again resumes this import"))
+    rows = models.PositiveIntegerField(default=0, help_text=_("Number of videos in the manifest"))
+    rows_done = models.PositiveIntegerField(default=0, help_text=_(
+        "Number of videos imported, the first rows of the manifest"))
+    publish_start = models.DateTimeField(help_text=_("publish_at of the first spread video"))
+    publish_interval = models.DurationField(help_text=_(
+        "Time between the publish_at of spread videos"))
+    finished_at = models.DateTimeField(null=True, blank=True)
+
+    def __str__(self):
+        return f"{self.id}:{self.manifest}:{self.rows_done}/{self.rows}"
+
+    @classmethod
+    def clean_row(cls, row, line, base_dir, imported=False):
+        """
+        Validate a manifest row against the limits of YouTube, without
+        reading its files. The publish_at of a row `imported` by an
+        interrupted import may have passed since, it isn't checked.
+
+        return: dict of YTVideo field values, `file` and `thumbnail` are
+            absolute paths
+        Raises:
+            ManifestError: on an invalid row
+        """
+        unknown = set(row) - set(cls.MANIFEST_COLUMNS)
+        if unknown:
+            raise ManifestError(f"Unknown columns {', '.join(sorted(unknown))}", line)
+
+        values = {}
+        for column in ['file', 'thumbnail']:
+            if column in row:
+                path = os.path.join(base_dir, os.path.expanduser(str(row[column])))
+                if not os.path.isfile(path):
+                    raise ManifestError(f"{column} {path} is not a file", line)
+                values[column] = path
+        if 'file' not in values:
+            raise ManifestError("file is required", line)
+        if not os.path.getsize(values['file']):
+            raise ManifestError(f"file {values['file']} is empty", line)
+
+        values['title'] = str(row.get('title', ''))
+        values['description'] = str(row.get('description', ''))
+        if not values['title']:
+            raise ManifestError("title is required", line)
+        if len(values['title']) > YTVideo._meta.get_field('title').max_length:
+            raise ManifestError("title is longer than 100 characters", line)
+        if len(values['description'].encode()) > cls.MAX_DESCRIPTION_BYTES:
+            raise ManifestError(f"description is longer than {cls.MAX_DESCRIPTION_BYTES} bytes", line)
+        for column in ['title', 'description']:
+            if '<' in values[column] or '>' in values[column]:
+                raise ManifestError(f"{column} contains < or >", line)
+
+        tags = row.get('tags', '')
+        if isinstance(tags, list):
+            tags = ','.join(str(tag).strip() for tag in tags)
+        values['tags'] = str(tags)
+        if len(values['tags']) > YTVideo._meta.get_field('tags').max_length:
+            raise ManifestError("tags are longer than 255 characters", line)
+
+        try:
+            values['category_id'] = int(row.get('category_id', YTVideo.VideoCategory.PEOPLE_AND_BLOG))
+        except (TypeError, ValueError):
+            raise ManifestError(f"Invalid category_id {row['category_id']}", line)
+        if values['category_id'] not in YTVideo.VideoCategory.values:
+            raise ManifestError(f"Unknown category_id {values['category_id']}", line)
+        values['privacy_status'] = str(row.get('privacy_status', YTVideo.PrivacyStatus.PRIVATE))
+        if values['privacy_status'] not in YTVideo.PrivacyStatus.values:
+            raise ManifestError(f"Unknown privacy_status {values['privacy_status']}", line)
+
+        if 'publish_at' in row:
+            try:
+                publish_at = parse_datetime(str(row['publish_at']))
+            except ValueError:
+                publish_at = None
+            if publish_at is None:
+                raise ManifestError(f"Invalid publish_at {row['publish_at']}", line)
+            if is_naive(publish_at):
+                publish_at = make_aware(publish_at)
+            if publish_at <= now() and not imported:
+                raise ManifestError("publish_at is in the past", line)
+            if values['privacy_status'] != YTVideo.PrivacyStatus.PRIVATE:
+                raise ManifestError("publish_at can be set only on private videos", line)
+            values['publish_at'] = publish_at
+
+        for column in cls.BOOLEAN_COLUMNS:
+            if column in row:
+                value = row[column]
+                if isinstance(value, str):
+                    value = {'true': True, 'yes': True, '1': True,
+                             'false': False, 'no': False, '0': False}.get(value.lower())
+                if not isinstance(value, bool):
+                    raise ManifestError(f"Invalid {column} {row[column]}, true or false", line)
+                values[column] = value
+        return values
+
+    def publish_at(self, index):
+        """publish_at of the `index`-th video without one, spread from publish_start."""
+        return publish_slot(self.publish_start, self.publish_interval, index)
+
+    def import_batch(self, rows, workers=4):
+        """
+        Create the videos of a batch of cleaned manifest rows [(line, values)]
+        and queue their upload.
+
+        The files are linked (or copied) into MEDIA_ROOT and hashed by
+        `workers` threads first; then the videos, their UploadJobs and
+        `rows_done` are saved in one transaction with bulk inserts, so a
+        batch is imported whole or not at all. YTVideo.save() is not called,
+        the uploads are queued here for the upload workers.
+
+        return: number of imported videos
+        """
+        storage = YTVideo.file_on_server.field.storage
+
+        def place(row):
+            line, values = row
+            values = dict(values)
+            file, thumbnail = values.pop('file'), values.pop('thumbnail', None)
+            # ids, related rows would be queried in the threads
+            video = YTVideo(user_id=self.user_id, channel_id=self.channel_id, bulk_import=self,
+                            import_line=line, **values)
+            name = f"youtube/videos/import-{self.pk}/{line}{os.path.splitext(file)[1]}"
+            video.content_hash = place_file(file, storage.path(name))
+            video.file_on_server = name
+            if thumbnail:
+                name = f"youtube/thumbnails/import-{self.pk}/{line}{os.path.splitext(thumbnail)[1]}"
+                place_file(thumbnail, storage.path(name))
+                video.thumbnail = name
+            return video
+
+        with ThreadPoolExecutor(max_workers=workers) as executor:
+            videos = list(executor.map(place, rows))
+        with transaction.atomic():
+            YTVideo.objects.bulk_create(videos)
+            # pks aren't set by bulk_create on every backend
+            ids = YTVideo.objects.filter(
+                bulk_import=self, import_line__in=[line for line, _ in rows],
+            ).order_by('import_line').values_list('pk', flat=True)
+            UploadJob.objects.bulk_create([UploadJob(video_id=pk) for pk in ids])
+            YTTag.objects.index(YTVideo.objects.filter(pk__in=list(ids)).only('pk', 'tags'))
+            BulkImport.objects.filter(pk=self.pk).update(rows_done=F('rows_done') + len(rows))
+        self.rows_done += len(rows)
+        return len(videos)
+
+
+class QuotaBucketQuerySet(models.QuerySet):
+    # conditional updates lost to concurrent processes before giving up
+    RESERVE_ATTEMPTS = 5
+
+    def reserve(self, key, method_id, config=None):
+        """
+        Reserve the quota of one call of `method_id` before it's sent, or of
+        all calls of a batch HTTP request when it's a list of method ids:
+        their units are booked together or not at all, and the batch takes
+        one request token.
+
+        The quota units of the day are booked and a token is taken from the
+        request rate bucket of `key` in one conditional UPDATE, so processes
+        sharing the database never book more than the budget.
+
+        return: None when reserved, otherwise the time to retry at
+        """
+        config = config or QuotaConfig.from_settings()
+        calls = Counter([method_id] if isinstance(method_id, str) else method_id)
+        cost = sum(quota_cost(method) * count for method, count in calls.items())
+        for attempt in range(self.RESERVE_ATTEMPTS):
+            current = now()
+            today = quota_day(current)
+            bucket = self.get_or_create(
+                key=key, defaults={'day': today, 'tokens': config.burst, 'refilled_at': current})[0]
+            used = bucket.used if bucket.day == today else 0
+            if config.daily_limit and used + cost > config.daily_limit:
+                return next_quota_reset(current)
+
+            tokens = config.burst
+            if config.requests_per_second:
+                elapsed = max((current - bucket.refilled_at).total_seconds(), 0)
+                tokens = min(config.burst, bucket.tokens + elapsed * config.requests_per_second)
+                if tokens < 1:
+                    return current + timedelta(
+                        seconds=(1 - tokens) / config.requests_per_second)
+
+            reserved = self.filter(pk=bucket.pk, version=bucket.version).update(
+                day=today, used=used + cost, tokens=tokens - 1, refilled_at=current,
+                version=F('version') + 1)
+            if reserved:
+                for method, count in calls.items():
+                    QuotaUsage.objects.record(key, today, method, quota_cost(method) * count, count)
+                return None
+        return now() + timedelta(seconds=0.1)
+
+    def exhaust(self, key, config=None):
+        """
+        Book the whole daily quota of `key`, i.e. when YouTube says the quota
+        is exceeded although the ledger does not.
+        """
+        config = config or QuotaConfig.from_settings()
+        if config.daily_limit:
+            self.filter(key=key).update(
+                day=quota_day(), used=config.daily_limit, version=F('version') + 1)
+
+
+class QuotaBucket(models.Model):
+    """QuotaBucket
+    YouTube Data API quota of a Google Cloud project shared by all processes:
+    quota units used on the quota day and a token bucket of requests.
+    See: https://developers.google.com/youtube/v3/getting-started#quota
+    """
+    key = models.CharField(max_length=255, unique=True, help_text=_(
+        "Google Cloud project of the quota, see quota_key()"))
+    day = models.DateField(help_text=_("Quota day (Pacific Time) of `used`"))
+    used = models.PositiveIntegerField(default=0, help_text=_("Quota units used on the day"))
+    tokens = models.FloatField(default=0, help_text=_("Requests left in the bucket"))
+    refilled_at = models.DateTimeField(default=now)
+    version = models.PositiveIntegerField(default=0)
+
+    objects = QuotaBucketQuerySet.as_manager()
+
+    def __str__(self):
+        return f"{self.key}:{self.day}:{self.used}"
+
+
+class QuotaUsageQuerySet(models.QuerySet):
+    def record(self, key, day, method_id, units, calls=1):
+        """
+        Add `calls` calls of `method_id` costing `units` to the ledger.
+        """
+        usage = self.filter(key=key, day=day, method=method_id)
+        if usage.update(calls=F('calls') + calls, units=F('units') + units):
+            return
+        try:
+            with transaction.atomic():
+                self.create(key=key, day=day, method=method_id, calls=calls, units=units)
+        except IntegrityError:
+            # created by a concurrent process meanwhile
+            usage.update(calls=F('calls') + calls, units=F('units') + units)
+
+
+class QuotaUsage(models.Model):
+    """QuotaUsage
+    Ledger of API calls and quota units per method and quota day.
+    """
+    key = models.CharField(max_length=255)
+    day = models.DateField()
+    method = models.CharField(max_length=255, help_text=_("API method, i.e. youtube.videos.insert"))
+    calls = models.PositiveIntegerField(default=0)
+    units = models.PositiveIntegerField(default=0)
+
+    objects = QuotaUsageQuerySet.as_manager()
+
+    class Meta:
+        unique_together = [['key', 'day', 'method']]
+
+    def __str__(self):
+        return f"{self.day}:{self.method}:{self.units}"
+
+
 @receiver(pre_delete, sender=YTVideo)
 def pre_delete_ytvideo_receiver(sender, instance, *args, **kwargs):
     """
@@ -121,6 +1310,8 @@ def pre_delete_ytvideo_receiver(sender, instance, *args, **kwargs):
     try:
         if instance.file_on_server:
             instance.file_on_server.delete(save=False)
+        if instance.transcode_action in (REMUX, TRANSCODE):
+            transcode_pipeline().discard(instance.pk)
     except:
         pass
 
@@ -1,3 +1,1427 @@
-from django.test import TestCase
+import asyncio
+import datetime
+import functools
+import hashlib
+import io
+import json
+import os
+import shutil
+import stat
+import struct
+import tempfile
+import threading
+import time
+import urllib.error
+import urllib.request
+from unittest import mock
 
-# Create your tests here.
+from asgiref.sync import async_to_sync, sync_to_async
+from django.conf import settings
+from django.core.cache import cache
+from django.contrib.auth import get_user_model
+from django.core.files.uploadedfile import SimpleUploadedFile
+from django.core.management import CommandError, call_command
+from django.test import SimpleTestCase, TestCase, override_settings
+from django.urls import reverse
+from django.utils.timezone import now, timedelta
+
+from cryptography.fernet import Fernet
+from google.oauth2.credentials import Credentials
+from PIL import Image
+from googleapiclient.errors import HttpError
+from googleapiclient.http import build_http
+
+from benchmarks import _django
+from core.asgi import application
+from benchmarks.fake_youtube import FakeYouTube
+
+from . import events
+from .apps import check_progress_cache
+from .models import STREAM_WORKER_ID, BulkImport, QuotaBucket, YTChannel, QuotaUsage, UploadJob, YTVideo
+from .uploadhandlers import (ADMISSION_RETRY_AFTER, IngestionPolicy, SpoolFileUploadHandler,
+                             UploadRejected, spool_usage)
+from .utils import api
+from .utils.aio import AsyncYTApi
+from .utils.api import QuotaExhausted, YTApi, YTApiError, reserve_quota
+from .utils.batch import YTBatch
+from .utils.credentials import CredentialPool, TokenError, decrypt_credentials, encrypt_credentials
+from .utils.executor import UploadExecutor, UploadQueueFull
+from .utils.httpcache import DjangoCache, ETagCachingHttp, FileCache, LRUCache
+from .utils.pagination import CursorError, keyset_page
+from .utils.manifest import ManifestError, read_manifest
+from .utils import metrics as metrics_module
+from .utils.media import ChunkSizer, MappedMediaUpload
+from .utils.progress import ProgressReporter, ProgressStore
+from .utils import thumbnail, transcode
+from .utils.quota import QuotaConfig, next_quota_reset, quota_day
+
+# chunks of a resumable upload are a multiple of 256 KiB
+CHUNK_SIZE = 256 * 1024
+
+
+def youtube_config(**values):
+    """override_settings of some values of YOUTUBE_API_CONFIG."""
+    return override_settings(YOUTUBE_API_CONFIG=dict(settings.YOUTUBE_API_CONFIG, **values))
+
+
+class FakeYouTubeTestCase(TestCase):
+    """
+    Tests calling the YouTube API of a FakeYouTube server (see benchmarks)
+    instead of googleapis.com, with the video files in a temporary MEDIA_ROOT.
+    """
+
+    @classmethod
+    def setUpClass(cls):
+        super().setUpClass()
+        cls.media_root = tempfile.mkdtemp()
+        cls.media_override = override_settings(MEDIA_ROOT=cls.media_root)
+        cls.media_override.enable()
+        cls.settings_override = youtube_config(UPLOAD_CHUNK_SIZE=CHUNK_SIZE)
+        cls.settings_override.enable()
+        cls.service_factory = api._service_cache.factory
+
+    @classmethod
+    def tearDownClass(cls):
+        api._service_cache.factory = cls.service_factory
+        api._service_cache.clear()
+        cls.settings_override.disable()
+        cls.media_override.disable()
+        shutil.rmtree(cls.media_root, ignore_errors=True)
+        super().tearDownClass()
+
+    def setUp(self):
+        self.server = FakeYouTube().start()
+        self.addCleanup(self.server.stop)
+        _django.use_fake_youtube(self.server)
+        self.user = get_user_model().objects.create_user('uploader', password='secret')
+
+    def create_video(self, content=None, **fields):
+        """YTVideo with a file of `content` (default: 1 MiB), it queues an UploadJob."""
+        content = os.urandom(4 * CHUNK_SIZE) if content is None else content
+        fields.setdefault('title', 'Test video')
+        return YTVideo.objects.create(
+            user=self.user, content_hash=hashlib.sha256(content).hexdigest(),
+            file_on_server=SimpleUploadedFile('video.mp4', content, 'video/mp4'), **fields)
+
+    def add_video(self, title):
+        """Video uploaded to the channel of the server, return its id."""
+        video_id = os.urandom(8).hex()[:11]
+        self.server.videos[video_id] = ({
+            'kind': 'youtube#video', 'etag': 'etag', 'id': video_id,
+            'snippet': {'title': title}, 'status': {'privacyStatus': 'private'},
+        }, time.monotonic())
+        return video_id
+
+    def claim(self, job):
+        """Make `job` available and claim it like an upload worker."""
+        UploadJob.objects.filter(pk=job.pk).update(available_at=now())
+        claimed = UploadJob.objects.claim('test-worker', limit=10)
+        self.assertEqual([job.pk], [claimed_job.pk for claimed_job in claimed])
+        return claimed[0]
+
+
+class UploadJobTests(FakeYouTubeTestCase):
+    def test_claim(self):
+        first = self.create_video().upload_jobs.get()
+        second = self.create_video().upload_jobs.get()
+        UploadJob.objects.filter(pk=second.pk).update(available_at=now() + timedelta(hours=1))
+
+        claimed = UploadJob.objects.claim('worker-1', limit=10)
+        self.assertEqual([first.pk], [job.pk for job in claimed])
+        self.assertEqual(UploadJob.Status.RUNNING, claimed[0].status)
+        self.assertEqual(1, claimed[0].attempts)
+        # claimed or not available yet
+        self.assertEqual([], UploadJob.objects.claim('worker-2', limit=10))
+        self.assertEqual(UploadJob.objects.get(pk=second.pk).available_at,
+                         UploadJob.objects.next_available_at())
+
+    def test_release_stale(self):
+        job = self.create_video().upload_jobs.get()
+        job = self.claim(job)
+        self.assertEqual(0, UploadJob.objects.release_stale(now() - timedelta(minutes=5)))
+        # a progress save is a heartbeat
+        UploadJob.objects.filter(pk=job.pk).update(claimed_at=now() - timedelta(hours=1))
+        job.save_upload_progress('', 0, None)
+        self.assertEqual(0, UploadJob.objects.release_stale(now() - timedelta(minutes=5)))
+        UploadJob.objects.filter(pk=job.pk).update(claimed_at=now() - timedelta(hours=1))
+        self.assertEqual(1, UploadJob.objects.release_stale(now() - timedelta(minutes=5)))
+        self.assertEqual(UploadJob.Status.PENDING, UploadJob.objects.get(pk=job.pk).status)
+
+    def test_upload(self):
+        content = os.urandom(4 * CHUNK_SIZE + 1000)
+        video = self.create_video(content)
+        job = self.claim(video.upload_jobs.get())
+
+        self.assertTrue(job.run())
+        job.refresh_from_db()
+        video.refresh_from_db()
+        self.assertEqual(UploadJob.Status.SUCCEEDED, job.status)
+        self.assertEqual(len(content), job.bytes_uploaded)
+        self.assertIn(video.video_id, self.server.videos)
+        self.assertEqual('processing', video.processing_status)
+        self.assertFalse(video.file_on_server)
+        self.assertEqual(len(content), self.server.bytes_received)
+
+    def test_retry(self):
+        video = self.create_video()
+        job = self.claim(video.upload_jobs.get())
+
+        self.server.error_rate = 1.0
+        self.assertFalse(job.run())
+        job.refresh_from_db()
+        self.assertEqual(UploadJob.Status.PENDING, job.status)
+        self.assertIn('HttpError', job.last_error)
+        self.assertEqual('', job.worker_id)
+
+        self.server.error_rate = 0.0
+        job = self.claim(job)
+        self.assertEqual(2, job.attempts)
+        self.assertTrue(job.run())
+        self.assertEqual(1, self.server.uploads)
+
+    def test_resume(self):
+        content = os.urandom(4 * CHUNK_SIZE)
+        video = self.create_video(content)
+        job = self.claim(video.upload_jobs.get())
+        save_upload_progress = UploadJob.save_upload_progress
+
+        def interrupt(job, *args):
+            # the chunks after the first one fail
+            save_upload_progress(job, *args)
+            self.server.error_rate = 1.0
+
+        with mock.patch.object(UploadJob, 'save_upload_progress', autospec=True,
+                               side_effect=interrupt):
+            self.assertFalse(job.run())
+        job.refresh_from_db()
+        self.assertEqual(UploadJob.Status.PENDING, job.status)
+        self.assertEqual(CHUNK_SIZE, job.bytes_uploaded)
+        self.assertTrue(job.session_uri)
+
+        self.server.error_rate = 0.0
+        self.assertTrue(self.claim(job).run())
+        # the acknowledged chunk isn't sent again
+        self.assertEqual(len(content), self.server.bytes_received)
+        self.assertEqual(1, self.server.uploads)
+
+    def test_duplicate(self):
+        content = os.urandom(2 * CHUNK_SIZE)
+        original = self.create_video(content)
+        self.assertTrue(self.claim(original.upload_jobs.get()).run())
+
+        duplicate = self.create_video(content, title='Same file')
+        self.assertTrue(self.claim(duplicate.upload_jobs.get()).run())
+        duplicate.refresh_from_db()
+        original.refresh_from_db()
+        self.assertEqual(original, duplicate.duplicate_of)
+        self.assertEqual(original.video_id, duplicate.youtube_video_id)
+        self.assertFalse(duplicate.file_on_server)
+        self.assertEqual(1, self.server.uploads)
+
+
+class UploadViewTests(FakeYouTubeTestCase):
+    def test_upload_queues_one_job(self):
+        self.client.force_login(self.user)
+        response = self.client.post(reverse('youtube:upload'), {
+            'title': 'Uploaded video', 'category_id': 22, 'privacy_status': 'private',
+            'publish_at': (now() + timedelta(days=1)).strftime('%Y-%m-%d %H:%M:%S'),
+            'file_on_server': SimpleUploadedFile('video.mp4', os.urandom(1000), 'video/mp4'),
+        })
+        self.assertEqual(200, response.status_code)
+        self.assertEqual('QUEUED', response.context['status'])
+        video = YTVideo.objects.get()
+        self.assertEqual([response.context['job']], list(video.upload_jobs.all()))
+
+
+class StreamUploadTests(FakeYouTubeTestCase):
+    def setUp(self):
+        super().setUp()
+        self.client.force_login(self.user)
+
+    def stream_job(self, size):
+        video = YTVideo.objects.create(user=self.user, title='Streamed video')
+        return UploadJob.objects.create(
+            video=video, status=UploadJob.Status.RUNNING, worker_id=STREAM_WORKER_ID,
+            claimed_at=now(), attempts=1, total_bytes=size)
+
+    def put_chunk(self, job, data, start=0):
+        return self.client.put(
+            reverse('youtube:upload-stream-chunk', args=[job.pk]), data,
+            content_type='video/mp4',
+            HTTP_CONTENT_RANGE=f'bytes {start}-{start + len(data) - 1}/{job.total_bytes}')
+
+    def test_stream(self):
+        content = os.urandom(CHUNK_SIZE + 1000)
+        job = self.stream_job(len(content))
+
+        response = self.put_chunk(job, content[:CHUNK_SIZE])
+        self.assertEqual(200, response.status_code)
+        self.assertEqual(CHUNK_SIZE, response.json()['offset'])
+        # out of order
+        self.assertEqual(409, self.put_chunk(job, content[:CHUNK_SIZE]).status_code)
+        response = self.put_chunk(job, content[CHUNK_SIZE:], start=CHUNK_SIZE)
+        self.assertEqual(200, response.status_code)
+        self.assertEqual(UploadJob.Status.SUCCEEDED, response.json()['status'])
+        self.assertIn(response.json()['video_id'], self.server.videos)
+        self.assertEqual(len(content), self.server.bytes_received)
+
+    def test_unauthenticated(self):
+        init = YTApi.__init__
+
+        def unauthenticated(api, *args, **kwargs):
+            init(api, *args, **kwargs)
+            api.authenticated = False
+
+        job = self.stream_job(1000)
+        with mock.patch.object(YTApi, '__init__', autospec=True, side_effect=unauthenticated):
+            with self.assertRaises(YTApiError):
+                YTApi().upload_chunk(job.video, b'0' * 1000, 0, 1000, 'video/mp4')
+            response = self.put_chunk(job, b'0' * 1000)
+        self.assertEqual(502, response.status_code)
+        self.assertEqual('YTApiError: Authentication is required', response.json()['error'])
+        self.assertEqual(0, self.server.requests)
+
+
+class PublishSchedulerTests(FakeYouTubeTestCase):
+    def setUp(self):
+        super().setUp()
+        override = youtube_config(UPLOAD_CHUNK_SIZE=CHUNK_SIZE, PUBLISH_SCHEDULER=True)
+        override.enable()
+        self.addCleanup(override.disable)
+
+    def publish_scheduler(self, *args):
+        stdout, stderr = io.StringIO(), io.StringIO()
+        call_command('publish_scheduler', '--once', *args, stdout=stdout, stderr=stderr)
+        return stdout.getvalue(), stderr.getvalue()
+
+    def test_disabled(self):
+        video = YTVideo.objects.create(
+            user=self.user, title='Published by YouTube', video_id='abc',
+            publish_at=now() - timedelta(minutes=1))
+        with youtube_config(PUBLISH_SCHEDULER=False):
+            with self.assertRaises(CommandError):
+                self.publish_scheduler()
+        self.assertEqual(0, self.server.requests)
+        self.assertTrue(YTVideo.objects.publish_due().filter(pk=video.pk).exists())
+
+    def test_publish(self):
+        video = self.create_video()
+        self.assertTrue(self.claim(video.upload_jobs.get()).run())
+        scheduled = self.create_video(publish_at=now() + timedelta(days=1))
+        self.assertTrue(self.claim(scheduled.upload_jobs.get()).run())
+        YTVideo.objects.filter(pk=video.pk).update(publish_at=now() - timedelta(minutes=1))
+
+        self.publish_scheduler()
+        video.refresh_from_db()
+        scheduled.refresh_from_db()
+        self.assertEqual(YTVideo.PrivacyStatus.PUBLIC, video.privacy_status)
+        self.assertIsNotNone(video.published_at)
+        self.assertEqual('public', self.server.videos[video.video_id][0]['status']['privacyStatus'])
+        self.assertEqual(YTVideo.PrivacyStatus.PRIVATE, scheduled.privacy_status)
+        self.assertEqual(1, self.server.batches)
+
+    def test_give_up(self):
+        # not on YouTube, every publish fails
+        video = YTVideo.objects.create(
+            user=self.user, title='Deleted on YouTube', video_id='missing',
+            publish_at=now() - timedelta(minutes=1))
+
+        _, stderr = self.publish_scheduler('--max-attempts', '1')
+        video.refresh_from_db()
+        self.assertIn('gave up', stderr)
+        self.assertIsNone(video.published_at)
+        self.assertTrue(video.publish_error)
+        self.assertFalse(YTVideo.objects.publish_due().filter(pk=video.pk).exists())
+
+
+class ListingTests(TestCase):
+    def setUp(self):
+        self.user = get_user_model().objects.create_user('lister', password='secret')
+
+    def test_keyset_pages(self):
+        publish_at = now() + timedelta(days=1)
+        videos = [YTVideo.objects.create(user=self.user, title=f'Video {i}', publish_at=publish_at)
+                  for i in range(7)]
+        for ordering, expected in [('-created', videos[::-1]), ('publish_at', videos)]:
+            rows, cursor, pages = [], None, 0
+            while True:
+                page, cursor = keyset_page(YTVideo.objects.listing(user=self.user), ordering,
+                                           cursor=cursor, limit=3)
+                rows += page
+                pages += 1
+                if cursor is None:
+                    break
+            # equal publish_at are ordered by pk
+            self.assertEqual([video.pk for video in expected], [row['id'] for row in rows])
+            self.assertEqual(3, pages)
+
+    def test_invalid_cursor(self):
+        with self.assertRaises(CursorError):
+            keyset_page(YTVideo.objects.listing(), '-created', cursor='garbage')
+
+    def test_search(self):
+        lesson = YTVideo.objects.create(user=self.user, title='Guitar lesson')
+        tuning = YTVideo.objects.create(user=self.user, title='Tuning', description='Tune a guitar')
+        tagged = YTVideo.objects.create(user=self.user, title='Concert', tags='guitar,live')
+        YTVideo.objects.create(user=self.user, title='Piano lesson')
+
+        def search(query):
+            return set(YTVideo.objects.search(query).values_list('pk', flat=True))
+
+        self.assertEqual({lesson.pk, tuning.pk, tagged.pk}, search('guit'))
+        self.assertEqual({lesson.pk}, search('lesson guitar'))
+        self.assertEqual({tagged.pk}, search('LIVE'))
+        self.assertEqual(set(), search('drums'))
+        self.assertEqual(4, YTVideo.objects.search('  ').count())
+
+
+class IngestionTests(TestCase):
+    def setUp(self):
+        self.spool = tempfile.mkdtemp()
+        self.addCleanup(shutil.rmtree, self.spool, ignore_errors=True)
+        override = youtube_config(
+            UPLOAD_SPOOL_DIR=self.spool, UPLOAD_SPOOL_MIN_FREE=0, UPLOAD_SPOOL_CAPACITY=0,
+            UPLOAD_ADMISSION_WAIT=0.0, UPLOAD_MAX_SIZE=10 * 1024)
+        override.enable()
+        self.addCleanup(override.disable)
+        self.user = get_user_model().objects.create_user('uploader', password='secret')
+        self.client.force_login(self.user)
+
+    def assertRejected(self, status, call, *args):
+        with self.assertRaises(UploadRejected) as rejection:
+            call(*args)
+        self.assertEqual(status, rejection.exception.status)
+        return rejection.exception
+
+    def test_policy(self):
+        policy = IngestionPolicy(max_size=1000)
+        policy.check_size(1000)
+        policy.check_content_type('file_on_server', 'video/mp4')
+        policy.check_content_type('thumbnail', 'IMAGE/PNG')
+        self.assertRejected(413, policy.check_size, 1001)
+        self.assertRejected(415, policy.check_content_type, 'file_on_server', 'text/plain')
+        self.assertRejected(415, policy.check_content_type, 'thumbnail', None)
+        self.assertRejected(400, policy.check_content_type, 'attachment', 'video/mp4')
+
+    def test_reserve(self):
+        policy = IngestionPolicy(spool_capacity=1024 * 1024)
+        reserved = policy.reserve(self.spool, 512 * 1024)
+        self.assertGreaterEqual(spool_usage(self.spool), 512 * 1024)
+        # the reservation of the first upload is counted
+        error = self.assertRejected(503, policy.reserve, self.spool, 768 * 1024)
+        self.assertEqual(ADMISSION_RETRY_AFTER, error.retry_after)
+        reserved.close()
+        policy.reserve(self.spool, 768 * 1024).close()
+        self.assertEqual(0, spool_usage(self.spool))
+
+    def test_rejection_releases_reservation(self):
+        handler = SpoolFileUploadHandler(policy=IngestionPolicy())
+        handler.handle_raw_input(None, {}, 64 * 1024, b'boundary')
+        self.assertGreaterEqual(spool_usage(self.spool), 64 * 1024)
+        self.assertRejected(
+            415, handler.new_file, 'file_on_server', 'notes.txt', 'text/plain', 100, 'utf-8')
+        self.assertIsNone(handler.reserved)
+        self.assertEqual(0, spool_usage(self.spool))
+
+    def post_video(self, content, content_type='video/mp4'):
+        return self.client.post(reverse('youtube:upload'), {
+            'title': 'Uploaded video',
+            'file_on_server': SimpleUploadedFile('video.mp4', content, content_type),
+        })
+
+    def test_upload_rejections(self):
+        response = self.post_video(b'0' * 20 * 1024)
+        self.assertEqual(413, response.status_code)
+        response = self.post_video(b'0' * 1024, content_type='text/plain')
+        self.assertEqual(415, response.status_code)
+        with youtube_config(UPLOAD_SPOOL_DIR=self.spool, UPLOAD_SPOOL_CAPACITY=1024,
+                            UPLOAD_SPOOL_MIN_FREE=0, UPLOAD_ADMISSION_WAIT=0.0):
+            response = self.post_video(b'0' * 1024)
+        self.assertEqual(503, response.status_code)
+        self.assertEqual(str(ADMISSION_RETRY_AFTER), response['Retry-After'])
+        self.assertEqual(0, spool_usage(self.spool))
+        self.assertFalse(YTVideo.objects.exists())
+
+
+class ResponseCacheTests(TestCase):
+    def test_not_modified(self):
+        with FakeYouTube() as server:
+            server.videos['abc'] = (
+                {'kind': 'youtube#video', 'id': 'abc', 'etag': 'e', 'snippet': {}, 'status': {}},
+                time.monotonic())
+            http = ETagCachingHttp(build_http(), LRUCache(), namespace='test')
+            service = server.service(http=http)
+            first = service.videos().list(part='status', id='abc').execute()
+            second = service.videos().list(part='status', id='abc').execute()
+            # another resource, another entry
+            service.videos().list(part='status', id='xyz').execute()
+        self.assertEqual(first, second)
+        self.assertEqual(1, server.not_modified)
+        self.assertEqual({'hits': 1, 'misses': 2, 'stores': 2},
+                         {name: http.stats.as_dict()[name] for name in ['hits', 'misses', 'stores']})
+
+    def test_lru_eviction(self):
+        lru = LRUCache(max_bytes=10)
+        lru.set('a', ('1', {}, b'aaaa'))
+        lru.set('b', ('2', {}, b'bbbb'))
+        lru.get('a')
+        lru.set('c', ('3', {}, b'cccc'))
+        # b was used least recently
+        self.assertIsNone(lru.get('b'))
+        self.assertIsNotNone(lru.get('a'))
+        lru.set('big', ('4', {}, b'x' * 11))
+        self.assertIsNone(lru.get('big'))
+
+    def test_file_eviction(self):
+        directory = tempfile.mkdtemp()
+        self.addCleanup(shutil.rmtree, directory, ignore_errors=True)
+        files = FileCache(directory, max_bytes=1024)
+        files.set('old', ('1', {}, b'o' * 600))
+        old = files._path('old')
+        os.utime(old, (time.time() - 60, time.time() - 60))
+        files.set('new', ('2', {}, b'n' * 600))
+        self.assertIsNone(files.get('old'))
+        self.assertEqual(('2', {}, b'n' * 600), files.get('new'))
+
+    def test_django_cache_clear(self):
+        responses = DjangoCache()
+        responses.set('key', ('1', {}, b'content'))
+        cache.set('progress', 42)
+        self.addCleanup(cache.delete, 'progress')
+        self.assertEqual(('1', {}, b'content'), responses.get('key'))
+        responses.clear()
+        self.assertIsNone(responses.get('key'))
+        # other users of the Django cache keep their keys
+        self.assertEqual(42, cache.get('progress'))
+        responses.set('key', ('2', {}, b'content'))
+        self.assertEqual(('2', {}, b'content'), responses.get('key'))
+
+
+class AsyncCredentialsTests(TestCase):
+    def test_refresh_is_saved(self):
+        cred = Credentials(
+            'expired', refresh_token='refresh', token_uri='https://oauth2.googleapis.com/token',
+            client_id='id', client_secret='secret',
+            expiry=datetime.datetime.utcnow() - datetime.timedelta(minutes=1))
+
+        def refresh(request):
+            cred.token = 'fresh'
+            cred.expiry = datetime.datetime.utcnow() + datetime.timedelta(hours=1)
+
+        api = AsyncYTApi(client=mock.Mock())
+        api._cred = cred
+        with mock.patch.object(cred, 'refresh', side_effect=refresh), \
+                mock.patch.object(YTApi, 'yt_api_save_credentials') as save:
+            headers = asyncio.run(api.authorization())
+            # valid now, not refreshed again
+            asyncio.run(api.authorization())
+        self.assertEqual('Bearer fresh', headers['authorization'])
+        save.assert_called_once_with(cred)
+
+
+class QuotaTests(TestCase):
+    key = 'project'
+
+    def reserve(self, method_id, **config):
+        return QuotaBucket.objects.reserve(self.key, method_id, QuotaConfig(**config))
+
+    def test_daily_limit(self):
+        self.assertIsNone(self.reserve('youtube.videos.update', daily_limit=100))
+        self.assertIsNone(self.reserve('youtube.videos.update', daily_limit=100))
+        retry_at = self.reserve('youtube.videos.list', daily_limit=100)
+        self.assertEqual(next_quota_reset(), retry_at)
+        bucket = QuotaBucket.objects.get(key=self.key)
+        self.assertEqual(100, bucket.used)
+        usage = QuotaUsage.objects.get(key=self.key)
+        self.assertEqual(('youtube.videos.update', 2, 100), (usage.method, usage.calls, usage.units))
+
+    def test_new_day(self):
+        QuotaBucket.objects.create(
+            key=self.key, day=quota_day() - timedelta(days=1), used=100, tokens=10)
+        self.assertIsNone(self.reserve('youtube.videos.update', daily_limit=100))
+        bucket = QuotaBucket.objects.get(key=self.key)
+        self.assertEqual((quota_day(), 50), (bucket.day, bucket.used))
+
+    def test_batch(self):
+        # booked together or not at all, for one request token
+        self.assertIsNotNone(self.reserve(['youtube.videos.update'] * 3, daily_limit=100))
+        self.assertFalse(QuotaUsage.objects.exists())
+        self.assertIsNone(self.reserve(
+            ['youtube.videos.list', 'youtube.videos.list', 'youtube.thumbnails.set'], daily_limit=100))
+        bucket = QuotaBucket.objects.get(key=self.key)
+        self.assertEqual((52, 9), (bucket.used, bucket.tokens))
+        self.assertEqual(
+            {'youtube.videos.list': (2, 2), 'youtube.thumbnails.set': (1, 50)},
+            {usage.method: (usage.calls, usage.units) for usage in QuotaUsage.objects.all()})
+
+    def test_rate_limit(self):
+        self.assertIsNone(self.reserve('youtube.videos.list', requests_per_second=1, burst=1))
+        retry_at = self.reserve('youtube.videos.list', requests_per_second=1, burst=1)
+        self.assertGreater(retry_at, now())
+        self.assertLessEqual(retry_at, now() + timedelta(seconds=1))
+
+    def test_exhaust(self):
+        self.assertIsNone(self.reserve('youtube.videos.list', daily_limit=100))
+        QuotaBucket.objects.exhaust(self.key, QuotaConfig(daily_limit=100))
+        self.assertEqual(next_quota_reset(), self.reserve('youtube.videos.list', daily_limit=100))
+
+    def test_reserve_quota(self):
+        with youtube_config(CLIENT_SECRET_FILE=self.key, QUOTA_DAILY_LIMIT=100):
+            reserve_quota('youtube.videos.update')
+            reserve_quota('youtube.videos.update')
+            with self.assertRaises(QuotaExhausted) as raised:
+                reserve_quota(['youtube.videos.list', 'youtube.videos.update'])
+        self.assertEqual('youtube.videos.list, youtube.videos.update', raised.exception.method_id)
+        self.assertEqual(next_quota_reset(), raised.exception.retry_at)
+
+
+class UploadExecutorTests(SimpleTestCase):
+    def test_per_channel(self):
+        release = threading.Event()
+        lock = threading.Lock()
+        running, peak = {}, {}
+
+        def upload(channel):
+            with lock:
+                running[channel] = running.get(channel, 0) + 1
+                peak[channel] = max(peak.get(channel, 0), running[channel])
+            release.wait(5)
+            with lock:
+                running[channel] -= 1
+
+        with UploadExecutor(max_workers=3, per_channel=1) as executor:
+            futures = [executor.submit(upload, 'a', channel='a') for i in range(3)]
+            futures.append(executor.submit(upload, 'b', channel='b'))
+            time.sleep(0.1)
+            # the busy channel doesn't hold back the other one
+            with lock:
+                self.assertEqual({'a': 1, 'b': 1}, running)
+            self.assertEqual(4, executor.in_flight)
+            release.set()
+        self.assertTrue(all(future.done() for future in futures))
+        self.assertEqual({'a': 1, 'b': 1}, peak)
+
+    def test_backpressure(self):
+        release = threading.Event()
+        executor = UploadExecutor(max_workers=1, per_channel=1, max_queue=1, queue_timeout=0.05)
+        running = executor.submit(release.wait, 5)
+        queued = executor.submit(len, 'queued')
+        self.assertEqual(0, executor.free_slots)
+        self.assertFalse(executor.wait_for_slot(timeout=0.01))
+        with self.assertRaises(UploadQueueFull):
+            executor.submit(len, 'rejected', channel='other')
+
+        release.set()
+        self.assertTrue(executor.wait_for_slot(timeout=5))
+        executor.shutdown()
+        self.assertTrue(running.result(timeout=0))
+        self.assertEqual(6, queued.result(timeout=0))
+        self.assertEqual(0, executor.in_flight)
+        with self.assertRaises(RuntimeError):
+            executor.submit(len, 'late')
+
+    def test_error(self):
+        with UploadExecutor() as executor:
+            future = executor.submit(int, 'x')
+        self.assertIsInstance(future.exception(), ValueError)
+        with self.assertRaises(ValueError):
+            UploadExecutor(per_channel=0)
+
+
+class BatchTests(FakeYouTubeTestCase):
+    def test_batch(self):
+        service = self.server.service()
+        reserve = mock.Mock()
+        responses = {}
+
+        def callback(name):
+            return lambda response, exception: responses.__setitem__(name, (response, exception))
+
+        with YTBatch(service, size=2, reserve=reserve) as batch:
+            for name in ('first', 'second'):
+                batch.add(service.videos().list(part='snippet', id=self.add_video(name)), callback(name))
+            # sent once it has `size` calls
+            self.assertEqual(1, self.server.batches)
+            batch.add(service.videos().update(
+                part='status', body={'id': 'missing', 'status': {'privacyStatus': 'public'}}),
+                callback('missing'))
+        self.assertEqual(2, self.server.batches)
+        self.assertEqual([mock.call(['youtube.videos.list', 'youtube.videos.list']),
+                          mock.call(['youtube.videos.update'])], reserve.call_args_list)
+        self.assertEqual('second', responses['second'][0]['items'][0]['snippet']['title'])
+        response, exception = responses['missing']
+        self.assertIsNone(response)
+        self.assertIsInstance(exception, HttpError)
+        self.assertEqual(404, exception.resp.status)
+
+    def test_error_discards_calls(self):
+        service = self.server.service()
+        with self.assertRaises(ValueError):
+            with YTBatch(service) as batch:
+                batch.add(service.videos().list(part='snippet', id=self.add_video('video')))
+                raise ValueError
+        self.assertEqual(0, self.server.batches)
+
+    def test_update_videos(self):
+        videos = [YTVideo(title=f"Video {i}", video_id=self.add_video('old')) for i in range(3)]
+        results = []
+        with youtube_config(QUOTA_DAILY_LIMIT=1000):
+            YTApi().update_videos(videos, lambda video, response, exception: results.append(
+                (video.title, response['snippet']['title'], exception)))
+        self.assertEqual(1, self.server.batches)
+        self.assertEqual([(video.title, video.title, None) for video in videos], results)
+        usage = QuotaUsage.objects.get()
+        self.assertEqual(('youtube.videos.update', 3, 150), (usage.method, usage.calls, usage.units))
+
+    def test_quota_exhausted(self):
+        video = YTVideo(title='Video', video_id=self.add_video('old'))
+        with youtube_config(QUOTA_DAILY_LIMIT=100), self.assertRaises(QuotaExhausted):
+            YTApi().update_videos([video, video, video], mock.Mock())
+        self.assertEqual(0, self.server.batches)
+
+
+class SyncYouTubeTests(FakeYouTubeTestCase):
+    def setUp(self):
+        super().setUp()
+        # calls reserve quota like those of YTApi.yt_api_build_service()
+        api._service_cache.factory = functools.partial(
+            self.server.service, request_builder=api.MeteredHttpRequest)
+        self.video_ids = [self.add_video(f"Video {i}") for i in range(60)]
+        YTVideo.objects.create(video_id=self.video_ids[0], title='Old title')
+
+    def sync(self, *args):
+        out = io.StringIO()
+        call_command('sync_youtube', *args, stdout=out)
+        return out.getvalue()
+
+    def test_sync(self):
+        out = self.sync('--create')
+        self.assertIn("Page 2: 10 videos, 0 updated, 10 missing in the database.", out)
+        self.assertIn("Synced 60 videos: 1 updated, 59 missing, 59 created.", out)
+        self.assertIn("youtube.playlistItems.list: 2 calls", out)
+        self.assertEqual(60, YTVideo.objects.filter(video_id__in=self.video_ids).count())
+        self.assertEqual('Video 0', YTVideo.objects.get(video_id=self.video_ids[0]).title)
+
+        self.assertIn("Synced 60 videos: 0 updated, 0 missing, 0 created.", self.sync())
+
+    def test_dry_run(self):
+        out = self.sync('--create', '--dry-run')
+        self.assertIn("Synced 60 videos: 1 updated, 59 missing, 59 created.", out)
+        self.assertIn("Dry run, nothing was saved.", out)
+        self.assertEqual('Old title', YTVideo.objects.get().title)
+
+    def test_quota_exhausted(self):
+        # channels.list and playlistItems.list fit, videos.list doesn't
+        with youtube_config(QUOTA_DAILY_LIMIT=2), self.assertRaisesMessage(
+                CommandError, "Quota exhausted after 0 pages"):
+            self.sync()
+        self.assertEqual('Old title', YTVideo.objects.get().title)
+
+    def test_unknown_channel(self):
+        with self.assertRaisesMessage(CommandError, "No YTChannel with channel id UCmissing"):
+            self.sync('--channel', 'UCmissing')
+
+
+@mock.patch.object(events, 'EVENTS_INTERVAL', 0.01)
+class EventStreamTests(TestCase):
+    def setUp(self):
+        self.user = get_user_model().objects.create_user('uploader', password='secret')
+        self.video = YTVideo.objects.create(user=self.user, title='Video', video_id='abc',
+                                            upload_status='uploaded', processing_status='processing')
+        self.client.force_login(self.user)
+
+    def stream(self, path, method='GET', host='testserver', on_event=None, disconnect=False):
+        """
+        Run core.asgi on a request of `path`, `on_event(n)` is awaited after
+        the n-th event is sent.
+
+        return: status, [(event, data)], complete
+        """
+        headers = [(b'host', host.encode())]
+        if settings.SESSION_COOKIE_NAME in self.client.cookies:
+            session = self.client.cookies[settings.SESSION_COOKIE_NAME].value
+            headers.append((b'cookie', f'{settings.SESSION_COOKIE_NAME}={session}'.encode()))
+        scope = {'type': 'http', 'method': method, 'path': path, 'query_string': b'',
+                 'headers': headers}
+        response = {'status': None, 'body': [], 'complete': False}
+
+        async def receive():
+            if not disconnect:
+                await asyncio.Event().wait()
+            return {'type': 'http.disconnect'}
+
+        async def send(message):
+            if message['type'] == 'http.response.start':
+                response['status'] = message['status']
+                return
+            if message['body'].startswith(b'event: '):
+                response['body'].append(message['body'])
+                if on_event is not None:
+                    await on_event(len(response['body']))
+            response['complete'] = not message.get('more_body', False)
+
+        # the database is used in this thread, inside the transaction of the test
+        async_to_sync(application)(scope, receive, send)
+        stream = []
+        for body in response['body']:
+            event, data = body.decode().strip().split('\n')
+            stream.append((event[len('event: '):], json.loads(data[len('data: '):])))
+        return response['status'], stream, response['complete']
+
+    def path(self):
+        return f'/youtube/aio/videos/{self.video.pk}/events/'
+
+    def test_status_changes(self):
+        async def on_event(count):
+            if count == 1:
+                await sync_to_async(YTVideo.objects.filter(pk=self.video.pk).update)(
+                    processing_status='succeeded')
+
+        status, stream, complete = self.stream(self.path(), on_event=on_event)
+        self.assertEqual(200, status)
+        self.assertEqual(
+            [('processing', False), ('succeeded', True)],
+            [(data['processing_status'], data['done']) for event, data in stream])
+        self.assertEqual({'status'}, {event for event, data in stream})
+        self.assertTrue(complete)
+
+    def test_disconnect(self):
+        status, stream, complete = self.stream(self.path(), disconnect=True)
+        self.assertEqual((200, 1, False), (status, len(stream), complete))
+
+    def test_job_progress(self):
+        job = UploadJob.objects.create(video=self.video, status=UploadJob.Status.SUCCEEDED)
+        status, stream, complete = self.stream(f'/youtube/aio/jobs/{job.pk}/progress/events/')
+        self.assertEqual(200, status)
+        self.assertEqual([('status', UploadJob.Status.SUCCEEDED, True)],
+                         [(event, data['status'], data['done']) for event, data in stream])
+
+    def test_rejections(self):
+        self.assertEqual(405, self.stream(self.path(), method='POST')[0])
+        with override_settings(ALLOWED_HOSTS=['testserver']):
+            self.assertEqual(400, self.stream(self.path(), host='attacker.example')[0])
+        other = get_user_model().objects.create_user('other')
+        YTVideo.objects.filter(pk=self.video.pk).update(user=other)
+        self.assertEqual(404, self.stream(self.path())[0])
+
+        # get_user() refuses inactive users, like AuthenticationMiddleware
+        get_user_model().objects.filter(pk=self.user.pk).update(is_active=False)
+        self.assertEqual(401, self.stream(self.path())[0])
+        self.client.logout()
+        self.assertEqual(401, self.stream(self.path())[0])
+
+
+class ProgressTests(SimpleTestCase):
+    def setUp(self):
+        self.time = 0.0
+        self.store = mock.Mock()
+        self.persist = mock.Mock()
+        self.progress = ProgressReporter(
+            7, self.store, persist=self.persist, user_id=1, interval=1.0,
+            persist_interval=30.0, clock=lambda: self.time)
+
+    def report(self, at, uri, bytes_uploaded):
+        self.time = at
+        self.progress(uri, bytes_uploaded, 1000)
+
+    def test_coalescing(self):
+        self.report(0.0, 'session-1', 0)
+        self.report(0.5, 'session-1', 100)
+        self.report(1.0, 'session-1', 200)
+        self.assertEqual(2, self.store.set.call_count)
+        self.assertEqual([mock.call('session-1', 0, 1000)], self.persist.call_args_list)
+
+        # a new upload session is persisted right away
+        self.report(1.2, 'session-2', 0)
+        self.report(30.0, 'session-2', 500)
+        self.report(31.2, 'session-2', 600)
+        self.assertEqual(
+            [mock.call('session-1', 0, 1000), mock.call('session-2', 0, 1000),
+             mock.call('session-2', 600, 1000)],
+            self.persist.call_args_list)
+        self.assertEqual(4, self.store.set.call_count)
+
+    def test_rate(self):
+        self.report(0.0, 'session', 0)
+        self.report(1.0, 'session', 100)
+        self.assertEqual(100, self.progress.state['rate'])
+        self.report(2.0, 'session', 300)
+        self.assertAlmostEqual(130, self.progress.state['rate'])
+        self.assertAlmostEqual(700 / 130, self.progress.state['eta'])
+        job_id, state = self.store.set.call_args[0]
+        self.assertEqual((7, 1, 300), (job_id, state['user_id'], state['bytes_uploaded']))
+
+    def test_continue_from(self):
+        self.progress.continue_from({'rate': 50.0, 'retries': 2, 'updated_at': 10.0,
+                                     'bytes_uploaded': 400})
+        self.report(12.0, 'session', 600)
+        self.assertAlmostEqual(0.3 * 100 + 0.7 * 50, self.progress.state['rate'])
+        self.assertEqual(2, self.progress.state['retries'])
+
+    def test_store(self):
+        store = ProgressStore()
+        store.set(7, {'status': 'running'})
+        self.assertEqual({'status': 'running'}, store.get(7))
+        self.assertIsNone(store.get(8))
+
+    def test_check_progress_cache(self):
+        local = {'default': {'BACKEND': 'django.core.cache.backends.locmem.LocMemCache'}}
+        with override_settings(CACHES=local):
+            self.assertEqual(['youtube.W001'], [warning.id for warning in check_progress_cache(None)])
+        shared = {'default': {'BACKEND': 'django.core.cache.backends.db.DatabaseCache',
+                              'LOCATION': 'cache'}}
+        with override_settings(CACHES=shared):
+            self.assertEqual([], check_progress_cache(None))
+
+
+def image_file(path, size=(4000, 3000), mode='RGBA', format='PNG'):
+    Image.new(mode, size, (200, 30, 30, 128) if mode == 'RGBA' else (200, 30, 30)).save(path, format)
+    return path
+
+
+class ThumbnailTests(SimpleTestCase):
+    def setUp(self):
+        self.dir = tempfile.mkdtemp()
+        self.addCleanup(shutil.rmtree, self.dir, ignore_errors=True)
+        self.cache_dir = os.path.join(self.dir, 'cache')
+
+    def test_prepare(self):
+        source = image_file(os.path.join(self.dir, 'large.png'))
+        path = thumbnail.prepare_thumbnail(source, self.cache_dir)
+        with Image.open(path) as prepared:
+            self.assertEqual(('JPEG', 'RGB', (960, 720)), (prepared.format, prepared.mode, prepared.size))
+        self.assertLessEqual(os.path.getsize(path), thumbnail.MAX_THUMBNAIL_BYTES)
+
+        # cached by content
+        copy = shutil.copy(source, os.path.join(self.dir, 'copy.png'))
+        self.assertEqual(path, thumbnail.prepare_thumbnail(copy, self.cache_dir))
+        self.assertEqual([os.path.basename(path)], os.listdir(self.cache_dir))
+
+    def test_invalid(self):
+        source = os.path.join(self.dir, 'thumbnail.png')
+        with open(source, 'wb') as f:
+            f.write(b'not an image')
+        with self.assertRaises(thumbnail.ThumbnailError):
+            thumbnail.prepare_thumbnail(source, self.cache_dir)
+        self.assertFalse(os.path.exists(self.cache_dir))
+
+    def test_too_large(self):
+        source = image_file(os.path.join(self.dir, 'small.jpg'), (320, 180), 'RGB', 'JPEG')
+        with mock.patch.object(thumbnail, 'MAX_THUMBNAIL_BYTES', 100), \
+                self.assertRaisesMessage(thumbnail.ThumbnailError, "is larger than 100 bytes"):
+            thumbnail.prepare_thumbnail(source, self.cache_dir)
+
+    def test_pipeline(self):
+        source = image_file(os.path.join(self.dir, 'large.png'))
+        pipeline = thumbnail.ThumbnailPipeline(self.cache_dir, max_workers=1)
+        self.addCleanup(pipeline.shutdown)
+        path = pipeline.submit(source).result(timeout=60)
+        self.assertEqual(self.cache_dir, os.path.dirname(path))
+        with Image.open(path) as prepared:
+            self.assertEqual((960, 720), prepared.size)
+
+
+class ThumbnailUploadTests(FakeYouTubeTestCase):
+    def setUp(self):
+        super().setUp()
+        pipeline = thumbnail.ThumbnailPipeline(os.path.join(self.media_root, 'cache'), max_workers=1)
+        self.addCleanup(pipeline.shutdown)
+        patcher = mock.patch('youtube.models.thumbnail_pipeline', return_value=pipeline)
+        patcher.start()
+        self.addCleanup(patcher.stop)
+
+    def upload(self, content):
+        video = self.create_video(thumbnail=SimpleUploadedFile('thumbnail.png', content, 'image/png'))
+        self.assertTrue(self.claim(video.upload_jobs.get()).run())
+        video.refresh_from_db()
+        self.assertIn(video.video_id, self.server.videos)
+        return video
+
+    def test_thumbnail(self):
+        buffer = io.BytesIO()
+        Image.new('RGB', (1920, 1080)).save(buffer, 'PNG')
+        video = self.upload(buffer.getvalue())
+        self.assertIsNotNone(video.thumbnail_set_at)
+        self.assertIn(video.video_id, self.server.thumbnails)
+
+    def test_invalid_thumbnail(self):
+        # the video is uploaded, it keeps the default thumbnail
+        with self.assertLogs('youtube.models', 'WARNING'):
+            video = self.upload(b'not an image')
+        self.assertIsNone(video.thumbnail_set_at)
+        self.assertEqual({}, self.server.thumbnails)
+
+
+def credentials(token='token', expires_in=timedelta(hours=1)):
+    return Credentials(
+        token, refresh_token='refresh', token_uri='https://oauth2.googleapis.com/token',
+        client_id='id', client_secret='secret', scopes=['https://www.googleapis.com/auth/youtube'],
+        expiry=datetime.datetime.utcnow() + expires_in)
+
+
+def refreshed(cred, request):
+    """Credentials.refresh() without Google."""
+    cred.token = 'refreshed'
+    cred.expiry = datetime.datetime.utcnow() + timedelta(hours=1)
+
+
+class CredentialTests(TestCase):
+    def test_round_trip(self):
+        cred = credentials()
+        token = encrypt_credentials(cred)
+        self.assertNotIn(b'refresh', token)
+        loaded = decrypt_credentials(token)
+        self.assertEqual(
+            (cred.token, cred.refresh_token, cred.client_secret, cred.scopes, cred.expiry),
+            (loaded.token, loaded.refresh_token, loaded.client_secret, loaded.scopes, loaded.expiry))
+
+    def test_key_rotation(self):
+        old, new = Fernet.generate_key().decode(), Fernet.generate_key().decode()
+        with youtube_config(TOKEN_KEYS=[old]):
+            token = encrypt_credentials(credentials())
+        with youtube_config(TOKEN_KEYS=[new, old]):
+            self.assertEqual('token', decrypt_credentials(token).token)
+        with youtube_config(TOKEN_KEYS=[new]), self.assertRaises(TokenError):
+            decrypt_credentials(token)
+        with self.assertRaises(TokenError):
+            decrypt_credentials(b'not a token')
+
+    def test_channel(self):
+        user = get_user_model().objects.create_user('owner')
+        channel = YTChannel(user=user, channel_id='UCchannel')
+        channel.store_credentials(credentials())
+        self.assertEqual('token', api.load_channel_credentials(channel.pk).token)
+        api.save_channel_credentials(channel.pk, credentials('new'))
+        self.assertEqual('new', YTChannel.objects.get(pk=channel.pk).credentials().token)
+        with self.assertRaises(YTApiError):
+            api.load_channel_credentials(channel.pk + 1)
+
+    @mock.patch.object(Credentials, 'refresh', autospec=True, side_effect=refreshed)
+    def test_pool(self, refresh):
+        stored = {'a': credentials(), 'b': credentials(expires_in=timedelta(0))}
+        load = mock.Mock(side_effect=lambda key: stored[key])
+        save = mock.Mock()
+        pool = CredentialPool(load, save)
+
+        self.assertIs(stored['a'], pool.get('a'))
+        self.assertIs(stored['a'], pool.get('a'))
+        self.assertEqual(1, load.call_count)
+        self.assertIsNone(pool.peek('b'))
+        self.assertEqual('refreshed', pool.get('b').token)
+        save.assert_called_once_with('b', stored['b'])
+
+        # a token refreshed by another process is taken over
+        cred = pool.get('a')
+        cred.expiry = datetime.datetime.utcnow()
+        stored['a'] = credentials('other process')
+        self.assertEqual('other process', pool.get('a').token)
+        self.assertEqual(1, refresh.call_count)
+
+    @mock.patch.object(Credentials, 'refresh', autospec=True, side_effect=refreshed)
+    def test_refresh_expiring(self, refresh):
+        # past the refresh margin, within refresh_ahead
+        stored = {'soon': credentials(expires_in=timedelta(minutes=8)),
+                  'later': credentials(expires_in=timedelta(hours=1))}
+        pool = CredentialPool(lambda key: stored[key], refresh_ahead=timedelta(minutes=20))
+        soon, later = pool.get('soon'), pool.get('later')
+        # stored ones are expiring too
+        stored = {'soon': credentials(expires_in=timedelta(minutes=8))}
+        self.assertEqual(1, pool.refresh_expiring())
+        self.assertEqual(('refreshed', 'token'), (soon.token, later.token))
+
+        soon.expiry = datetime.datetime.utcnow()
+        refresh.side_effect = ValueError('invalid_grant')
+        errors = []
+        self.assertEqual(0, pool.refresh_expiring(lambda key, error: errors.append(key)))
+        self.assertEqual(['soon'], errors)
+        with self.assertRaises(ValueError):
+            pool.refresh_expiring()
+
+    @mock.patch.object(Credentials, 'refresh', autospec=True, side_effect=refreshed)
+    def test_refresher(self, refresh):
+        cred = credentials(expires_in=timedelta(minutes=8))
+        pool = CredentialPool(lambda key: cred, refresh_ahead=timedelta(minutes=20))
+        pool.get('a')
+        pool.start_refresher(interval=0.01)
+        self.addCleanup(pool.stop_refresher)
+        deadline = time.monotonic() + 5
+        while cred.token != 'refreshed' and time.monotonic() < deadline:
+            time.sleep(0.01)
+        self.assertEqual('refreshed', cred.token)
+
+
+class MappedMediaUploadTests(SimpleTestCase):
+    def setUp(self):
+        self.dir = tempfile.mkdtemp()
+        self.addCleanup(shutil.rmtree, self.dir, ignore_errors=True)
+
+    def media_file(self, content, name='video.mp4'):
+        path = os.path.join(self.dir, name)
+        with open(path, 'wb') as f:
+            f.write(content)
+        return path
+
+    def test_chunks(self):
+        content = os.urandom(2 * CHUNK_SIZE + 1000)
+        media = MappedMediaUpload(self.media_file(content), chunksize=CHUNK_SIZE)
+        self.addCleanup(media.close)
+        self.assertEqual((len(content), 'video/mp4', True), (media.size(), media.mimetype(), media.resumable()))
+        chunks = [media.getbytes(begin, media.chunksize())
+                  for begin in range(0, media.size(), media.chunksize())]
+        self.assertEqual([CHUNK_SIZE, CHUNK_SIZE, 1000], [len(chunk) for chunk in chunks])
+        self.assertEqual(content, b''.join(chunks))
+        # resumed from an acknowledged offset before the dropped pages
+        self.assertEqual(content[CHUNK_SIZE:], bytes(media.getbytes(CHUNK_SIZE, -1)))
+
+    def test_sizer(self):
+        sizer = ChunkSizer(initial=CHUNK_SIZE, target_seconds=1.0)
+        media = MappedMediaUpload(self.media_file(b'x' * 10), sizer=sizer)
+        self.addCleanup(media.close)
+        self.assertEqual(CHUNK_SIZE, media.chunksize())
+        sizer.record(CHUNK_SIZE, 0.1)
+        self.assertEqual(10 * CHUNK_SIZE, media.chunksize())
+        sizer.record_error()
+        self.assertEqual(5 * CHUNK_SIZE, media.chunksize())
+
+    def test_empty_file(self):
+        media = MappedMediaUpload(self.media_file(b'', 'video.bin'))
+        self.assertEqual((0, 'application/octet-stream', b''),
+                         (media.size(), media.mimetype(), media.getbytes(0, CHUNK_SIZE)))
+        media.close()
+
+    def test_close_with_chunk(self):
+        media = MappedMediaUpload(self.media_file(b'chunk'), chunksize=CHUNK_SIZE)
+        chunk = media.getbytes(0, CHUNK_SIZE)
+        media.close()
+        # the mapping lives as long as the chunk being sent
+        self.assertEqual(b'chunk', bytes(chunk))
+
+    def test_invalid_chunk_size(self):
+        with self.assertRaises(ValueError):
+            MappedMediaUpload(self.media_file(b'x'), chunksize=0)
+
+
+class MappedUploadTests(FakeYouTubeTestCase):
+    def test_adaptive_upload(self):
+        content = os.urandom(3 * CHUNK_SIZE + 1000)
+        video = self.create_video(content)
+        with youtube_config(UPLOAD_CHUNK_SIZE=CHUNK_SIZE, UPLOAD_CHUNK_ADAPTIVE=True,
+                            UPLOAD_MEDIA_SOURCE='mmap'):
+            self.assertTrue(self.claim(video.upload_jobs.get()).run())
+        video.refresh_from_db()
+        self.assertIn(video.video_id, self.server.videos)
+        self.assertEqual(len(content), self.server.bytes_received)
+
+
+class ManifestTests(TestCase):
+    def setUp(self):
+        self.dir = tempfile.mkdtemp()
+        self.addCleanup(shutil.rmtree, self.dir, ignore_errors=True)
+        media_override = override_settings(MEDIA_ROOT=os.path.join(self.dir, 'media'))
+        media_override.enable()
+        self.addCleanup(media_override.disable)
+        self.user = get_user_model().objects.create_user('uploader')
+        for name in ('a.mp4', 'b.mp4', 'c.mp4'):
+            self.write(name, os.urandom(1000))
+
+    def write(self, name, content):
+        path = os.path.join(self.dir, name)
+        with open(path, 'wb' if isinstance(content, bytes) else 'w') as f:
+            f.write(content)
+        return path
+
+    def bulk_upload(self, manifest, *args):
+        out, err = io.StringIO(), io.StringIO()
+        call_command('bulk_upload', manifest, 'uploader', *args, stdout=out, stderr=err)
+        return out.getvalue()
+
+    def test_formats(self):
+        rows = [{'file': 'a.mp4', 'title': 'A', 'tags': 'one,two'}, {'file': 'b.mp4', 'title': 'B'}]
+        csv_rows = 'file,title,tags,description\na.mp4, A ,"one,two",\nb.mp4,B,,\n'
+        jsonl_rows = '\n'.join(json.dumps(row) for row in rows[:1]) + '\n\n' + json.dumps(rows[1])
+        self.assertEqual([(2, rows[0]), (3, rows[1])],
+                         list(read_manifest(self.write('videos.csv', csv_rows))))
+        self.assertEqual([(1, rows[0]), (3, rows[1])],
+                         list(read_manifest(self.write('videos.jsonl', jsonl_rows))))
+        self.assertEqual([(1, rows[0]), (2, rows[1])],
+                         list(read_manifest(self.write('videos.json', json.dumps(rows)))))
+        self.assertEqual([(1, rows[0])],
+                         list(read_manifest(self.write('videos.txt', json.dumps(rows[0])), 'jsonl')))
+
+    def test_format_errors(self):
+        cases = [
+            ('extra.csv', 'file,title\na.mp4,A,extra\n', "line 2: More values than header columns"),
+            ('invalid.jsonl', '{"file": "a.mp4"}\n{"file": \n', "line 2: Invalid JSON"),
+            ('array.jsonl', '[]\n', "line 1: Not an object"),
+            ('object.json', '{}', "A JSON manifest must be an array of objects"),
+            ('videos.txt', '', "Unknown manifest format"),
+        ]
+        for name, content, message in cases:
+            with self.subTest(name), self.assertRaisesMessage(ManifestError, message):
+                list(read_manifest(self.write(name, content)))
+
+    def test_clean_row(self):
+        tomorrow = (now() + timedelta(days=1)).isoformat()
+        yesterday = (now() - timedelta(days=1)).isoformat()
+        values = BulkImport.clean_row(
+            {'file': 'a.mp4', 'title': 'A', 'tags': ['x', 'y'], 'publish_at': tomorrow,
+             'made_for_kids': 'no'}, 1, self.dir)
+        self.assertEqual((os.path.join(self.dir, 'a.mp4'), 'x,y', False, 'private'),
+                         (values['file'], values['tags'], values['made_for_kids'],
+                          values['privacy_status']))
+        self.write('empty.mp4', b'')
+        cases = [
+            ({'file': 'a.mp4', 'title': 'A', 'color': 'red'}, "Unknown columns color"),
+            ({'title': 'A'}, "file is required"),
+            ({'file': 'missing.mp4', 'title': 'A'}, "is not a file"),
+            ({'file': 'empty.mp4', 'title': 'A'}, "is empty"),
+            ({'file': 'a.mp4'}, "title is required"),
+            ({'file': 'a.mp4', 'title': 'a' * 101}, "title is longer than 100 characters"),
+            ({'file': 'a.mp4', 'title': '<b>A</b>'}, "title contains < or >"),
+            ({'file': 'a.mp4', 'title': 'A', 'category_id': '1000'}, "Unknown category_id 1000"),
+            ({'file': 'a.mp4', 'title': 'A', 'privacy_status': 'secret'}, "Unknown privacy_status"),
+            ({'file': 'a.mp4', 'title': 'A', 'publish_at': 'soon'}, "Invalid publish_at soon"),
+            ({'file': 'a.mp4', 'title': 'A', 'publish_at': yesterday}, "publish_at is in the past"),
+            ({'file': 'a.mp4', 'title': 'A', 'publish_at': tomorrow, 'privacy_status': 'public'},
+             "publish_at can be set only on private videos"),
+            ({'file': 'a.mp4', 'title': 'A', 'embeddable': 'maybe'}, "Invalid embeddable maybe"),
+        ]
+        for row, message in cases:
+            with self.subTest(message), self.assertRaisesMessage(ManifestError, message) as raised:
+                BulkImport.clean_row(row, 7, self.dir)
+            self.assertEqual(7, raised.exception.line)
+        # the publish_at of an imported row may have passed since
+        row = {'file': 'a.mp4', 'title': 'A', 'publish_at': yesterday}
+        self.assertIn('publish_at', BulkImport.clean_row(row, 7, self.dir, imported=True))
+
+    def test_bulk_upload(self):
+        start = now() + timedelta(days=1)
+        manifest = self.write('videos.csv', (
+            'file,title,privacy_status\n'
+            'a.mp4,A,private\n'
+            'b.mp4,B,public\n'
+            'c.mp4,C,\n'))
+        out = self.bulk_upload(manifest, '--start', start.isoformat(), '--interval', '60')
+        self.assertIn("Queued 3 uploads", out)
+        videos = YTVideo.objects.filter(user=self.user).order_by('import_line')
+        # public videos are not spread
+        self.assertEqual([('A', start), ('C', start + timedelta(hours=1))],
+                         [(video.title, video.publish_at) for video in videos.filter(privacy_status='private')])
+        self.assertEqual(3, UploadJob.objects.filter(status=UploadJob.Status.PENDING, video__in=videos).count())
+        for video in videos:
+            with open(video.file_on_server.path, 'rb') as f:
+                self.assertEqual(hashlib.sha256(f.read()).hexdigest(), video.content_hash)
+
+        with self.assertRaisesMessage(CommandError, "The manifest was imported by BulkImport"):
+            self.bulk_upload(manifest)
+
+    def test_invalid_rows(self):
+        manifest = self.write('videos.jsonl', '{"file": "a.mp4"}\n{"file": "missing.mp4", "title": "B"}\n')
+        err = io.StringIO()
+        with self.assertRaisesMessage(CommandError, "2 invalid rows, nothing was imported."):
+            call_command('bulk_upload', manifest, 'uploader', stdout=io.StringIO(), stderr=err)
+        self.assertIn("line 1: title is required", err.getvalue())
+        self.assertIn("line 2: file", err.getvalue())
+        self.assertFalse(BulkImport.objects.exists())
+
+        self.assertIn("Dry run", self.bulk_upload(
+            self.write('valid.jsonl', '{"file": "a.mp4", "title": "A"}\n'), '--dry-run'))
+        self.assertFalse(YTVideo.objects.exists())
+        with self.assertRaisesMessage(CommandError, "No user nobody"):
+            call_command('bulk_upload', manifest, 'nobody')
+
+    def test_resume(self):
+        publish_at = now() + timedelta(days=1)
+        manifest = self.write('videos.jsonl', '\n'.join([
+            json.dumps({'file': 'a.mp4', 'title': 'A', 'publish_at': publish_at.isoformat()}),
+            json.dumps({'file': 'b.mp4', 'title': 'B'}),
+            json.dumps({'file': 'c.mp4', 'title': 'C'}),
+        ]))
+        import_batch = BulkImport.import_batch
+
+        def interrupted(bulk_import, rows, workers=4):
+            if bulk_import.rows_done:
+                raise OSError("No space left on device")
+            return import_batch(bulk_import, rows, workers)
+
+        with mock.patch.object(BulkImport, 'import_batch', autospec=True, side_effect=interrupted), \
+                self.assertRaisesMessage(CommandError, "Import stopped after 1 videos"):
+            self.bulk_upload(manifest, '--batch-size', '1')
+        bulk_import = BulkImport.objects.get()
+        slots = [bulk_import.publish_at(slot) for slot in range(2)]
+
+        # the publish_at of the imported row has passed meanwhile
+        with mock.patch('youtube.models.now', return_value=publish_at + timedelta(hours=1)):
+            out = self.bulk_upload(manifest, '--batch-size', '1')
+        self.assertIn("Resuming BulkImport", out)
+        self.assertEqual(
+            [('A', publish_at), ('B', slots[0]), ('C', slots[1])],
+            [(video.title, video.publish_at)
+             for video in YTVideo.objects.filter(user=self.user).order_by('import_line')])
+        self.assertEqual(3, BulkImport.objects.get().rows_done)
+
+
+def mp4_file(path, *boxes):
+    """MP4 file of empty top-level `boxes` (their types), mdat of 100 bytes."""
+    with open(path, 'wb') as f:
+        for box in boxes:
+            f.write(struct.pack('>I4s', 108 if box == b'mdat' else 8, box))
+            if box == b'mdat':
+                f.write(bytes(100))
+    return path
+
+
+def video_info(video='h264', audio='aac', format_name='mov,mp4,m4a,3gp,3g2,mj2', **container):
+    streams = [{'codec_type': 'video', 'codec_name': video}]
+    if audio:
+        streams.append({'codec_type': 'audio', 'codec_name': audio})
+    return {'format': dict(format_name=format_name, **container), 'streams': streams}
+
+
+class TranscodeTests(SimpleTestCase):
+    def setUp(self):
+        self.dir = tempfile.mkdtemp()
+        self.addCleanup(shutil.rmtree, self.dir, ignore_errors=True)
+        self.faststart = mp4_file(os.path.join(self.dir, 'faststart.mp4'), b'ftyp', b'moov', b'mdat')
+        self.slow = mp4_file(os.path.join(self.dir, 'slow.mp4'), b'ftyp', b'mdat', b'moov')
+
+    def script(self, name, body):
+        """Executable standing in for ffmpeg or ffprobe."""
+        path = os.path.join(self.dir, name)
+        with open(path, 'w') as f:
+            f.write(f'#!/bin/sh\n{body}\n')
+        os.chmod(path, os.stat(path).st_mode | stat.S_IEXEC)
+        return path
+
+    def ffmpeg(self, size):
+        # writes `size` bytes to its last argument, the output
+        return self.script('ffmpeg', f'for last; do :; done\nhead -c {size} /dev/zero > "$last"')
+
+    def test_faststart(self):
+        self.assertTrue(transcode.faststart(self.faststart))
+        self.assertFalse(transcode.faststart(self.slow))
+        large = os.path.join(self.dir, 'large.mp4')
+        with open(large, 'wb') as f:
+            # 64-bit box size
+            f.write(struct.pack('>I4sQ', 1, b'free', 24) + bytes(8) + struct.pack('>I4s', 8, b'moov'))
+        self.assertTrue(transcode.faststart(large))
+
+    def test_plan(self):
+        plan = transcode.plan
+        self.assertEqual((transcode.NONE, 'copy'), plan(video_info(), self.faststart))
+        self.assertEqual((transcode.REMUX, 'copy'), plan(video_info(), self.slow))
+        self.assertEqual((transcode.REMUX, 'aac'), plan(video_info(audio='pcm_s16le'), self.faststart))
+        self.assertEqual((transcode.REMUX, 'copy'),
+                         plan(video_info(format_name='matroska,webm'), self.faststart))
+        self.assertEqual((transcode.TRANSCODE, 'copy'), plan(video_info(video='prores'), self.faststart))
+        self.assertEqual((transcode.TRANSCODE, 'copy'),
+                         plan(video_info(bit_rate='9000000'), self.faststart, max_bitrate=8000000))
+        # bitrate from the size and duration: 124 bytes in 1ms
+        self.assertEqual((transcode.TRANSCODE, 'copy'),
+                         plan(video_info(duration='0.001'), self.faststart, max_bitrate=500000))
+
+        cover = video_info(video='mjpeg', audio=None)
+        cover['streams'][0]['disposition'] = {'attached_pic': 1}
+        with self.assertRaisesMessage(transcode.TranscodeError, "has no video stream"):
+            plan(cover, self.faststart)
+
+    def test_ffmpeg_command(self):
+        remux = transcode.ffmpeg_command('in.mkv', 'out.mp4', transcode.REMUX, 'copy')
+        self.assertEqual(['-c:v', 'copy', '-c:a', 'copy', '-movflags', '+faststart', '-f', 'mp4',
+                          'out.mp4'], remux[-9:])
+        command = transcode.ffmpeg_command('in.mov', 'out.mp4', transcode.TRANSCODE, 'aac',
+                                           max_bitrate=8000000, crf=23, preset='fast', threads=2)
+        for option in (['-c:v', 'libx264', '-preset', 'fast', '-crf', '23'],
+                       ['-maxrate', '8000000', '-bufsize', '16000000'],
+                       ['-b:a', transcode.AAC_BITRATE], ['-threads', '2']):
+            index = command.index(option[0])
+            self.assertEqual(option, command[index:index + len(option)])
+
+    def prepare(self, source, info, ffmpeg, **options):
+        output = os.path.join(self.dir, 'out', 'video.mp4')
+        with mock.patch.object(transcode, 'probe', return_value=info):
+            return transcode.prepare_video(source, output, ffmpeg=ffmpeg, **options)
+
+    def test_prepare_video(self):
+        preparation = self.prepare(self.faststart, video_info(), self.ffmpeg(10))
+        self.assertEqual((transcode.NONE, self.faststart), preparation[:2])
+
+        preparation = self.prepare(self.slow, video_info(), self.ffmpeg(50))
+        self.assertEqual((transcode.REMUX, 124, 50, False),
+                         (preparation.action, preparation.source_bytes, preparation.output_bytes,
+                          preparation.reused))
+        self.assertTrue(preparation.path.endswith('video.remux.mp4'))
+        # the output of an interrupted upload is reused
+        reused = self.prepare(self.slow, {}, self.script('ffmpeg', 'exit 1'))
+        self.assertEqual((preparation.path, True), (reused.path, reused.reused))
+
+    def test_larger_transcode(self):
+        preparation = self.prepare(self.faststart, video_info(video='prores'), self.ffmpeg(1000))
+        self.assertEqual((transcode.NONE, self.faststart), preparation[:2])
+        self.assertEqual([], os.listdir(os.path.join(self.dir, 'out')))
+
+    def test_ffmpeg_errors(self):
+        with self.assertRaisesMessage(transcode.TranscodeError, "ffmpeg remux of"):
+            self.prepare(self.slow, video_info(), self.script('ffmpeg', 'echo broken >&2\nexit 1'))
+        self.assertEqual([], os.listdir(os.path.join(self.dir, 'out')))
+        with self.assertRaisesMessage(transcode.TranscodeError, "Can't run"):
+            self.prepare(self.slow, video_info(), os.path.join(self.dir, 'missing'))
+        with self.assertRaisesMessage(transcode.TranscodeError, "ffprobe failed"):
+            transcode.probe(self.slow, self.script('ffprobe', 'exit 1'))
+
+
+class MetricsTests(TestCase):
+    def setUp(self):
+        self.metrics = metrics_module.Metrics()
+        self.metrics.inc('youtube_upload_rejections_total', reason='size')
+        patcher = mock.patch('youtube.views.metrics', return_value=self.metrics)
+        patcher.start()
+        self.addCleanup(patcher.stop)
+
+    def test_disabled(self):
+        staff = get_user_model().objects.create_user('staff', is_staff=True)
+        self.client.force_login(staff)
+        with mock.patch('youtube.views.metrics', return_value=metrics_module.NullMetrics()):
+            self.assertEqual(404, self.client.get(reverse('metrics')).status_code)
+
+    def test_token(self):
+        with youtube_config(METRICS_TOKEN='secret'):
+            response = self.client.get(reverse('metrics'))
+            self.assertEqual((401, 'Bearer'), (response.status_code, response['WWW-Authenticate']))
+            response = self.client.get(reverse('metrics'), HTTP_AUTHORIZATION='Bearer wrong')
+            self.assertEqual(401, response.status_code)
+            response = self.client.get(reverse('metrics'), HTTP_AUTHORIZATION='Bearer secret')
+        self.assertEqual(200, response.status_code)
+        self.assertEqual(metrics_module.CONTENT_TYPE, response['Content-Type'])
+        self.assertIn(b'youtube_upload_rejections_total{reason="size"} 1', response.content)
+
+    def test_staff_only(self):
+        with youtube_config(METRICS_TOKEN=''):
+            self.assertEqual(404, self.client.get(reverse('metrics')).status_code)
+            self.client.force_login(get_user_model().objects.create_user('user'))
+            self.assertEqual(404, self.client.get(reverse('metrics')).status_code)
+            self.client.force_login(get_user_model().objects.create_user('staff', is_staff=True))
+            self.assertEqual(200, self.client.get(reverse('metrics')).status_code)
+
+    def test_authorized(self):
+        authorized = metrics_module.authorized
+        self.assertTrue(authorized('Bearer secret', 'secret'))
+        self.assertTrue(authorized('bearer  secret ', 'secret'))
+        self.assertFalse(authorized('Basic secret', 'secret'))
+        self.assertFalse(authorized('Bearer other', 'secret'))
+        self.assertFalse(authorized(None, 'secret'))
+        # no token configured authorizes nobody
+        self.assertFalse(authorized('Bearer ', ''))
+
+    def test_serve(self):
+        with mock.patch.object(metrics_module, 'metrics', return_value=self.metrics):
+            server = metrics_module.serve(0, token='secret')
+            self.addCleanup(server.server_close)
+            self.addCleanup(server.shutdown)
+            url = f"http://127.0.0.1:{server.server_address[1]}/metrics"
+            with self.assertRaises(urllib.error.HTTPError) as raised:
+                urllib.request.urlopen(url, timeout=5)
+            self.assertEqual(401, raised.exception.code)
+            request = urllib.request.Request(url, headers={'Authorization': 'Bearer secret'})
+            with urllib.request.urlopen(request, timeout=5) as response:
+                self.assertIn(b'youtube_upload_rejections_total', response.read())
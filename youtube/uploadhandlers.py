@@ -0,0 +1,287 @@
+import errno
+import fnmatch
+import hashlib
+import os
+import shutil
+import tempfile
+import time
+from contextlib import contextmanager
+
+try:
+    import fcntl
+except ImportError:  # Windows
+    fcntl = None
+
+from django.conf import settings
+from django.core.files.uploadedfile import TemporaryUploadedFile
+from django.core.files.uploadhandler import FileUploadHandler
+
+from .utils.metrics import metrics
+
+# Content types accepted for the files of the upload form, by field.
+CONTENT_TYPES = {
+    'file_on_server': ['video/*', 'application/octet-stream'],
+    'thumbnail': ['image/*'],
+}
+
+# Seconds between spool capacity checks of a request waiting for admission
+# and the Retry-After of requests refused when the wait is over.
+ADMISSION_POLL_INTERVAL = 0.5
+ADMISSION_RETRY_AFTER = 30
+
+# Lock file of the spool directory serializing admissions of all processes.
+ADMISSION_LOCK = '.admission.lock'
+
+# Field of the video, the only file written to the space reserved at admission.
+VIDEO_FIELD = 'file_on_server'
+
+
+class UploadRejected(BaseException):
+    """
+    Raise when an upload is refused from its headers, before its body is
+    read: `status` is the HTTP status of the response, `reason` the label
+    of the rejection metric and `retry_after` the seconds after which the
+    upload may be sent again
+    """
+
+    def __init__(self, message, status=413, reason='size', retry_after=None):
+        super().__init__(message)
+        self.status = status
+        self.reason = reason
+        self.retry_after = retry_after
+
+
+def spool_dir():
+    """
+    Directory of spool files of uploaded videos.
+
+    It is inside MEDIA_ROOT by default, so saving the spool file as
+    `YTVideo.file_on_server` is a rename instead of a copy.
+    """
+    path = settings.YOUTUBE_API_CONFIG.get('UPLOAD_SPOOL_DIR') or \
+        os.path.join(settings.MEDIA_ROOT, 'youtube', 'spool')
+    os.makedirs(path, exist_ok=True)
+    return path
+
+
+class IngestionPolicy:
+    """
+    Limits of the uploads received by SpoolFileUploadHandler.
+
+    max_size: largest request body in bytes, 0 for no limit
+    content_types: {form field: accepted content type patterns}, files of
+        other fields are refused
+    min_free: bytes kept free on the file system of the spool directory
+    spool_capacity: bytes of all spool files together, 0 for no limit
+    admission_wait: seconds a request waits for spool capacity before it's
+        refused
+    """
+
+    def __init__(self, max_size=0, content_types=None, min_free=0, spool_capacity=0,
+                 admission_wait=0.0):
+        self.max_size = max_size
+        self.content_types = CONTENT_TYPES if content_types is None else content_types
+        self.min_free = min_free
+        self.spool_capacity = spool_capacity
+        self.admission_wait = admission_wait
+
+    @classmethod
+    def from_settings(cls):
+        config = settings.YOUTUBE_API_CONFIG
+        content_types = dict(CONTENT_TYPES)
+        if config.get('UPLOAD_CONTENT_TYPES'):
+            content_types['file_on_server'] = config['UPLOAD_CONTENT_TYPES']
+        return cls(
+            max_size=config.get('UPLOAD_MAX_SIZE', 0),
+            content_types=content_types,
+            min_free=config.get('UPLOAD_SPOOL_MIN_FREE', 0),
+            spool_capacity=config.get('UPLOAD_SPOOL_CAPACITY', 0),
+            admission_wait=config.get('UPLOAD_ADMISSION_WAIT', 0.0),
+        )
+
+    def check_size(self, size):
+        if self.max_size and size > self.max_size:
+            raise UploadRejected(
+                f"The upload is larger than {self.max_size} bytes.", status=413, reason='size')
+
+    def check_content_type(self, field_name, content_type):
+        patterns = self.content_types.get(field_name)
+        if patterns is None:
+            raise UploadRejected(
+                f"No file is accepted as {field_name}.", status=400, reason='field')
+        content_type = (content_type or '').lower()
+        if not any(fnmatch.fnmatchcase(content_type, pattern) for pattern in patterns):
+            raise UploadRejected(
+                f"Files of type {content_type or 'unknown'} are not accepted as {field_name}.",
+                status=415, reason='content_type')
+
+    def reserve(self, path, size):
+        """
+        Wait up to `admission_wait` seconds until `size` more bytes fit in
+        the spool directory `path` and reserve them: a spool file
+        pre-allocated to `size` bytes.
+
+        The check and the allocation hold the admission lock of `path`, so
+        an upload admitted by another process is counted by the free space
+        and the spool usage before the next check.
+
+        return: the reserved spool file, a NamedTemporaryFile
+        Raises:
+            UploadRejected: 503 when there is still no capacity, 507 when
+                the file system has no room after all
+        """
+        deadline = time.monotonic() + self.admission_wait
+        while True:
+            with admission_lock(path):
+                if self.has_capacity(path, size):
+                    return spool_file(path, size)
+            wait = deadline - time.monotonic()
+            if wait <= 0:
+                raise UploadRejected(
+                    "The server is receiving too many uploads, try again later.",
+                    status=503, reason='capacity', retry_after=ADMISSION_RETRY_AFTER)
+            time.sleep(min(ADMISSION_POLL_INTERVAL, wait))
+
+    def has_capacity(self, path, size):
+        if self.min_free and shutil.disk_usage(path).free - size < self.min_free:
+            return False
+        return not self.spool_capacity or spool_usage(path) + size <= self.spool_capacity
+
+
+@contextmanager
+def admission_lock(path):
+    """Exclusive lock of the spool directory `path` among processes."""
+    with open(os.path.join(path, ADMISSION_LOCK), 'a') as lock:
+        if fcntl is not None:
+            fcntl.flock(lock.fileno(), fcntl.LOCK_EX)
+        yield
+
+
+def spool_file(path, size=None, suffix='.upload'):
+    """
+    A NamedTemporaryFile in the spool directory `path`, pre-allocated to
+    `size` bytes so it is written in one contiguous pass.
+
+    Raises:
+        UploadRejected: 507 when the file system has no room for it
+    """
+    file = tempfile.NamedTemporaryFile(suffix=suffix, dir=path)
+    if size and hasattr(os, 'posix_fallocate'):
+        try:
+            os.posix_fallocate(file.fileno(), 0, size)
+        except OSError as error:
+            file.close()
+            if error.errno != errno.ENOSPC:
+                raise
+            raise UploadRejected(
+                "The server has no space left for the upload, try again later.",
+                status=507, reason='disk_full', retry_after=ADMISSION_RETRY_AFTER)
+    return file
+
+
+def spool_usage(path):
+    """Bytes allocated to the files of the spool directory `path`."""
+    usage = 0
+    with os.scandir(path) as entries:
+        for entry in entries:
+            try:
+                if entry.is_file(follow_symlinks=False):
+                    usage += entry.stat(follow_symlinks=False).st_blocks * 512
+            except FileNotFoundError:
+                # saved as file_on_server or removed meanwhile
+                pass
+    return usage
+
+
+class SpoolUploadedFile(TemporaryUploadedFile):
+    """
+    A file uploaded to a spool file of `spool_dir()`: `file`, the spool file
+    reserved at admission, or a new one without pre-allocation.
+
+    `content_hash` is the SHA-256 hex digest of the content, computed while
+    it's written.
+    """
+    content_hash = ''
+
+    def __init__(self, name, content_type, charset, content_type_extra=None, file=None):
+        if file is None:
+            _, ext = os.path.splitext(name)
+            file = spool_file(spool_dir(), suffix='.upload' + ext)
+        # skip TemporaryUploadedFile.__init__, it creates its own temporary file
+        super(TemporaryUploadedFile, self).__init__(
+            file, name, content_type, 0, charset, content_type_extra)
+
+
+class SpoolFileUploadHandler(FileUploadHandler):
+    """
+    Upload handler that streams uploaded files into a spool file.
+
+    Unlike Django's default handlers nothing is kept in memory and there is
+    no temporary file on another file system: the spool file becomes
+    `file_on_server` without being copied or read again. The content is
+    hashed in the same pass, see SpoolUploadedFile.content_hash.
+
+    The limits of `policy` (by default IngestionPolicy.from_settings()) are
+    enforced from the headers, before the body is read: the size of the
+    request and the capacity of the spool directory, then the field and
+    content type of every file. A refused upload raises UploadRejected when
+    request.FILES is read.
+
+    The space of the whole request body is reserved at admission and the
+    video is written to it; other files (the thumbnail) are small and
+    aren't pre-allocated, so a request never holds more than its body size.
+    """
+    reserved = None
+
+    def __init__(self, request=None, policy=None):
+        super().__init__(request)
+        self.policy = policy or IngestionPolicy.from_settings()
+
+    def handle_raw_input(self, input_data, META, content_length, boundary, encoding=None):
+        # the whole request body, an upper bound of the video size
+        with self.rejections():
+            self.policy.check_size(content_length)
+            self.reserved = self.policy.reserve(spool_dir(), content_length)
+
+    def new_file(self, field_name, file_name, content_type, *args, **kwargs):
+        super().new_file(field_name, file_name, content_type, *args, **kwargs)
+        with self.rejections():
+            self.policy.check_content_type(field_name, content_type)
+        file = None
+        if field_name == VIDEO_FIELD:
+            file, self.reserved = self.reserved, None
+        self.file = SpoolUploadedFile(
+            self.file_name, self.content_type, self.charset, self.content_type_extra, file=file)
+        self.hasher = hashlib.sha256()
+
+    def receive_data_chunk(self, raw_data, start):
+        self.file.write(raw_data)
+        self.hasher.update(raw_data)
+
+    def file_complete(self, file_size):
+        # drop the pre-allocated space beyond the file
+        self.file.truncate(file_size)
+        self.file.seek(0)
+        self.file.size = file_size
+        self.file.content_hash = self.hasher.hexdigest()
+        return self.file
+
+    def upload_complete(self):
+        # no video in the request
+        self.release()
+
+    def release(self):
+        """Remove the spool file reserved at admission when no video took it."""
+        if self.reserved is not None:
+            self.reserved.close()
+            self.reserved = None
+
+    @contextmanager
+    def rejections(self):
+        try:
+            yield
+        except UploadRejected as error:
+            # the reservation counts against the spool capacity until it's closed
+            self.release()
+            metrics().inc('youtube_upload_rejections_total', reason=error.reason)
+            raise
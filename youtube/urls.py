@@ -1,7 +1,19 @@
 from django.urls import path
-from .views import upload
+from .views import (upload, upload_job_progress, upload_job_status, upload_job_status_async,
+                    upload_stream, upload_stream_chunk, upload_stream_chunk_async, video_list)
 
 app_name = 'youtube'
 urlpatterns = [
     path('upload/', upload, name='upload'),
-]
\ No newline at end of file
+    path('streams/', upload_stream, name='upload-stream'),
+    path('streams/<int:pk>/', upload_stream_chunk, name='upload-stream-chunk'),
+    path('jobs/<int:pk>/', upload_job_status, name='upload-job-status'),
+    path('jobs/<int:pk>/progress/', upload_job_progress, name='upload-job-progress'),
+    path('videos/', video_list, name='video-list'),
+
+    # async views, served by ASGI (core.asgi); the server-sent event streams
+    # aio/videos/<pk>/events/ and aio/jobs/<pk>/progress/events/ are routed
+    # by core.asgi to youtube.events
+    path('aio/streams/<int:pk>/', upload_stream_chunk_async, name='upload-stream-chunk-async'),
+    path('aio/jobs/<int:pk>/', upload_job_status_async, name='upload-job-status-async'),
+]
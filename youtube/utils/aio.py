@@ -0,0 +1,243 @@
+import asyncio
+import datetime
+import json
+import mimetypes
+import os
+import time
+import weakref
+
+import httplib2
+import httpx
+from asgiref.sync import sync_to_async
+from django.conf import settings
+from google.auth.transport.requests import Request
+from googleapiclient.errors import HttpError
+
+from .api import (DEFAULT_CHUNK_SIZE, RETRIABLE_EXCEPTIONS, SESSION_EXPIRED_STATUS_CODES,
+                  UploadRetryExhausted, YTApi, credential_pool, reserve_quota)
+from .metrics import metrics
+from .retry import ErrorClass, RetryPolicy, classify_error, failure_details
+from .service import REFRESH_MARGIN, service_credentials
+
+YOUTUBE_ROOT_URL = 'https://youtube.googleapis.com/'
+
+# Always retry when these exceptions are raised by the async client.
+ASYNC_RETRIABLE_EXCEPTIONS = RETRIABLE_EXCEPTIONS + (httpx.TransportError,)
+
+_UNSET = object()
+
+# one client (and connection pool) per event loop
+_loop_apis = weakref.WeakKeyDictionary()
+
+
+def get_async_api():
+    """
+    AsyncYTApi of the running event loop.
+    """
+    loop = asyncio.get_running_loop()
+    api = _loop_apis.get(loop)
+    if api is None:
+        api = _loop_apis[loop] = AsyncYTApi()
+    return api
+
+
+class AsyncYTApi:
+    """
+    Async YouTube resumable upload client, next to the sync YTApi.
+
+    All requests go through one pooled httpx.AsyncClient, so a single event
+    loop keeps hundreds of uploads in flight without a thread per upload.
+    Credentials, request body and chunk size settings are the ones of YTApi.
+    see: https://developers.google.com/youtube/v3/guides/using_resumable_upload_protocol
+    """
+
+    def __init__(self, root_url=YOUTUBE_ROOT_URL, max_connections=200, timeout=120.0, client=None,
+                 retry_policy=None):
+        self.root_url = root_url
+        self.retry_policy = retry_policy or RetryPolicy.from_settings()
+        self.client = client or httpx.AsyncClient(
+            limits=httpx.Limits(max_connections=max_connections,
+                                max_keepalive_connections=max_connections),
+            timeout=timeout,
+        )
+        self._cred = _UNSET
+        self._refresh_lock = None
+
+    async def aclose(self):
+        await self.client.aclose()
+
+    async def authorization(self, channel_id=None):
+        """
+        Authorization headers of the YTApi credentials of the YTChannel
+        `channel_id` (default: of YOUTUBE_API_CONFIG), loaded or refreshed in a
+        thread when they are about to expire.
+        """
+        if channel_id is not None:
+            cred = credential_pool.peek(channel_id)
+            if cred is None:
+                cred = await sync_to_async(credential_pool.get, thread_sensitive=False)(channel_id)
+            headers = {}
+            cred.apply(headers)
+            return headers
+        if self._cred is _UNSET:
+            # the service is built (once per process) in a thread
+            self._cred = service_credentials(
+                await sync_to_async(lambda: YTApi.yt_service, thread_sensitive=False)())
+        cred = self._cred
+        if cred is None:
+            return {}
+        if self._expiring(cred):
+            if self._refresh_lock is None:
+                self._refresh_lock = asyncio.Lock()
+            async with self._refresh_lock:
+                if self._expiring(cred):
+                    await sync_to_async(self._refresh, thread_sensitive=False)(cred)
+        headers = {}
+        cred.apply(headers)
+        return headers
+
+    async def start_session(self, ytv_instance, total_bytes, mimetype='application/octet-stream'):
+        """
+        Start a resumable videos.insert upload session, its quota is
+        reserved like the calls of YTApi.
+        Raises:
+            QuotaExhausted: when the quota ledger denies the call
+
+        return: resumable session URI
+        """
+        await sync_to_async(reserve_quota)('youtube.videos.insert')
+        body = YTApi.video_body(ytv_instance)
+        response = await self._request(
+            'POST', f"{self.root_url}upload/youtube/v3/videos",
+            params={
+                'uploadType': 'resumable',
+                'part': ','.join(body.keys()),
+                'notifySubscribers': json.dumps(bool(ytv_instance.notify_subscribers)),
+                'alt': 'json',
+            },
+            content=json.dumps(body).encode(),
+            headers={
+                'Content-Type': 'application/json; charset=UTF-8',
+                'X-Upload-Content-Length': str(total_bytes),
+                'X-Upload-Content-Type': mimetype,
+            },
+            channel_id=ytv_instance.channel_id,
+        )
+        return response.headers['location']
+
+    async def upload_chunk(self, resumable_uri, data, offset, total_bytes, channel_id=None):
+        """
+        Send `data` at `offset` of the upload session of the YTChannel
+        `channel_id`. Chunks except the last one must be a multiple of 256 KiB.
+        Empty `data` only asks for the acknowledged offset.
+
+        return: bytes_uploaded, response
+            response: the video resource after the last chunk, otherwise None
+        """
+        if data:
+            content_range = f"bytes {offset}-{offset + len(data) - 1}/{total_bytes}"
+        else:
+            content_range = f"bytes */{total_bytes}"
+        with metrics().stage('chunk', session=resumable_uri) as stage:
+            response = await self._request(
+                'PUT', resumable_uri, content=data, ok=(200, 201, 308),
+                headers={'Content-Range': content_range}, channel_id=channel_id)
+            stage.bytes = len(data)
+        if response.status_code in (200, 201):
+            return total_bytes, response.json()
+        # "308 Resume Incomplete", Range is missing when nothing was received
+        received = response.headers.get('range')
+        return (int(received.split('-')[1]) + 1 if received else 0), None
+
+    async def upload_file(self, ytv_instance, media_file, resumable_uri=None, on_progress=None):
+        """
+        Async counterpart of YTApi.initialize_upload(), `on_progress` must
+        be a coroutine function. Retriable errors are retried in place as
+        told by `retry_policy`, waiting does not block the event loop.
+        Raises:
+            UploadRetryExhausted: when the retry policy gives up
+
+        return: success, response
+        """
+        total_bytes = os.path.getsize(media_file)
+        mimetype = mimetypes.guess_type(media_file)[0] or 'application/octet-stream'
+        chunksize = settings.YOUTUBE_API_CONFIG.get('UPLOAD_CHUNK_SIZE', DEFAULT_CHUNK_SIZE)
+        if chunksize <= 0:
+            chunksize = total_bytes
+
+        offset, response = 0, None
+        if resumable_uri:
+            try:
+                offset, response = await self.upload_chunk(
+                    resumable_uri, b'', 0, total_bytes, ytv_instance.channel_id)
+            except HttpError as e:
+                if e.resp.status not in SESSION_EXPIRED_STATUS_CODES:
+                    raise
+                resumable_uri = None
+        if not resumable_uri:
+            resumable_uri = await self.start_session(ytv_instance, total_bytes, mimetype)
+
+        attempt = 1
+        started = time.monotonic()
+        in_error_state = False
+        with open(media_file, 'rb') as media:
+            while response is None:
+                try:
+                    if in_error_state:
+                        offset, response = await self.upload_chunk(
+                            resumable_uri, b'', 0, total_bytes, ytv_instance.channel_id)
+                        in_error_state = False
+                        continue
+                    data = await asyncio.to_thread(os.pread, media.fileno(), chunksize, offset)
+                    offset, response = await self.upload_chunk(
+                        resumable_uri, data, offset, total_bytes, ytv_instance.channel_id)
+                    if on_progress is not None and response is None:
+                        await on_progress(resumable_uri, offset, total_bytes)
+                except (HttpError,) + ASYNC_RETRIABLE_EXCEPTIONS as e:
+                    error_class = classify_error(e)
+                    if isinstance(e, httpx.TransportError):
+                        error_class = ErrorClass.TRANSPORT
+                    if error_class == ErrorClass.FATAL:
+                        raise
+                    metrics().inc('youtube_upload_retries_total', error_class=error_class)
+                    elapsed = time.monotonic() - started
+                    delay = self.retry_policy.next_delay(error_class, attempt, elapsed)
+                    if delay is None:
+                        raise UploadRetryExhausted(
+                            failure_details(e, error_class, attempt, elapsed))
+                    attempt += 1
+                    in_error_state = True
+                    await asyncio.sleep(delay)
+
+        return 'id' in response, response
+
+    async def _request(self, method, url, ok=(200, 201), headers=None, channel_id=None, **kwargs):
+        headers = dict(headers or {}, **await self.authorization(channel_id))
+        instrumentation = metrics()
+        started = time.perf_counter()
+        status = 'error'
+        try:
+            response = await self.client.request(method, url, headers=headers, **kwargs)
+            status = str(response.status_code)
+        finally:
+            instrumentation.observe('youtube_http_request_seconds',
+                                    time.perf_counter() - started, method=method)
+            instrumentation.inc('youtube_http_responses_total', method=method, status=status)
+        if response.status_code not in ok:
+            # same error as googleapiclient raises, so callers handle both alike
+            resp = httplib2.Response(dict(response.headers, status=response.status_code))
+            raise HttpError(resp, response.content, uri=url)
+        return response
+
+    @staticmethod
+    def _refresh(cred):
+        # persisted like the refreshes of YTApi.yt_service, see ServiceCache
+        cred.refresh(Request())
+        YTApi.yt_api_save_credentials(cred)
+
+    @staticmethod
+    def _expiring(cred):
+        if not cred.valid:
+            return True
+        expiry = getattr(cred, 'expiry', None)
+        return expiry is not None and expiry - REFRESH_MARGIN <= datetime.datetime.utcnow()
@@ -1,40 +1,132 @@
+import datetime
 import errno
-import http.client
+import functools
 import os
 import pickle
-import random
+import threading
 import time
+from collections import Counter
 from pathlib import Path
 
-import httplib2
+import google_auth_httplib2
+from django.apps import apps
 from django.conf import settings
+from django.utils.timezone import now
 from django.utils.translation import ugettext as _
+from google.auth.exceptions import RefreshError
 from google.auth.transport.requests import Request
 from google_auth_oauthlib.flow import InstalledAppFlow
 from googleapiclient.discovery import build
 from googleapiclient.errors import HttpError
-from googleapiclient.http import MediaFileUpload
+from googleapiclient.http import HttpRequest, MediaFileUpload, MediaUpload, build_http
 
-# Explicitly tell the underlying HTTP transport library not to retry, since
-# we are handling retry logic ourselves.
-httplib2.RETRIES = 1
+from .batch import MAX_BATCH_SIZE, MAX_LIST_IDS, YTBatch, chunked
+from .credentials import CredentialPool, encrypt_credentials
+from .httpcache import CacheStats, ETagCachingHttp, response_cache_from_config
+from .media import (AdaptiveMediaFileUpload, ChunkSizer, MappedMediaUpload,
+                    StreamedMediaUpload)
+from .metrics import metrics
+from .quota import QuotaConfig, quota_key
+from .retry import RETRIABLE_EXCEPTIONS, ErrorClass, classify_error
+from .search import split_tags
+from .service import ServiceCache, service_credentials
 
-# Maximum number of times to retry before giving up.
-MAX_RETRIES = 10
+# Chunk size of resumable uploads if settings.YOUTUBE_API_CONFIG has none.
+DEFAULT_CHUNK_SIZE = 8 * 1024 * 1024
 
-# Always retry when these exceptions are raised.
-RETRIABLE_EXCEPTIONS = (httplib2.HttpLib2Error, IOError, http.client.NotConnected,
-                        http.client.IncompleteRead, http.client.ImproperConnectionState,
-                        http.client.CannotSendRequest, http.client.CannotSendHeader,
-                        http.client.ResponseNotReady, http.client.BadStatusLine)
+# Status codes of a resumable upload session which is not usable anymore,
+# the upload has to start over with a new session.
+SESSION_EXPIRED_STATUS_CODES = [404, 410]
 
-# Always retry when an apiclient.errors.HttpError with one of these status
-# codes is raised.
-RETRIABLE_STATUS_CODES = [500, 502, 503, 504]
 
-# Always retry when an apiclient.errors.HttpError with one of these status
-# codes is raised.
-RETRIABLE_STATUS_CODES = [500, 502, 503, 504]
+# Partial responses of the calls paging through the uploads of a channel.
+# See: https://developers.google.com/youtube/v3/getting-started#partial
+UPLOADS_PLAYLIST_FIELDS = 'items/contentDetails/relatedPlaylists/uploads'
+PLAYLIST_ITEMS_FIELDS = 'nextPageToken,items/contentDetails/videoId'
+SYNC_VIDEO_PART = 'snippet,status,processingDetails'
+SYNC_VIDEO_FIELDS = (
+    'items(id,snippet(title,description,tags,categoryId),'
+    'status(uploadStatus,privacyStatus,publishAt,embeddable,madeForKids),'
+    'processingDetails/processingStatus)'
+)
+
+
+# httplib2.Http is not thread-safe, every thread uploads through its own one
+_thread_local = threading.local()
+
+# ETag response cache of GET calls shared by all threads, see cached_http()
+_response_cache_lock = threading.Lock()
+_response_cache = None
+response_cache_stats = CacheStats()
+
+
+def new_http():
+    """
+    httplib2.Http of the YouTube API calls, instrumented (see
+    metrics.InstrumentedHttp) and behind the response cache.
+    """
+    return cached_http(metrics().instrument_http(build_http()))
+
+
+def cached_http(http, namespace=None):
+    """
+    Wrap `http` in the conditional-request cache configured by
+    settings.YOUTUBE_API_CONFIG['RESPONSE_CACHE'], see ETagCachingHttp.
+    `namespace` separates the entries of credentials (default: quota_key()).
+    """
+    global _response_cache
+    with _response_cache_lock:
+        if _response_cache is None:
+            _response_cache = response_cache_from_config(settings.YOUTUBE_API_CONFIG) or False
+    if not _response_cache:
+        return http
+    return ETagCachingHttp(http, _response_cache, stats=response_cache_stats,
+                           namespace=namespace or quota_key())
+
+
+def thread_http(cred, namespace=None):
+    """
+    Authorized httplib2.Http of `cred` (None: unauthenticated) in the current
+    thread.
+
+    httplib2.Http is not thread-safe, every thread has its own connections.
+    They are shared by the credentials of all channels used in the thread,
+    only the cheap authorizing wrapper is made per credentials.
+    """
+    http = getattr(_thread_local, 'http', None)
+    if http is None:
+        http = _thread_local.http = metrics().instrument_http(build_http())
+        _thread_local.authorized = {}
+    # refreshed credentials are updated in place, they keep their wrapper
+    entry = _thread_local.authorized.get(id(cred))
+    if entry is None or entry[0] is not cred:
+        authorized = cached_http(http, namespace)
+        if cred is not None:
+            authorized = google_auth_httplib2.AuthorizedHttp(cred, http=authorized)
+        entry = _thread_local.authorized[id(cred)] = (cred, authorized)
+    return entry[1]
+
+
+def load_channel_credentials(channel_id):
+    """
+    Credentials of the YTChannel `channel_id` from the database.
+    Raises:
+        YTApiError: when there is no such channel
+    """
+    YTChannel = apps.get_model('youtube', 'YTChannel')
+    try:
+        return YTChannel.objects.get(pk=channel_id).credentials()
+    except YTChannel.DoesNotExist:
+        raise YTApiError(f"YouTube channel {channel_id} does not exist")
+
+
+def save_channel_credentials(channel_id, cred):
+    """
+    Store refreshed credentials of the YTChannel `channel_id`, encrypted.
+    """
+    apps.get_model('youtube', 'YTChannel').objects.filter(pk=channel_id).update(
+        token=encrypt_credentials(cred),
+        token_expiry=cred.expiry.replace(tzinfo=datetime.timezone.utc) if cred.expiry else None)
 
 
 class OperationError(BaseException):
@@ -52,15 +144,143 @@ class YTApiError(BaseException):
     pass
 
 
+class UploadRetryLater(YTApiError):
+    """
+    Raise when an upload was interrupted by a retriable error.
+
+    Nothing is retried in the raising thread: the caller decides with a
+    RetryPolicy when to try again, the upload then resumes its session.
+    """
+
+    def __init__(self, error, error_class):
+        super().__init__(f"{error_class}: {error}")
+        self.error = error
+        self.error_class = error_class
+
+
+class UploadRetryExhausted(YTApiError):
+    """
+    Raise when the RetryPolicy gave up on an upload, `failure` describes
+    the last error (see retry.failure_details()).
+    """
+
+    def __init__(self, failure):
+        super().__init__(
+            f"No longer attempting to retry after {failure['attempts']} attempts: "
+            f"{failure['message']}")
+        self.failure = failure
+
+
+class QuotaExhausted(YTApiError):
+    """
+    Raise when the quota ledger denies a call, it can be sent at `retry_at`.
+    """
+
+    def __init__(self, method_id, retry_at):
+        super().__init__(f"Quota exhausted for {method_id}, retry at {retry_at.isoformat()}")
+        self.method_id = method_id
+        self.retry_at = retry_at
+
+
+def reserve_quota(method_id):
+    """
+    Reserve quota for one call of `method_id` (or the calls of a batch, a
+    list of method ids) in the shared quota ledger, see QuotaBucket. A call
+    waits up to QUOTA_MAX_WAIT seconds for the request rate limit, longer
+    waits are deferred to the caller.
+    Raises:
+        QuotaExhausted: when the call has to wait longer
+    """
+    QuotaBucket = apps.get_model('youtube', 'QuotaBucket')
+    config = QuotaConfig.from_settings()
+    key = quota_key()
+    while True:
+        retry_at = QuotaBucket.objects.reserve(key, method_id, config)
+        if retry_at is None:
+            return
+        wait = (retry_at - now()).total_seconds()
+        if wait > config.max_wait:
+            raise QuotaExhausted(
+                method_id if isinstance(method_id, str) else ', '.join(sorted(set(method_id))),
+                retry_at)
+        time.sleep(max(wait, 0))
+
+
+class MeteredHttpRequest(HttpRequest):
+    """
+    HttpRequest of yt_service that reserves quota before a call is sent.
+
+    A resumable upload is charged once, when its session is started.
+    """
+
+    def execute(self, http=None, num_retries=0):
+        if self.resumable is not None:
+            # sent by next_chunk()
+            return super().execute(http=http, num_retries=num_retries)
+        reserve_quota(self.methodId)
+        return self._metered(super().execute, http=http, num_retries=num_retries)
+
+    def next_chunk(self, http=None, num_retries=0):
+        if self.resumable_uri is None:
+            reserve_quota(self.methodId)
+        return self._metered(super().next_chunk, http=http, num_retries=num_retries)
+
+    def _metered(self, call, **kwargs):
+        try:
+            return call(**kwargs)
+        except HttpError as e:
+            if classify_error(e) == ErrorClass.QUOTA:
+                # the ledger is behind YouTube, i.e. another app uses the project
+                apps.get_model('youtube', 'QuotaBucket').objects.exhaust(quota_key())
+            raise
+
+
+class _CachedService:
+    """
+    Descriptor of YTApi.yt_service and YTApi.request_service, it returns the
+    process-local cached service of the module global `cache` so that
+    nothing is authenticated or built on import.
+    """
+
+    def __init__(self, cache):
+        self.cache = cache
+
+    def __get__(self, instance, owner):
+        try:
+            return globals()[self.cache].get()
+        except RefreshError as error:
+            raise YTApiError(error)
+
+
 class YTApi:
     """
     YouTube Wrapper API
     see: https://developers.google.com/youtube/v3
     """
 
+    @staticmethod
+    def yt_api_token_file():
+        """
+        Pickle file of the authenticated credentials.
+        """
+        API_NAME = settings.YOUTUBE_API_CONFIG.get('API_NAME', 'youtube')
+        API_VERSION = settings.YOUTUBE_API_CONFIG.get('API_VERSION', 'v3')
+        return settings.BASE_DIR / '.yt_secrets' / f'token_{API_NAME}_{API_VERSION}.pickle'
+
+    @staticmethod
+    def yt_api_save_credentials(cred):
+        """
+        Persist refreshed credentials so other processes start with them.
+        """
+        with open(YTApi.yt_api_token_file(), 'wb') as token:
+            pickle.dump(cred, token)
+
+    @staticmethod
     def yt_api_get_authenticated_service():
         """
         Generate authenticated service using setting.YOUTUBE_API_CONFIG credentials.
+
+        Use YTApi.yt_service instead of calling it directly, it's expensive.
         """
         # The CLIENT_SECRETS_FILE variable specifies the name of a file that contains
         # the OAuth 2.0 information for this application, including its client_id and
@@ -113,7 +333,7 @@ class YTApi:
                 errno.ENOENT, os.strerror(errno.ENOENT), CLIENT_SECRET_FILE)
 
         cred = None
-        pickle_file = YT_SECRET_DIR / f'token_{API_NAME}_{API_VERSION}.pickle'
+        pickle_file = YTApi.yt_api_token_file()
 
         if Path.exists(pickle_file):
             with open(pickle_file, 'rb') as token:
@@ -158,25 +378,120 @@ class YTApi:
                 except Exception as error:
                     raise error
 
-            with open(pickle_file, 'wb') as token:
-                pickle.dump(cred, token)
+            YTApi.yt_api_save_credentials(cred)
+
+        return YTApi.yt_api_build_service(google_auth_httplib2.AuthorizedHttp(cred, http=new_http()))
 
+    @staticmethod
+    def yt_api_build_service(http=None):
+        """
+        Build the service of settings.YOUTUBE_API_CONFIG API_NAME and
+        API_VERSION on `http` (default: unauthenticated).
+        """
         try:
-            service = build(API_NAME, API_VERSION, credentials=cred)
+            # discovery document bundled with googleapiclient, no network fetch
+            service = build(settings.YOUTUBE_API_CONFIG.get('API_NAME', 'youtube'),
+                            settings.YOUTUBE_API_CONFIG.get('API_VERSION', 'v3'),
+                            http=http or new_http(),
+                            static_discovery=True, cache_discovery=False,
+                            requestBuilder=MeteredHttpRequest)
             return service
         except Exception as error:
             raise YTApiError(error)
 
-    # yt_service is a shared resource
-    yt_service = yt_api_get_authenticated_service()
+    # yt_service is a shared resource, built lazily on first use
+    yt_service = _CachedService('_service_cache')
+    # builds the requests of channels, which are sent with their own credentials
+    request_service = _CachedService('_request_service_cache')
 
-    def __init__(self):
+    def __init__(self, channel_id=None):
         # TODO: need some custom check LATER
         self.authenticated = True
+        # YTChannel of the calls, None for the credentials of YOUTUBE_API_CONFIG
+        self.channel_id = channel_id
+        # executed calls per method, see execute()
+        self.calls = Counter()
+
+    @property
+    def service(self):
+        """
+        Service building the requests of this channel.
+        """
+        if self.channel_id is None:
+            return YTApi.yt_service
+        return YTApi.request_service
+
+    def thread_http(self):
+        """
+        Authorized httplib2.Http of this channel in the current thread.
+
+        The shared services must not be used concurrently with their own
+        http, so requests are executed with this one, see thread_http().
+        """
+        if self.channel_id is None:
+            return thread_http(service_credentials(YTApi.yt_service))
+        return thread_http(credential_pool.get(self.channel_id),
+                           namespace=f'{quota_key()}:{self.channel_id}')
+
+    def execute(self, request):
+        """
+        Execute a yt_service request with the http of the current thread
+        and count it in `calls`.
+        """
+        response = request.execute(http=self.thread_http())
+        self.calls[request.methodId] += 1
+        return response
 
-    def initialize_upload(self, ytv_instance, media_file):
+    def uploads_playlist_id(self):
+        """
+        Id of the uploads playlist of the authenticated channel.
+        Raises:
+            YTApiError: on no authentication or no channel
+        """
+        # Raise YTApiError if not authenticated
+        if not self.authenticated:
+            raise YTApiError(_("Authentication is required"))
+
+        response = self.execute(self.service.channels().list(
+            part='contentDetails', mine=True, fields=UPLOADS_PLAYLIST_FIELDS))
+        items = response.get('items', [])
+        if not items:
+            raise YTApiError(_("The authenticated account has no YouTube channel"))
+        return items[0]['contentDetails']['relatedPlaylists']['uploads']
+
+    def channel_video_pages(self, part=SYNC_VIDEO_PART, fields=SYNC_VIDEO_FIELDS):
+        """
+        Video resources of the authenticated channel, one list per page of
+        its uploads playlist.
+
+        Every page is one playlistItems.list and one videos.list call of up
+        to MAX_LIST_IDS videos. Pages are fetched while they are consumed,
+        so only one page is held in memory.
+        """
+        playlist_id = self.uploads_playlist_id()
+        page_token = None
+        while True:
+            page = self.execute(self.service.playlistItems().list(
+                part='contentDetails', playlistId=playlist_id, maxResults=MAX_LIST_IDS,
+                pageToken=page_token, fields=PLAYLIST_ITEMS_FIELDS))
+            ids = [item['contentDetails']['videoId'] for item in page.get('items', [])]
+            if ids:
+                response = self.execute(self.service.videos().list(
+                    part=part, id=','.join(ids), fields=fields))
+                yield response.get('items', [])
+            page_token = page.get('nextPageToken')
+            if not page_token:
+                return
+
+    def initialize_upload(self, ytv_instance, media_file, resumable_uri=None, on_progress=None):
         """
         Upload video from browser
+
+        If `resumable_uri` of an earlier upload session is given, the upload
+        resumes from the offset acknowledged by YouTube instead of sending the
+        whole file again. A new session is started if that one expired.
+        `on_progress(resumable_uri, bytes_uploaded, total_bytes)` is called
+        after every chunk so that the caller can persist the session.
         Raises:
             YTApiError: on no authentication
 
@@ -188,97 +503,235 @@ class YTApi:
         if not self.authenticated:
             raise YTApiError(_("Authentication is required"))
 
+        insert_request = self.insert_request(ytv_instance, media_file)
+        if resumable_uri:
+            # The first next_chunk() asks YouTube for the acknowledged offset
+            # of the session (an empty PUT) before sending any data.
+            insert_request.resumable_uri = resumable_uri
+            insert_request._in_error_state = True
+            try:
+                return self.resumable_upload(insert_request, on_progress=on_progress)
+            except HttpError as e:
+                if e.resp.status not in SESSION_EXPIRED_STATUS_CODES:
+                    raise
+            insert_request = self.insert_request(ytv_instance, media_file)
+
+        return self.resumable_upload(insert_request, on_progress=on_progress)
+
+    def insert_request(self, ytv_instance, media_file):
+        """
+        Build the resumable videos.insert request of a YTVideo instance.
+        `media_file` is a file path or a MediaUpload.
+        """
+        if not isinstance(media_file, MediaUpload):
+            media_file = self.media_upload(media_file)
+
+        body = self.video_body(ytv_instance)
+
+        # Call the API's videos.insert method to create and upload the video.
+        return self.service.videos().insert(
+            part=",".join(body.keys()),
+            body=body,
+            media_body=media_file,
+            notifySubscribers=ytv_instance.notify_subscribers,
+        )
+
+    @staticmethod
+    def video_body(ytv_instance):
+        """
+        videos.insert request body of a YTVideo instance.
+        """
         # generate
         # See: https://developers.google.com/youtube/v3/docs/videos/insert
         # and https://developers.google.com/youtube/v3/docs/videos#resource
-        body = dict(
+        status = dict(
+            privacyStatus=ytv_instance.privacy_status,
+            embeddable=ytv_instance.embeddable,
+            selfDeclaredMadeForKids=ytv_instance.made_for_kids,
+        )
+        # publishAt is accepted only on private videos; with the publish
+        # scheduler the video is made public by `manage.py publish_scheduler`
+        if ytv_instance.privacy_status == 'private' and \
+                not settings.YOUTUBE_API_CONFIG.get('PUBLISH_SCHEDULER'):
+            status['publishAt'] = ytv_instance.publish_at_iso
+        return dict(
             snippet=dict(
                 title=ytv_instance.title,
                 description=ytv_instance.description,
-                tags=ytv_instance.tags.split(","),
+                tags=split_tags(ytv_instance.tags),
                 categoryId=ytv_instance.category_id
             ),
-            status=dict(
-                privacyStatus=ytv_instance.privacy_status,
-                embeddable=ytv_instance.embeddable,
-                publishAt=ytv_instance.publish_at_iso,
-                selfDeclaredMadeForKids=ytv_instance.made_for_kids,
-            )
+            status=status,
         )
 
-        # Call the API's videos.insert method to create and upload the video.
-        insert_request = YTApi.yt_service.videos().insert(
-            part=",".join(body.keys()),
-            body=body,
-            # The chunksize parameter specifies the size of each chunk of data, in
-            # bytes, that will be uploaded at a time. Set a higher value for
-            # reliable connections as fewer chunks lead to faster uploads. Set a lower
-            # value for better recovery on less reliable connections.
-            #
-            # Setting "chunksize" equal to -1 in the code below means that the entire
-            # file will be uploaded in a single HTTP request. (If the upload fails,
-            # it will still be retried where it left off.) This is usually a best
-            # practice, but if you're using Python older than 2.6 or if you're
-            # running on App Engine, you should set the chunksize to something like
-            # 1024 * 1024 (1 megabyte).
-            media_body=MediaFileUpload(
-                media_file, chunksize=-1, resumable=True),
-            notifySubscribers=ytv_instance.notify_subscribers,
-        )
+    def batch(self, size=MAX_BATCH_SIZE):
+        """
+        Collect yt_service calls and send them in batch HTTP requests, see YTBatch.
+        Raises:
+            YTApiError: on no authentication
+        """
+        # Raise YTApiError if not authenticated
+        if not self.authenticated:
+            raise YTApiError(_("Authentication is required"))
+
+        return YTBatch(self.service, http=self.thread_http(), size=size,
+                       reserve=reserve_quota)
+
+    def update_videos(self, ytv_instances, callback, batch_size=MAX_BATCH_SIZE):
+        """
+        Update snippet and status of YouTube videos from YTVideo instances,
+        the videos.update calls are sent in batches.
+
+        `callback(ytv_instance, response, exception)` is called for every
+        instance, response is the updated video resource.
+        """
+        with self.batch(batch_size) as batch:
+            for ytv_instance in ytv_instances:
+                body = dict(self.video_body(ytv_instance), id=ytv_instance.video_id)
+                request = self.service.videos().update(part='snippet,status', body=body)
+                batch.add(request, functools.partial(callback, ytv_instance))
+
+    def update_video_statuses(self, ytv_instances, callback, batch_size=MAX_BATCH_SIZE):
+        """
+        Update the status (privacy) of YouTube videos from YTVideo instances,
+        the videos.update calls of part status are sent in batches. The
+        snippet edited on YouTube is left as it is.
+
+        `callback(ytv_instance, response, exception)` is called for every
+        instance, response is the updated video resource.
+        """
+        with self.batch(batch_size) as batch:
+            for ytv_instance in ytv_instances:
+                body = dict(status=self.video_body(ytv_instance)['status'], id=ytv_instance.video_id)
+                request = self.service.videos().update(part='status', body=body)
+                batch.add(request, functools.partial(callback, ytv_instance))
+
+    def list_videos(self, video_ids, callback, part='snippet,status', fields=None,
+                    batch_size=MAX_BATCH_SIZE):
+        """
+        Get YouTube video resources of `video_ids`. Every videos.list call
+        asks for MAX_LIST_IDS videos and the calls are sent in batches.
+
+        `callback(response, exception)` is called for every videos.list call,
+        response['items'] are the found videos.
+        """
+        extra = {'fields': fields} if fields else {}
+        with self.batch(batch_size) as batch:
+            for ids in chunked(video_ids, MAX_LIST_IDS):
+                request = self.service.videos().list(part=part, id=','.join(ids), **extra)
+                batch.add(request, callback)
+
+    def upload_chunk(self, ytv_instance, data, offset, total_bytes, mimetype, resumable_uri=None):
+        """
+        Forward one chunk of a streamed upload to YouTube, see StreamedMediaUpload.
 
-        return self.resumable_upload(insert_request)
+        The first chunk (no `resumable_uri`) starts the upload session.
+        Chunks except the last one must be a multiple of 256 KiB.
+        Raises:
+            YTApiError: on no authentication
+
+        return: resumable_uri, bytes_uploaded, response
+            bytes_uploaded: offset acknowledged by YouTube
+            response: videos().insert() response after the last chunk, otherwise None
+        """
+        # Raise YTApiError if not authenticated
+        if not self.authenticated:
+            raise YTApiError(_("Authentication is required"))
 
-    # This method implements an exponential backoff strategy to resume a
-    # failed upload.
-    def resumable_upload(self, request):
+        media = StreamedMediaUpload(total_bytes, mimetype)
+        media.feed(data)
+        request = self.insert_request(ytv_instance, media)
+        request.resumable_uri = resumable_uri
+        request.resumable_progress = offset
+        with metrics().stage('stream_chunk', video=ytv_instance.id) as stage:
+            status, response = request.next_chunk(http=self.thread_http())
+            stage.bytes = len(data)
+        bytes_uploaded = total_bytes if response is not None else request.resumable_progress
+        return request.resumable_uri, bytes_uploaded, response
+
+    @staticmethod
+    def media_upload(media_file):
+        """
+        Resumable MediaUpload of `media_file` using the configured chunk size.
+
+        The chunksize specifies the size of each chunk of data, in bytes, that
+        will be uploaded at a time. Set a higher value for reliable connections
+        as fewer chunks lead to faster uploads. Set a lower value for better
+        recovery on less reliable connections; only the last chunk is sent
+        again after a failure. -1 means the entire file is sent in a single
+        request. With UPLOAD_CHUNK_ADAPTIVE the chunk size follows the
+        measured throughput and errors, see ChunkSizer.
+
+        The file is read through an mmap (see MappedMediaUpload) unless
+        UPLOAD_MEDIA_SOURCE is 'file'.
+        """
+        config = settings.YOUTUBE_API_CONFIG
+        chunksize = config.get('UPLOAD_CHUNK_SIZE', DEFAULT_CHUNK_SIZE)
+        mapped = config.get('UPLOAD_MEDIA_SOURCE', 'mmap') == 'mmap'
+        if config.get('UPLOAD_CHUNK_ADAPTIVE', False):
+            sizer = ChunkSizer(
+                initial=chunksize if chunksize > 0 else DEFAULT_CHUNK_SIZE,
+                target_seconds=config.get('UPLOAD_CHUNK_TARGET_SECONDS', 10.0),
+            )
+            if mapped:
+                return MappedMediaUpload(media_file, sizer=sizer)
+            return AdaptiveMediaFileUpload(media_file, sizer)
+        if mapped:
+            return MappedMediaUpload(media_file, chunksize=chunksize)
+        return MediaFileUpload(media_file, chunksize=chunksize, resumable=True)
+
+    def resumable_upload(self, request, on_progress=None):
         """
         Upload video chunk by chunk
 
+        `on_progress(resumable_uri, bytes_uploaded, total_bytes)` is called
+        after every acknowledged chunk.
+        Raises:
+            UploadRetryLater: on a retriable error, the acknowledged chunks are
+                kept by the upload session so the retry resumes from there
+            HttpError: on a non-retriable error
+
         return: success, response
             success: True or False
             response: YTApi.yt_service.videos().insert() response
         """
+        sizer = getattr(request.resumable, 'sizer', None)
+        instrumentation = metrics()
         response = None
-        error = None
-        retry = 0
         while response is None:
+            offset = request.resumable_progress
+            started = time.monotonic()
             try:
-                status, response = request.next_chunk()
-                # print('Uploading file...')
-                if response is not None:
-                    if 'id' in response:
-                        # print('Video id "%s" was successfully uploaded.' %
-                        #       response['id'])
-                        # print('response:', response)
-                        return True, response
-                    else:
-                        # exit(
-                        #     'The upload failed with an unexpected response: %s' % response)
-                        return False, response
-            except HttpError as e:
-                if e.resp.status in RETRIABLE_STATUS_CODES:
-                    error = 'A retriable HTTP error %d occurred:\n%s' % (e.resp.status,
-                                                                         e.content)
-                else:
+                with instrumentation.stage('chunk', session=request.resumable_uri) as stage:
+                    status, response = request.next_chunk(http=self.thread_http())
+                    stage.bytes = (request.resumable.size() if response is not None
+                                   else request.resumable_progress) - offset
+            except (HttpError,) + RETRIABLE_EXCEPTIONS as e:
+                error_class = classify_error(e)
+                if error_class == ErrorClass.FATAL:
                     raise
-            except RETRIABLE_EXCEPTIONS as e:
-                error = 'A retriable error occurred: %s' % e
-
-            if error is not None:
-                print(error)
-                retry += 1
-                if retry > MAX_RETRIES:
-                    exit('No longer attempting to retry.')
-
-                max_sleep = 2 ** retry
-                sleep_seconds = random.random() * max_sleep
-                print('Sleeping %f seconds and then retrying...' %
-                      sleep_seconds)
-                time.sleep(sleep_seconds)
+                if sizer is not None:
+                    sizer.record_error()
+                instrumentation.inc('youtube_upload_retries_total', error_class=error_class)
+                raise UploadRetryLater(e, error_class)
+
+            # print('Uploading file...')
+            if sizer is not None:
+                sizer.record(request.resumable_progress - offset, time.monotonic() - started)
+            if on_progress is not None and response is None:
+                on_progress(request.resumable_uri, request.resumable_progress,
+                            request.resumable.size())
+
+        if 'id' in response:
+            # print('Video id "%s" was successfully uploaded.' %
+            #       response['id'])
+            return True, response
+        # The upload failed with an unexpected response
+        return False, response
 
     def set_video_thumbnail(self, video_id, thumbnail):
         """
-        Upload video thumbnail
+        Upload video thumbnail, it's a media upload so it can't be batched
         Raises:
             YTApiError: on no authentication
 
@@ -289,10 +742,12 @@ class YTApi:
         if not self.authenticated:
             raise YTApiError(_("Authentication is required"))
 
-        response_thumbnail = YTApi.yt_service.thumbnails().set(
-            videoId=video_id,
-            media_body=MediaFileUpload(thumbnail)
-        ).execute()
+        with metrics().stage('thumbnail_set', video_id=video_id) as stage:
+            response_thumbnail = self.service.thumbnails().set(
+                videoId=video_id,
+                media_body=MediaFileUpload(thumbnail)
+            ).execute(http=self.thread_http())
+            stage.bytes = os.path.getsize(thumbnail)
 
         return response_thumbnail
 
@@ -308,10 +763,27 @@ class YTApi:
 
         media_file_upload = MediaFileUpload(media_file)
 
-        response_upload = YTApi.yt_service.videos().insert(
+        response_upload = self.service.videos().insert(
             part='snippet,status',
             body=request_body,
             media_body=media_file_upload
-        ).execute()
+        ).execute(http=self.thread_http())
 
         return response_upload
+
+
+# process-local cache behind YTApi.yt_service
+_service_cache = ServiceCache(
+    YTApi.yt_api_get_authenticated_service,
+    on_refresh=YTApi.yt_api_save_credentials,
+)
+
+# process-local cache behind YTApi.request_service
+_request_service_cache = ServiceCache(YTApi.yt_api_build_service)
+
+# credentials of the channels (YTChannel), keyed by their pk
+credential_pool = CredentialPool(
+    load_channel_credentials, save=save_channel_credentials,
+    refresh_ahead=datetime.timedelta(
+        seconds=settings.YOUTUBE_API_CONFIG.get('CREDENTIAL_REFRESH_AHEAD', 600)),
+)
@@ -0,0 +1,76 @@
+from itertools import islice
+
+# Calls per batch HTTP request; googleapiclient allows 1000 but YouTube
+# handles small batches best.
+MAX_BATCH_SIZE = 50
+
+# Ids of one videos.list call, the maximum accepted by YouTube.
+MAX_LIST_IDS = 50
+
+
+def chunked(iterable, size):
+    """Lists of up to `size` items of `iterable`."""
+    iterator = iter(iterable)
+    while True:
+        chunk = list(islice(iterator, size))
+        if not chunk:
+            return
+        yield chunk
+
+
+class YTBatch:
+    """
+    Collect YouTube API calls and send them as batch HTTP requests of up to
+    `size` calls, one round trip per batch instead of one per call.
+
+        with YTApi().batch() as batch:
+            batch.add(service.videos().update(...), callback)
+
+    `callback(response, exception)` is called for every call once its batch
+    is sent; exception is None on success. Media uploads can't be batched.
+    `reserve(method_ids)` is called once per batch HTTP request with the
+    method ids of its calls before it's sent, so the quota of a batch is
+    reserved whole or not at all, see reserve_quota().
+    """
+
+    def __init__(self, service, http=None, size=MAX_BATCH_SIZE, reserve=None):
+        self.service = service
+        self.http = http
+        self.size = size
+        self.reserve = reserve
+        self._calls = []
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, exc_type, exc_value, traceback):
+        if exc_type is None:
+            self.flush()
+        else:
+            self._calls = []
+
+    def add(self, request, callback=None):
+        self._calls.append((request, callback))
+        if len(self._calls) >= self.size:
+            self.flush()
+
+    def flush(self):
+        """
+        Send the collected calls as one batch HTTP request.
+        """
+        calls, self._calls = self._calls, []
+        if not calls:
+            return
+        if self.reserve is not None:
+            self.reserve([request.methodId for request, _ in calls])
+        batch = self.service.new_batch_http_request()
+        for request_id, (request, callback) in enumerate(calls):
+            batch.add(request, callback=self._callback(callback), request_id=str(request_id))
+        batch.execute(http=self.http)
+
+    @staticmethod
+    def _callback(callback):
+        def batch_callback(request_id, response, exception):
+            if callback is not None:
+                callback(response, exception)
+        return batch_callback
@@ -0,0 +1,207 @@
+import base64
+import datetime
+import hashlib
+import json
+import random
+import threading
+
+from cryptography.fernet import Fernet, InvalidToken, MultiFernet
+from google.auth.transport.requests import Request
+from google.oauth2.credentials import Credentials
+
+from .metrics import metrics
+from .service import REFRESH_MARGIN
+
+# Credentials expiring within this time are refreshed by the background
+# refresher, before any request has to wait for it (see REFRESH_MARGIN).
+DEFAULT_REFRESH_AHEAD = datetime.timedelta(minutes=10)
+
+
+class TokenError(BaseException):
+    """
+    Raise when stored credentials can't be decrypted, i.e. TOKEN_KEYS changed
+    """
+    pass
+
+
+def token_cipher():
+    """
+    MultiFernet of settings.YOUTUBE_API_CONFIG['TOKEN_KEYS']: the first key
+    encrypts, all of them decrypt so keys can be rotated. Without keys, one
+    is derived from SECRET_KEY.
+    """
+    from django.conf import settings
+    keys = settings.YOUTUBE_API_CONFIG.get('TOKEN_KEYS') or [
+        base64.urlsafe_b64encode(hashlib.sha256(settings.SECRET_KEY.encode()).digest())]
+    return MultiFernet([Fernet(key) for key in keys])
+
+
+def encrypt_credentials(cred):
+    """
+    return: OAuth 2.0 user credentials `cred` encrypted with token_cipher()
+    """
+    info = json.loads(cred.to_json())
+    # google-auth expiry is a naive UTC datetime
+    info['expiry'] = cred.expiry.isoformat() if cred.expiry else None
+    return token_cipher().encrypt(json.dumps(info).encode())
+
+
+def decrypt_credentials(token):
+    """
+    Credentials encrypted by encrypt_credentials().
+    Raises:
+        TokenError: when `token` can't be decrypted
+    """
+    try:
+        info = json.loads(token_cipher().decrypt(bytes(token)))
+    except (InvalidToken, ValueError) as error:
+        raise TokenError(f"Stored credentials can't be decrypted: {error!r}")
+    cred = Credentials(
+        token=info.get('token'),
+        refresh_token=info.get('refresh_token'),
+        token_uri=info.get('token_uri'),
+        client_id=info.get('client_id'),
+        client_secret=info.get('client_secret'),
+        scopes=info.get('scopes'),
+    )
+    if info.get('expiry'):
+        cred.expiry = datetime.datetime.fromisoformat(info['expiry'])
+    return cred
+
+
+class CredentialPool:
+    """
+    Thread-safe, process-local credentials of many channels.
+
+    `load(key)` reads the stored credentials of a channel, `save(key, cred)`
+    stores refreshed ones. Credentials are loaded once and refreshed in
+    place when they are about to expire, so every authorized transport
+    holding them stays valid.
+
+    Every channel has its own lock: a refresh blocks only the threads of that
+    channel, cached credentials are returned without locking. Before
+    refreshing, the stored credentials are read again, a token refreshed by
+    another process is taken over instead of being refreshed again.
+    """
+
+    def __init__(self, load, save=None, refresh_margin=REFRESH_MARGIN,
+                 refresh_ahead=DEFAULT_REFRESH_AHEAD):
+        self.load = load
+        self.save = save
+        self.refresh_margin = refresh_margin
+        # processes sharing channels refresh ahead at different times
+        self.refresh_ahead = refresh_ahead * random.uniform(0.5, 1.0)
+        self._lock = threading.Lock()
+        self._locks = {}
+        self._credentials = {}
+        self._refresher = None
+
+    def get(self, key):
+        """
+        return: the credentials of `key`, loaded or refreshed if needed
+        """
+        cred = self._credentials.get(key)
+        if cred is not None and not self.expiring(cred):
+            return cred
+
+        with self._key_lock(key):
+            cred = self._credentials.get(key)
+            if cred is None:
+                cred = self.load(key)
+            if self.expiring(cred):
+                self._refresh(key, cred)
+            self._credentials[key] = cred
+            return cred
+
+    def peek(self, key):
+        """
+        return: the cached credentials of `key` if they are not expiring,
+            otherwise None. It never blocks, i.e. for an event loop.
+        """
+        cred = self._credentials.get(key)
+        if cred is None or self.expiring(cred):
+            return None
+        return cred
+
+    def refresh_expiring(self, on_error=None):
+        """
+        Refresh the cached credentials expiring within `refresh_ahead`.
+        A failed refresh is passed to `on_error(key, exception)` (raised
+        without it), the other credentials are refreshed anyway.
+
+        return: number of refreshed credentials
+        """
+        refreshed = 0
+        for key, cred in list(self._credentials.items()):
+            if not self.expiring(cred, self.refresh_ahead):
+                continue
+            with self._key_lock(key):
+                if not self.expiring(cred, self.refresh_ahead):
+                    continue
+                try:
+                    self._refresh(key, cred)
+                except (Exception, TokenError) as error:
+                    if on_error is None:
+                        raise
+                    on_error(key, error)
+                else:
+                    refreshed += 1
+        return refreshed
+
+    def start_refresher(self, interval=60.0, on_error=None):
+        """
+        Call refresh_expiring(on_error) every `interval` seconds in a daemon
+        thread, so requests rarely wait for a refresh.
+        """
+        with self._lock:
+            if self._refresher is not None:
+                return
+            self._refresher = threading.Event()
+            stopped = self._refresher
+
+        def run():
+            while not stopped.wait(interval):
+                self.refresh_expiring(on_error or (lambda key, error: None))
+
+        threading.Thread(target=run, name='credential-refresher', daemon=True).start()
+
+    def stop_refresher(self):
+        with self._lock:
+            if self._refresher is not None:
+                self._refresher.set()
+                self._refresher = None
+
+    def discard(self, key):
+        """Forget the credentials of `key`, i.e. after they were replaced."""
+        self._credentials.pop(key, None)
+
+    def clear(self):
+        self._credentials.clear()
+
+    def expiring(self, cred, margin=None):
+        if not cred.token:
+            return True
+        expiry = getattr(cred, 'expiry', None)
+        if expiry is None:
+            return False
+        margin = self.refresh_margin if margin is None else margin
+        # google-auth expiry is a naive UTC datetime
+        return expiry - margin <= datetime.datetime.utcnow()
+
+    def _key_lock(self, key):
+        lock = self._locks.get(key)
+        if lock is None:
+            with self._lock:
+                lock = self._locks.setdefault(key, threading.Lock())
+        return lock
+
+    def _refresh(self, key, cred):
+        stored = self.load(key)
+        if stored.token and not self.expiring(stored, self.refresh_ahead):
+            cred.token = stored.token
+            cred.expiry = stored.expiry
+            return
+        with metrics().stage('auth_refresh', channel=key):
+            cred.refresh(Request())
+        if self.save is not None:
+            self.save(key, cred)
@@ -0,0 +1,156 @@
+import threading
+from collections import Counter, OrderedDict, deque
+from concurrent.futures import Future, ThreadPoolExecutor
+
+DEFAULT_CHANNEL = 'default'
+
+
+class UploadQueueFull(BaseException):
+    """
+    Raise when UploadExecutor queue is full and the task could not be
+    queued in time
+    """
+    pass
+
+
+class UploadExecutor:
+    """
+    Run uploads concurrently in a thread pool.
+
+    At most `max_workers` uploads run at the same time and at most
+    `per_channel` of them for the same channel (credential), so one busy
+    channel can not starve the others. Up to `max_queue` tasks wait for a free
+    slot; when the queue is full `submit()` blocks for `queue_timeout` seconds
+    (forever if None) and then raises UploadQueueFull.
+    """
+
+    def __init__(self, max_workers=4, per_channel=2, max_queue=None, queue_timeout=None):
+        if max_workers < 1 or per_channel < 1:
+            raise ValueError("max_workers and per_channel must be positive")
+        self.max_workers = max_workers
+        self.per_channel = per_channel
+        self.max_queue = max_workers * 2 if max_queue is None else max_queue
+        self.queue_timeout = queue_timeout
+
+        self._pool = ThreadPoolExecutor(
+            max_workers=max_workers, thread_name_prefix='yt-upload')
+        self._cond = threading.Condition()
+        # channel -> deque of waiting tasks, ordered for round-robin dispatch
+        self._waiting = OrderedDict()
+        self._queued = 0
+        self._running = Counter()
+        self._total_running = 0
+        self._shutdown = False
+
+    @property
+    def in_flight(self):
+        """Number of queued and running tasks."""
+        with self._cond:
+            return self._queued + self._total_running
+
+    @property
+    def free_slots(self):
+        """Number of tasks that can be submitted without blocking."""
+        with self._cond:
+            return max(0, self.max_workers + self.max_queue - self._queued - self._total_running)
+
+    def wait_for_slot(self, timeout=None):
+        """
+        Block until a task can be submitted without blocking, at most
+        `timeout` seconds.
+
+        return: True when there is a free slot
+        """
+        with self._cond:
+            return self._cond.wait_for(
+                lambda: self.max_workers + self.max_queue - self._queued - self._total_running > 0,
+                timeout=timeout)
+
+    def submit(self, fn, *args, channel=DEFAULT_CHANNEL, **kwargs):
+        """
+        Schedule `fn(*args, **kwargs)` to run for `channel`.
+        Raises:
+            UploadQueueFull: when queue is still full after `queue_timeout`
+
+        return: concurrent.futures.Future of the task
+        """
+        future = Future()
+        with self._cond:
+            if self._shutdown:
+                raise RuntimeError("cannot submit after shutdown")
+            if not self._cond.wait_for(lambda: self._has_room(channel), timeout=self.queue_timeout):
+                raise UploadQueueFull(
+                    f"Upload queue is full ({self._queued} waiting)")
+            self._waiting.setdefault(channel, deque()).append(
+                (future, fn, args, kwargs))
+            self._queued += 1
+            self._dispatch()
+        return future
+
+    def shutdown(self, wait=True):
+        """
+        Stop accepting tasks. If `wait` is True, block until every queued and
+        running task finished.
+        """
+        with self._cond:
+            self._shutdown = True
+            if wait:
+                self._cond.wait_for(
+                    lambda: not self._queued and not self._total_running)
+        self._pool.shutdown(wait=wait)
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, *exc_info):
+        self.shutdown(wait=True)
+
+    def _has_room(self, channel):
+        if self._queued < self.max_queue:
+            return True
+        # a task which can start right away does not need queue room
+        return (self._total_running < self.max_workers
+                and self._running[channel] < self.per_channel
+                and channel not in self._waiting)
+
+    def _dispatch(self):
+        """Start waiting tasks while there are free global and channel slots."""
+        # must be called with self._cond held
+        started = True
+        while started and self._total_running < self.max_workers:
+            started = False
+            for channel in list(self._waiting):
+                if self._total_running >= self.max_workers:
+                    break
+                if self._running[channel] >= self.per_channel:
+                    continue
+                tasks = self._waiting[channel]
+                task = tasks.popleft()
+                if tasks:
+                    # give the other channels a turn first
+                    self._waiting.move_to_end(channel)
+                else:
+                    del self._waiting[channel]
+                self._queued -= 1
+                self._running[channel] += 1
+                self._total_running += 1
+                self._pool.submit(self._run, channel, *task)
+                started = True
+        self._cond.notify_all()
+
+    def _run(self, channel, future, fn, args, kwargs):
+        try:
+            if future.set_running_or_notify_cancel():
+                try:
+                    result = fn(*args, **kwargs)
+                except BaseException as error:
+                    future.set_exception(error)
+                else:
+                    future.set_result(result)
+        finally:
+            with self._cond:
+                self._running[channel] -= 1
+                if not self._running[channel]:
+                    del self._running[channel]
+                self._total_running -= 1
+                self._dispatch()
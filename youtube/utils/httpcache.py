@@ -0,0 +1,274 @@
+import hashlib
+import os
+import pickle
+import threading
+from collections import OrderedDict
+from pathlib import Path
+
+import httplib2
+
+# Bytes of cached responses kept by the bounded backends.
+DEFAULT_MAX_BYTES = 32 * 1024 * 1024
+
+# Prefix of the keys of DjangoCache entries and key of their generation.
+DJANGO_CACHE_PREFIX = 'yt-etag:'
+DJANGO_CACHE_GENERATION = DJANGO_CACHE_PREFIX + 'generation'
+
+
+class CacheStats:
+    """
+    Hit/miss counters of a response cache, shared by all threads.
+
+    hits: GET requests answered 304 and served from cache
+    misses: GET requests answered with a full response
+    stores: responses stored in the cache
+    bytes_saved: response bytes not transferred thanks to hits
+    """
+
+    def __init__(self):
+        self._lock = threading.Lock()
+        self.hits = 0
+        self.misses = 0
+        self.stores = 0
+        self.bytes_saved = 0
+
+    def record(self, hit, size=0):
+        with self._lock:
+            if hit:
+                self.hits += 1
+                self.bytes_saved += size
+            else:
+                self.misses += 1
+
+    def record_store(self):
+        with self._lock:
+            self.stores += 1
+
+    @property
+    def hit_ratio(self):
+        total = self.hits + self.misses
+        return self.hits / total if total else 0.0
+
+    def as_dict(self):
+        with self._lock:
+            return dict(hits=self.hits, misses=self.misses, stores=self.stores,
+                        bytes_saved=self.bytes_saved, hit_ratio=self.hit_ratio)
+
+
+class LRUCache:
+    """
+    In-memory, thread-safe cache of the process evicting the least recently
+    used entries beyond `max_bytes` of content.
+    """
+
+    def __init__(self, max_bytes=DEFAULT_MAX_BYTES):
+        self.max_bytes = max_bytes
+        self._lock = threading.Lock()
+        self._entries = OrderedDict()
+        self._size = 0
+
+    def get(self, key):
+        with self._lock:
+            entry = self._entries.get(key)
+            if entry is not None:
+                self._entries.move_to_end(key)
+            return entry
+
+    def set(self, key, entry):
+        size = len(entry[2])
+        if size > self.max_bytes:
+            return
+        with self._lock:
+            old = self._entries.pop(key, None)
+            if old is not None:
+                self._size -= len(old[2])
+            self._entries[key] = entry
+            self._size += size
+            while self._size > self.max_bytes:
+                _, evicted = self._entries.popitem(last=False)
+                self._size -= len(evicted[2])
+
+    def clear(self):
+        with self._lock:
+            self._entries.clear()
+            self._size = 0
+
+
+class DjangoCache:
+    """
+    Cache backed by a Django cache (settings.CACHES), shared by the processes
+    using the same cache server. Eviction is left to the Django backend.
+
+    The entries are stored under a generation (the cache key version), so
+    clear() drops them without touching the other keys of the Django cache,
+    i.e. the upload progress.
+    """
+
+    def __init__(self, alias='default', timeout=None):
+        self.alias = alias
+        self.timeout = timeout
+
+    @property
+    def cache(self):
+        from django.core.cache import caches
+        return caches[self.alias]
+
+    def get(self, key):
+        cache = self.cache
+        return cache.get(self._key(key), version=self._generation(cache))
+
+    def set(self, key, entry):
+        cache = self.cache
+        cache.set(self._key(key), entry, timeout=self.timeout, version=self._generation(cache))
+
+    def clear(self):
+        """Start a new generation, the entries of the old one are left to expire."""
+        cache = self.cache
+        try:
+            cache.incr(DJANGO_CACHE_GENERATION)
+        except ValueError:
+            # no generation yet (or it was evicted), entries of version 1 are dropped
+            cache.set(DJANGO_CACHE_GENERATION, 2, timeout=None)
+
+    @staticmethod
+    def _generation(cache):
+        return cache.get_or_set(DJANGO_CACHE_GENERATION, 1, timeout=None)
+
+    @staticmethod
+    def _key(key):
+        # memcached keys are limited to 250 characters
+        return DJANGO_CACHE_PREFIX + hashlib.sha256(key.encode()).hexdigest()
+
+
+class FileCache:
+    """
+    On-disk cache in `directory`, shared by the processes of the host.
+
+    The oldest written entries are removed when the directory holds more
+    than `max_bytes`.
+    """
+
+    def __init__(self, directory, max_bytes=DEFAULT_MAX_BYTES):
+        self.directory = Path(directory)
+        self.max_bytes = max_bytes
+        self.directory.mkdir(parents=True, exist_ok=True)
+
+    def get(self, key):
+        try:
+            with open(self._path(key), 'rb') as f:
+                return pickle.load(f)
+        except (OSError, EOFError, pickle.UnpicklingError):
+            return None
+
+    def set(self, key, entry):
+        path = self._path(key)
+        # write and rename so concurrent readers never see a partial entry
+        tmp = path.with_suffix(f'.{os.getpid()}.{threading.get_ident()}.tmp')
+        with open(tmp, 'wb') as f:
+            pickle.dump(entry, f, protocol=pickle.HIGHEST_PROTOCOL)
+        os.replace(tmp, path)
+        self._evict()
+
+    def clear(self):
+        for path in self.directory.glob('*.entry'):
+            path.unlink(missing_ok=True)
+
+    def _path(self, key):
+        return self.directory / (hashlib.sha256(key.encode()).hexdigest() + '.entry')
+
+    def _evict(self):
+        files = []
+        for path in self.directory.glob('*.entry'):
+            try:
+                stat = path.stat()
+            except OSError:
+                continue
+            files.append((stat.st_mtime, stat.st_size, path))
+        total = sum(size for _, size, _ in files)
+        for _, size, path in sorted(files, key=lambda item: item[0]):
+            if total <= self.max_bytes:
+                break
+            path.unlink(missing_ok=True)
+            total -= size
+
+
+class ETagCachingHttp:
+    """
+    httplib2.Http wrapper sending conditional requests.
+
+    A GET response carrying an ETag is stored in `cache`; the next GET of the
+    same URI is sent with If-None-Match and a 304 Not Modified is answered
+    with the stored response, so unchanged resources are not transferred
+    again. `namespace` separates the entries of different credentials.
+
+    Entries of the backends are (etag, response headers, content) tuples.
+    """
+
+    def __init__(self, http, cache, stats=None, namespace=''):
+        self.http = http
+        self.cache = cache
+        self.stats = stats or CacheStats()
+        self.namespace = namespace
+
+    def request(self, uri, method='GET', body=None, headers=None, **kwargs):
+        if method != 'GET':
+            return self.http.request(uri, method, body=body, headers=headers, **kwargs)
+
+        key = f'{self.namespace}:{uri}'
+        entry = self.cache.get(key)
+        headers = dict(headers or {})
+        if entry is not None:
+            headers['if-none-match'] = entry[0]
+
+        response, content = self.http.request(uri, method, body=body, headers=headers, **kwargs)
+
+        if response.status == 304 and entry is not None:
+            self.stats.record(hit=True, size=len(entry[2]))
+            cached = httplib2.Response(entry[1])
+            cached.status = 200
+            return cached, entry[2]
+
+        self.stats.record(hit=False)
+        etag = response.get('etag')
+        if response.status == 200 and etag:
+            self.cache.set(key, (etag, dict(response), content))
+            self.stats.record_store()
+        return response, content
+
+    @property
+    def connections(self):
+        return self.http.connections
+
+    @connections.setter
+    def connections(self, value):
+        self.http.connections = value
+
+    def close(self):
+        return self.http.close()
+
+    def __getattr__(self, name):
+        return getattr(self.http, name)
+
+
+def response_cache_from_config(config):
+    """
+    Response cache backend of settings.YOUTUBE_API_CONFIG:
+
+    RESPONSE_CACHE: 'memory', 'django', 'file' or empty for no cache
+    RESPONSE_CACHE_MAX_BYTES: size bound of the memory and file caches
+    RESPONSE_CACHE_DIR: directory of the file cache
+    RESPONSE_CACHE_ALIAS: settings.CACHES alias of the django cache
+    """
+    backend = config.get('RESPONSE_CACHE')
+    max_bytes = config.get('RESPONSE_CACHE_MAX_BYTES', DEFAULT_MAX_BYTES)
+    if not backend:
+        return None
+    if backend == 'memory':
+        return LRUCache(max_bytes=max_bytes)
+    if backend == 'django':
+        return DjangoCache(alias=config.get('RESPONSE_CACHE_ALIAS', 'default'))
+    if backend == 'file':
+        if not config.get('RESPONSE_CACHE_DIR'):
+            raise ValueError("RESPONSE_CACHE_DIR is required by the file response cache")
+        return FileCache(config['RESPONSE_CACHE_DIR'], max_bytes=max_bytes)
+    raise ValueError(f"Unknown RESPONSE_CACHE backend {backend!r}")
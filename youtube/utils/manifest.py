@@ -0,0 +1,135 @@
+import csv
+import hashlib
+import json
+import os
+import shutil
+
+MANIFEST_FORMATS = {
+    '.csv': 'csv',
+    '.jsonl': 'jsonl',
+    '.ndjson': 'jsonl',
+    '.json': 'json',
+}
+
+# Block size of reading manifests and video files for hashing.
+READ_BLOCK = 1024 * 1024
+
+
+class ManifestError(BaseException):
+    """
+    Raise when a bulk upload manifest can't be read or a row of it is invalid
+    """
+
+    def __init__(self, message, line=None):
+        self.line = line
+        super().__init__(f"line {line}: {message}" if line else message)
+
+
+def manifest_format(path, format=None):
+    """Format of the manifest at `path`, from its extension unless `format`."""
+    if format:
+        return format
+    try:
+        return MANIFEST_FORMATS[os.path.splitext(path)[1].lower()]
+    except KeyError:
+        raise ManifestError(f"Unknown manifest format of {path}, pass the format")
+
+
+def read_manifest(path, format=None):
+    """
+    Rows of the manifest at `path` as (line, dict), in file order.
+
+    CSV (with a header row) and JSON Lines are read row by row, so a
+    manifest of any length is validated and imported in constant memory; a
+    JSON file (an array of objects) is loaded whole, its "lines" are the
+    positions in the array. Empty values are left out of the rows.
+    """
+    format = manifest_format(path, format)
+    if format == 'csv':
+        with open(path, newline='', encoding='utf-8-sig') as manifest:
+            reader = csv.DictReader(manifest)
+            for row in reader:
+                if None in row:
+                    raise ManifestError("More values than header columns", reader.line_num)
+                yield reader.line_num, _compact(row)
+    elif format == 'jsonl':
+        with open(path, encoding='utf-8') as manifest:
+            for line, text in enumerate(manifest, 1):
+                if text.strip():
+                    yield line, _compact(_load_object(text, line))
+    elif format == 'json':
+        with open(path, encoding='utf-8') as manifest:
+            try:
+                rows = json.load(manifest)
+            except ValueError as error:
+                raise ManifestError(f"Invalid JSON: {error}")
+        if not isinstance(rows, list):
+            raise ManifestError("A JSON manifest must be an array of objects")
+        for line, row in enumerate(rows, 1):
+            if not isinstance(row, dict):
+                raise ManifestError("Not an object", line)
+            yield line, _compact(row)
+    else:
+        raise ManifestError(f"Unknown manifest format {format}")
+
+
+def manifest_hash(path):
+    """SHA-256 hex digest of the manifest file, it identifies an import."""
+    hasher = hashlib.sha256()
+    with open(path, 'rb') as manifest:
+        for block in iter(lambda: manifest.read(READ_BLOCK), b''):
+            hasher.update(block)
+    return hasher.hexdigest()
+
+
+def publish_slot(start, interval, index):
+    """publish_at of the `index`-th video spread from `start` every `interval`."""
+    return start + index * interval
+
+
+def place_file(source, destination):
+    """
+    Put the file `source` at `destination`: hard linked when both are on the
+    same file system, copied otherwise. An existing `destination` (i.e. of
+    an interrupted import) is replaced.
+
+    return: SHA-256 hex digest of the content
+    """
+    os.makedirs(os.path.dirname(destination), exist_ok=True)
+    if os.path.lexists(destination):
+        os.remove(destination)
+    hasher = hashlib.sha256()
+    try:
+        os.link(source, destination)
+    except OSError:
+        with open(source, 'rb') as src, open(destination, 'wb') as dst:
+            for block in iter(lambda: src.read(READ_BLOCK), b''):
+                hasher.update(block)
+                dst.write(block)
+        shutil.copystat(source, destination)
+        return hasher.hexdigest()
+    with open(source, 'rb') as src:
+        for block in iter(lambda: src.read(READ_BLOCK), b''):
+            hasher.update(block)
+    return hasher.hexdigest()
+
+
+def _load_object(text, line):
+    try:
+        row = json.loads(text)
+    except ValueError as error:
+        raise ManifestError(f"Invalid JSON: {error}", line)
+    if not isinstance(row, dict):
+        raise ManifestError("Not an object", line)
+    return row
+
+
+def _compact(row):
+    compact = {}
+    for key, value in row.items():
+        if isinstance(value, str):
+            value = value.strip()
+        if value is None or value == '':
+            continue
+        compact[key.strip()] = value
+    return compact
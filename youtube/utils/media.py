@@ -0,0 +1,197 @@
+import mimetypes
+import mmap
+import os
+
+from googleapiclient.http import MediaFileUpload, MediaUpload
+
+# Resumable upload chunks must be a multiple of 256 KiB (except the last one).
+CHUNK_GRANULARITY = 256 * 1024
+
+MIN_CHUNK_SIZE = CHUNK_GRANULARITY
+MAX_CHUNK_SIZE = 256 * 1024 * 1024
+
+
+def round_chunk_size(size):
+    """Round `size` down to a valid chunk size, at least 256 KiB."""
+    return max(CHUNK_GRANULARITY, int(size) // CHUNK_GRANULARITY * CHUNK_GRANULARITY)
+
+
+class ChunkSizer:
+    """
+    Adaptive chunk size of a resumable upload.
+
+    After every chunk the size is set so that a chunk takes about
+    `target_seconds` at the measured throughput (smoothed), so fast links send
+    few large chunks and slow links lose little on a failed chunk. An error
+    halves the chunk size.
+    """
+
+    def __init__(self, initial=8 * 1024 * 1024, target_seconds=10.0,
+                 minimum=MIN_CHUNK_SIZE, maximum=MAX_CHUNK_SIZE, smoothing=0.5):
+        self.minimum = round_chunk_size(minimum)
+        self.maximum = round_chunk_size(maximum)
+        self.target_seconds = target_seconds
+        self.smoothing = smoothing
+        self.throughput = None
+        self.errors = 0
+        self.size = self._clamp(initial)
+
+    def record(self, nbytes, seconds):
+        """Record a successfully sent chunk of `nbytes` in `seconds`."""
+        if nbytes <= 0 or seconds <= 0:
+            return
+        rate = nbytes / seconds
+        if self.throughput is None:
+            self.throughput = rate
+        else:
+            self.throughput = self.smoothing * rate + (1 - self.smoothing) * self.throughput
+        self.size = self._clamp(self.throughput * self.target_seconds)
+
+    def record_error(self):
+        """Record a failed chunk."""
+        self.errors += 1
+        self.size = self._clamp(self.size // 2)
+
+    def _clamp(self, size):
+        return min(self.maximum, max(self.minimum, round_chunk_size(size)))
+
+
+class AdaptiveMediaFileUpload(MediaFileUpload):
+    """
+    MediaFileUpload whose chunk size is given by a ChunkSizer.
+    """
+
+    def __init__(self, filename, sizer, mimetype=None):
+        self.sizer = sizer
+        super().__init__(filename, mimetype=mimetype, chunksize=sizer.size, resumable=True)
+
+    def chunksize(self):
+        return self.sizer.size
+
+
+class StreamedMediaUpload(MediaUpload):
+    """
+    Resumable media whose bytes arrive chunk by chunk from elsewhere, i.e.
+    from the browser, and are forwarded to YouTube as they come without
+    being written to disk. `feed()` the next chunk before every next_chunk().
+    """
+
+    def __init__(self, size, mimetype='application/octet-stream'):
+        self._size = size
+        self._mimetype = mimetype
+        self._data = b''
+
+    def feed(self, data):
+        self._data = data
+
+    def chunksize(self):
+        return max(len(self._data), 1)
+
+    def mimetype(self):
+        return self._mimetype
+
+    def size(self):
+        return self._size
+
+    def resumable(self):
+        return True
+
+    def getbytes(self, begin, length):
+        return self._data[:length]
+
+    def has_stream(self):
+        return False
+
+
+class MappedMediaUpload(MediaUpload):
+    """
+    Resumable media of a file served as memoryview slices of an mmap of it.
+
+    MediaFileUpload hands a stream to http.client, which copies the chunk
+    into a new bytes object every 8 KiB. Here a chunk is one memoryview of
+    the mapped file, passed to the socket without a copy in Python. Pages
+    of the chunks already sent are dropped from the mapping, so the
+    resident memory of an upload stays about one chunk, whatever the file
+    size. TLS needs the data in user space, so os.sendfile() is not used.
+
+    With a ChunkSizer `sizer` the chunk size adapts like in
+    AdaptiveMediaFileUpload.
+    """
+
+    def __init__(self, filename, mimetype=None, chunksize=8 * 1024 * 1024, sizer=None):
+        if chunksize != -1 and chunksize <= 0:
+            raise ValueError(f"Invalid chunk size {chunksize}")
+        self._filename = filename
+        self._mimetype = mimetype or mimetypes.guess_type(filename)[0] or 'application/octet-stream'
+        self._chunksize = chunksize
+        self.sizer = sizer
+        self._file = open(filename, 'rb')
+        self._size = os.fstat(self._file.fileno()).st_size
+        self._map = None
+        self._view = None
+        # end of the pages already dropped from the mapping
+        self._released = 0
+        if self._size:
+            self._map = mmap.mmap(self._file.fileno(), 0, access=mmap.ACCESS_READ)
+            if hasattr(self._map, 'madvise'):
+                self._map.madvise(mmap.MADV_SEQUENTIAL)
+            self._view = memoryview(self._map)
+
+    def chunksize(self):
+        if self.sizer is not None:
+            return self.sizer.size
+        return self._chunksize
+
+    def mimetype(self):
+        return self._mimetype
+
+    def size(self):
+        return self._size
+
+    def resumable(self):
+        return True
+
+    def has_stream(self):
+        # next_chunk() then asks getbytes() for the whole chunk
+        return False
+
+    def getbytes(self, begin, length):
+        if self._view is None:
+            return b''
+        self._release(begin)
+        end = self._size if length < 0 else min(begin + length, self._size)
+        return self._view[begin:end]
+
+    def close(self):
+        if self._view is not None:
+            self._view.release()
+            self._view = None
+        if self._map is not None:
+            try:
+                self._map.close()
+            except BufferError:
+                # a chunk is still referenced, it's closed with its last view
+                pass
+            self._map = None
+        self._file.close()
+
+    def __del__(self):
+        try:
+            self.close()
+        except Exception:
+            pass
+
+    def _release(self, begin):
+        """
+        Drop the pages before `begin` (sent and acknowledged) from the
+        mapping; they stay in the page cache, not in this process.
+        """
+        if not hasattr(self._map, 'madvise'):
+            return
+        end = begin // mmap.PAGESIZE * mmap.PAGESIZE
+        if end > self._released:
+            self._map.madvise(mmap.MADV_DONTNEED, self._released, end - self._released)
+            self._released = end
+        elif end < self._released:
+            # resumed from an earlier offset, nothing to drop
+            self._released = end
@@ -0,0 +1,316 @@
+import bisect
+import hmac
+import logging
+import threading
+import time
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+
+# Upper bounds (seconds) of the buckets of duration histograms, from form
+# parsing of a small video to the whole upload of a large one.
+DEFAULT_BUCKETS = (0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1.0, 2.5, 5.0, 10.0, 30.0,
+                   60.0, 120.0, 300.0, 600.0, 1800.0)
+
+# Content type of the Prometheus text exposition format
+CONTENT_TYPE = 'text/plain; version=0.0.4; charset=utf-8'
+
+HELP = {
+    'youtube_stage_seconds': "Duration of a stage of the upload pipeline.",
+    'youtube_stage_bytes_total': "Bytes moved by a stage of the upload pipeline.",
+    'youtube_stage_errors_total': "Stages of the upload pipeline which raised.",
+    'youtube_upload_retries_total': "Upload attempts interrupted by a retriable error.",
+    'youtube_upload_jobs_total': "Upload jobs run, by resulting status.",
+    'youtube_upload_rejections_total': "Uploads refused by the ingestion limits, by reason.",
+    'youtube_transcode_saved_bytes_total': "Bytes saved by remuxing or transcoding videos before the upload.",
+    'youtube_http_request_seconds': "Duration of an HTTP request to the YouTube API.",
+    'youtube_http_responses_total': "HTTP responses of the YouTube API by status.",
+}
+
+logger = logging.getLogger('youtube.metrics')
+
+_metrics = None
+_metrics_lock = threading.Lock()
+
+
+class Stage:
+    """
+    Timer of one stage, see Metrics.stage(). Set `bytes` to the bytes the
+    stage moved.
+    """
+    __slots__ = ('metrics', 'name', 'context', 'bytes', 'started')
+
+    def __init__(self, metrics, name, context):
+        self.metrics = metrics
+        self.name = name
+        self.context = context
+        self.bytes = 0
+
+    def __enter__(self):
+        self.started = time.perf_counter()
+        return self
+
+    def __exit__(self, exc_type, exc_value, traceback):
+        seconds = time.perf_counter() - self.started
+        metrics = self.metrics
+        metrics.observe('youtube_stage_seconds', seconds, stage=self.name)
+        if self.bytes:
+            metrics.inc('youtube_stage_bytes_total', self.bytes, stage=self.name)
+        if exc_type is not None:
+            metrics.inc('youtube_stage_errors_total', stage=self.name, error=exc_type.__name__)
+        if metrics.log:
+            logger.info(
+                "stage %s %.3fs %d bytes%s", self.name, seconds, self.bytes,
+                f" {exc_type.__name__}" if exc_type is not None else '',
+                extra={'stage': self.name, 'seconds': seconds, 'bytes': self.bytes,
+                       'error': exc_type.__name__ if exc_type is not None else None,
+                       **self.context})
+        return False
+
+
+class Metrics:
+    """
+    Thread-safe counters and histograms of the upload pipeline in this
+    process, exported in the Prometheus text format by render().
+
+    Label values must have few distinct values (stage names, statuses),
+    per-video context only goes to the structured logs of `log`: every
+    stage is then logged to the `youtube.metrics` logger with its
+    duration, bytes, error and context as record attributes.
+    """
+    enabled = True
+
+    def __init__(self, buckets=DEFAULT_BUCKETS, log=False):
+        self.buckets = tuple(sorted(buckets))
+        self.log = log
+        self._lock = threading.Lock()
+        # (name, labels) -> value
+        self._counters = {}
+        # (name, labels) -> [count of every bucket and of +Inf, sum]
+        self._histograms = {}
+
+    def stage(self, name, **context):
+        """
+        Time the stage `name` of a with block, i.e.
+
+            with metrics().stage('chunk', job=job.id) as stage:
+                ...
+                stage.bytes = sent
+        """
+        return Stage(self, name, context)
+
+    def inc(self, name, value=1, **labels):
+        key = (name, tuple(sorted(labels.items())))
+        with self._lock:
+            self._counters[key] = self._counters.get(key, 0) + value
+
+    def observe(self, name, value, **labels):
+        key = (name, tuple(sorted(labels.items())))
+        index = bisect.bisect_left(self.buckets, value)
+        with self._lock:
+            histogram = self._histograms.get(key)
+            if histogram is None:
+                histogram = self._histograms[key] = [0] * (len(self.buckets) + 1) + [0.0]
+            histogram[index] += 1
+            histogram[-1] += value
+
+    def instrument_http(self, http):
+        """
+        Wrap the httplib2.Http `http` to count responses, see InstrumentedHttp.
+        """
+        return InstrumentedHttp(http, self)
+
+    def clear(self):
+        with self._lock:
+            self._counters.clear()
+            self._histograms.clear()
+
+    def render(self):
+        """
+        return: all metrics in the Prometheus text exposition format
+        """
+        with self._lock:
+            counters = dict(self._counters)
+            histograms = {key: list(value) for key, value in self._histograms.items()}
+
+        families = {}
+        for (name, labels), value in sorted(counters.items()):
+            families.setdefault((name, 'counter'), []).append(
+                f"{name}{_labels(labels)} {_number(value)}")
+        for (name, labels), histogram in sorted(histograms.items()):
+            lines = families.setdefault((name, 'histogram'), [])
+            cumulative = 0
+            for bound, count in zip(self.buckets + (float('inf'),), histogram):
+                cumulative += count
+                le = '+Inf' if bound == float('inf') else _number(bound)
+                lines.append(f"{name}_bucket{_labels(labels + (('le', le),))} {cumulative}")
+            lines.append(f"{name}_sum{_labels(labels)} {_number(histogram[-1])}")
+            lines.append(f"{name}_count{_labels(labels)} {cumulative}")
+
+        output = []
+        for (name, kind), lines in sorted(families.items()):
+            if name in HELP:
+                output.append(f"# HELP {name} {HELP[name]}")
+            output.append(f"# TYPE {name} {kind}")
+            output.extend(lines)
+        return '\n'.join(output) + '\n'
+
+
+class _NullStage:
+    __slots__ = ()
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, exc_type, exc_value, traceback):
+        return False
+
+    def __setattr__(self, name, value):
+        pass
+
+
+_NULL_STAGE = _NullStage()
+
+
+class NullMetrics:
+    """
+    Metrics when instrumentation is disabled: every call returns at once,
+    http is not wrapped and stage() returns one shared no-op timer.
+    """
+    enabled = False
+    log = False
+
+    def stage(self, name, **context):
+        return _NULL_STAGE
+
+    def inc(self, name, value=1, **labels):
+        pass
+
+    def observe(self, name, value, **labels):
+        pass
+
+    def instrument_http(self, http):
+        return http
+
+    def clear(self):
+        pass
+
+    def render(self):
+        return ''
+
+
+class InstrumentedHttp:
+    """
+    httplib2.Http wrapper counting the responses of the YouTube API by HTTP
+    method and status and timing the requests. A request raising (i.e. a
+    dropped connection) is counted with the status 'error'.
+    """
+
+    def __init__(self, http, metrics):
+        self.http = http
+        self.metrics = metrics
+
+    def request(self, uri, method='GET', body=None, headers=None, **kwargs):
+        started = time.perf_counter()
+        status = 'error'
+        try:
+            response, content = self.http.request(
+                uri, method, body=body, headers=headers, **kwargs)
+            status = str(response.status)
+            return response, content
+        finally:
+            self.metrics.observe('youtube_http_request_seconds',
+                                 time.perf_counter() - started, method=method)
+            self.metrics.inc('youtube_http_responses_total', method=method, status=status)
+
+    @property
+    def connections(self):
+        return self.http.connections
+
+    @connections.setter
+    def connections(self, value):
+        self.http.connections = value
+
+    def close(self):
+        return self.http.close()
+
+    def __getattr__(self, name):
+        return getattr(self.http, name)
+
+
+def metrics():
+    """
+    Metrics of the process configured by settings.YOUTUBE_API_CONFIG:
+    METRICS enables them (NullMetrics otherwise), METRICS_LOG logs every
+    stage as a structured record.
+    """
+    global _metrics
+    if _metrics is not None:
+        return _metrics
+    with _metrics_lock:
+        if _metrics is None:
+            from django.conf import settings
+            config = settings.YOUTUBE_API_CONFIG
+            if config.get('METRICS', False):
+                _metrics = Metrics(log=config.get('METRICS_LOG', False))
+            else:
+                _metrics = NullMetrics()
+        return _metrics
+
+
+def authorized(authorization, token):
+    """
+    True when the Authorization header `authorization` is the bearer token
+    `token` (METRICS_TOKEN), compared in constant time.
+    """
+    scheme, _, credentials = (authorization or '').partition(' ')
+    return bool(token) and scheme.lower() == 'bearer' and \
+        hmac.compare_digest(credentials.strip().encode(), token.encode())
+
+
+def serve(port, address='127.0.0.1', token=None):
+    """
+    Serve metrics().render() over HTTP on `port` in a daemon thread, for
+    processes without a web server (i.e. the upload worker). With `token`
+    requests must send it as a bearer token.
+
+    return: the ThreadingHTTPServer
+    """
+
+    class Handler(BaseHTTPRequestHandler):
+        def do_GET(self):
+            if token and not authorized(self.headers.get('Authorization'), token):
+                self.send_response(401)
+                self.send_header('WWW-Authenticate', 'Bearer')
+                self.send_header('Content-Length', '0')
+                self.end_headers()
+                return
+            body = metrics().render().encode()
+            self.send_response(200)
+            self.send_header('Content-Type', CONTENT_TYPE)
+            self.send_header('Content-Length', str(len(body)))
+            self.end_headers()
+            self.wfile.write(body)
+
+        def log_message(self, format, *args):
+            pass
+
+    server = ThreadingHTTPServer((address, port), Handler)
+    server.daemon_threads = True
+    threading.Thread(target=server.serve_forever, name='metrics', daemon=True).start()
+    return server
+
+
+def _labels(labels):
+    if not labels:
+        return ''
+    pairs = ','.join(f'{name}="{_escape(value)}"' for name, value in labels)
+    return '{' + pairs + '}'
+
+
+def _escape(value):
+    return str(value).replace('\\', '\\\\').replace('\n', '\\n').replace('"', '\\"')
+
+
+def _number(value):
+    if isinstance(value, float) and value.is_integer():
+        return str(int(value))
+    return repr(value) if isinstance(value, float) else str(value)
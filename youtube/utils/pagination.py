@@ -0,0 +1,107 @@
+import base64
+import json
+
+from django.core.paginator import Paginator
+from django.db import connections
+from django.db.models import Q
+from django.utils.functional import cached_property
+
+# Exact counts are cheap below this estimated number of rows.
+EXACT_COUNT_BELOW = 10000
+
+
+class CursorError(BaseException):
+    """
+    Raise when a pagination cursor can't be decoded or doesn't match the ordering
+    """
+    pass
+
+
+def encode_cursor(ordering, values):
+    """Opaque cursor of the position after a row with `values` in `ordering`."""
+    data = json.dumps([ordering] + [
+        value.isoformat() if hasattr(value, 'isoformat') else value for value in values])
+    return base64.urlsafe_b64encode(data.encode()).decode().rstrip('=')
+
+
+def decode_cursor(cursor, ordering):
+    try:
+        data = json.loads(base64.urlsafe_b64decode(cursor + '=' * (-len(cursor) % 4)))
+    except ValueError:
+        raise CursorError(f"Invalid cursor {cursor}")
+    if not isinstance(data, list) or not data or data[0] != ordering:
+        raise CursorError(f"The cursor is not of the ordering {ordering}")
+    return data[1:]
+
+
+def keyset_page(queryset, ordering, cursor=None, limit=50):
+    """
+    A page of `queryset` sorted by `ordering` (a field name, `-` for
+    descending) and the primary key, starting after `cursor`.
+
+    Pages are selected with a WHERE on the sort key of the last row of the
+    previous page instead of an OFFSET, so with an index on the filtered
+    fields and `ordering` every page costs the same, however deep. Nothing
+    is counted. `queryset` may be a values() queryset including `ordering`
+    and `pk`.
+
+    return: (rows, cursor of the next page or None)
+    Raises:
+        CursorError: on an invalid cursor
+    """
+    field = ordering.lstrip('-')
+    descending = ordering.startswith('-')
+    model_field = queryset.model._meta.get_field(field)
+    pk_field = queryset.model._meta.pk
+    if cursor:
+        value, pk = decode_cursor(cursor, ordering)
+        try:
+            value, pk = model_field.to_python(value), pk_field.to_python(pk)
+        except Exception:
+            raise CursorError(f"Invalid cursor {cursor}")
+        after = 'lt' if descending else 'gt'
+        queryset = queryset.filter(
+            Q(**{f'{field}__{after}': value}) | Q(**{field: value, f'pk__{after}': pk}))
+    prefix = '-' if descending else ''
+    rows = list(queryset.order_by(ordering, f'{prefix}pk')[:limit + 1])
+    if len(rows) <= limit:
+        return rows, None
+    rows = rows[:limit]
+    last = rows[-1]
+    if isinstance(last, dict):
+        values = last[field], last.get('pk', last.get(pk_field.attname))
+    else:
+        values = getattr(last, field), last.pk
+    return rows, encode_cursor(ordering, values)
+
+
+def estimated_count(queryset, exact_below=EXACT_COUNT_BELOW):
+    """
+    Number of rows of `queryset`, estimated by the query planner on
+    PostgreSQL when it's large: the estimate of EXPLAIN costs nothing while
+    COUNT(*) reads every matching row. Exact on other databases.
+    """
+    connection = connections[queryset.db]
+    if connection.vendor != 'postgresql':
+        return queryset.count()
+    sql, params = queryset.order_by().query.sql_with_params()
+    with connection.cursor() as cursor:
+        cursor.execute(f'EXPLAIN (FORMAT JSON) {sql}', params)
+        plan = cursor.fetchone()[0]
+    if isinstance(plan, str):
+        plan = json.loads(plan)
+    estimate = int(plan[0]['Plan']['Plan Rows'])
+    if estimate < exact_below:
+        return queryset.count()
+    return estimate
+
+
+class EstimatedCountPaginator(Paginator):
+    """
+    Paginator counting with estimated_count(), for admin change lists of
+    large tables (with ModelAdmin.show_full_result_count = False).
+    """
+
+    @cached_property
+    def count(self):
+        return estimated_count(self.object_list)
@@ -0,0 +1,116 @@
+import time
+
+from django.conf import settings
+
+# weight of the last chunk in the upload rate
+RATE_SMOOTHING = 0.3
+
+
+class ProgressStore:
+    """
+    Live progress of upload jobs in a Django cache (settings.CACHES), every
+    worker and web process reads and writes it without the database. Use a
+    cache shared by the processes, i.e. memcached, redis or the database cache.
+    """
+
+    def __init__(self, alias=None, timeout=24 * 60 * 60):
+        self.alias = alias or settings.YOUTUBE_API_CONFIG.get('PROGRESS_CACHE_ALIAS', 'default')
+        self.timeout = timeout
+
+    @property
+    def cache(self):
+        from django.core.cache import caches
+        return caches[self.alias]
+
+    @staticmethod
+    def key(job_id):
+        return f'yt-progress:{job_id}'
+
+    def get(self, job_id):
+        return self.cache.get(self.key(job_id))
+
+    def set(self, job_id, state):
+        self.cache.set(self.key(job_id), state, timeout=self.timeout)
+
+
+class ProgressReporter:
+    """
+    `on_progress(resumable_uri, bytes_uploaded, total_bytes)` callback of an
+    upload (see YTApi.initialize_upload()) keeping the rate and ETA of the
+    upload.
+
+    Writes are coalesced: the state is published to `store` at most every
+    `interval` seconds and `persist(resumable_uri, bytes_uploaded, total_bytes)`
+    (i.e. the database) is called when the upload session changes or at most
+    every `persist_interval` seconds. A call between two writes is a few
+    arithmetic operations.
+    """
+
+    def __init__(self, job_id, store, persist=None, user_id=None, attempts=0,
+                 interval=1.0, persist_interval=30.0, clock=time.monotonic):
+        self.job_id = job_id
+        self.store = store
+        self.persist = persist
+        self.interval = interval
+        self.persist_interval = persist_interval
+        self.clock = clock
+        self.state = {
+            'id': job_id,
+            'user_id': user_id,
+            'status': 'running',
+            'bytes_uploaded': 0,
+            'total_bytes': None,
+            'rate': None,
+            'eta': None,
+            'retries': max(attempts - 1, 0),
+            'updated_at': None,
+        }
+        self._uri = None
+        self._last = None
+        self._published_at = None
+        self._persisted_at = None
+
+    def __call__(self, resumable_uri, bytes_uploaded, total_bytes):
+        current = self.clock()
+        state = self.state
+        if self._last is not None:
+            last_at, last_bytes = self._last
+            if current > last_at and bytes_uploaded >= last_bytes:
+                rate = (bytes_uploaded - last_bytes) / (current - last_at)
+                state['rate'] = rate if state['rate'] is None else \
+                    RATE_SMOOTHING * rate + (1 - RATE_SMOOTHING) * state['rate']
+        self._last = (current, bytes_uploaded)
+        state['bytes_uploaded'] = bytes_uploaded
+        state['total_bytes'] = total_bytes
+
+        if self.persist is not None and (
+                self._persisted_at is None or resumable_uri != self._uri
+                or current - self._persisted_at >= self.persist_interval):
+            self.persist(resumable_uri, bytes_uploaded, total_bytes)
+            self._uri = resumable_uri
+            self._persisted_at = current
+        if self._published_at is None or current - self._published_at >= self.interval:
+            self.publish()
+            self._published_at = current
+
+    def continue_from(self, state):
+        """
+        Continue the rate of a `state` published earlier (by this or
+        another process), the reporter's clock must be time.time.
+        """
+        if state is None:
+            return
+        self.state.update(rate=state.get('rate'), retries=state.get('retries', 0))
+        if state.get('updated_at') is not None:
+            self._last = (state['updated_at'], state['bytes_uploaded'])
+
+    def publish(self, **changes):
+        """
+        Write the state, updated with `changes`, to the store now.
+        """
+        state = self.state
+        state.update(changes)
+        if state['rate'] and state['total_bytes']:
+            state['eta'] = max(state['total_bytes'] - state['bytes_uploaded'], 0) / state['rate']
+        state['updated_at'] = time.time()
+        self.store.set(self.job_id, state)
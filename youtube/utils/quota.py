@@ -0,0 +1,75 @@
+import datetime
+from zoneinfo import ZoneInfo
+
+from django.conf import settings
+
+# Quota units charged by the YouTube Data API per call of a method, calls
+# of methods missing here cost 1 unit.
+# See: https://developers.google.com/youtube/v3/determine_quota_cost
+QUOTA_COSTS = {
+    'youtube.videos.insert': 1600,
+    'youtube.videos.update': 50,
+    'youtube.videos.delete': 50,
+    'youtube.videos.list': 1,
+    'youtube.thumbnails.set': 50,
+    'youtube.channels.list': 1,
+    'youtube.playlistItems.list': 1,
+    'youtube.search.list': 100,
+}
+
+# Default daily quota of a Google Cloud project.
+DEFAULT_DAILY_QUOTA = 10000
+
+# The daily quota is reset at midnight Pacific Time.
+QUOTA_TIMEZONE = ZoneInfo('America/Los_Angeles')
+
+
+def quota_cost(method_id):
+    return QUOTA_COSTS.get(method_id, 1)
+
+
+def quota_day(at=None):
+    """Quota day of `at` (default: now), dates are Pacific Time."""
+    at = at or datetime.datetime.now(datetime.timezone.utc)
+    return at.astimezone(QUOTA_TIMEZONE).date()
+
+
+def next_quota_reset(at=None):
+    """Time the quota of the day of `at` is reset."""
+    day = quota_day(at) + datetime.timedelta(days=1)
+    return datetime.datetime.combine(day, datetime.time(), tzinfo=QUOTA_TIMEZONE)
+
+
+def quota_key():
+    """
+    Key of the quota ledger; the quota belongs to the Google Cloud project
+    of the client secret.
+    """
+    return settings.YOUTUBE_API_CONFIG.get('CLIENT_SECRET_FILE') or 'default'
+
+
+class QuotaConfig:
+    """
+    Quota settings of settings.YOUTUBE_API_CONFIG.
+
+    daily_limit: quota units per day, 0 for no limit
+    requests_per_second: refill rate of the token bucket, 0 for no rate limit
+    burst: capacity of the token bucket (requests)
+    max_wait: seconds a call waits for a token before it's deferred
+    """
+
+    def __init__(self, daily_limit=DEFAULT_DAILY_QUOTA, requests_per_second=0, burst=10, max_wait=1.0):
+        self.daily_limit = daily_limit
+        self.requests_per_second = requests_per_second
+        self.burst = max(burst, 1)
+        self.max_wait = max_wait
+
+    @classmethod
+    def from_settings(cls):
+        config = settings.YOUTUBE_API_CONFIG
+        return cls(
+            daily_limit=config.get('QUOTA_DAILY_LIMIT', DEFAULT_DAILY_QUOTA),
+            requests_per_second=config.get('QUOTA_REQUESTS_PER_SECOND', 0),
+            burst=config.get('QUOTA_BURST', 10),
+            max_wait=config.get('QUOTA_MAX_WAIT', 1.0),
+        )
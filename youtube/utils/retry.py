@@ -0,0 +1,130 @@
+import http.client
+import json
+import random
+from collections import namedtuple
+
+import httplib2
+from django.conf import settings
+from googleapiclient.errors import HttpError
+
+# Explicitly tell the underlying HTTP transport library not to retry, since
+# we are handling retry logic ourselves.
+httplib2.RETRIES = 1
+
+# Maximum number of times to retry before giving up.
+MAX_RETRIES = 10
+
+# Always retry when these exceptions are raised.
+RETRIABLE_EXCEPTIONS = (httplib2.HttpLib2Error, IOError, http.client.NotConnected,
+                        http.client.IncompleteRead, http.client.ImproperConnectionState,
+                        http.client.CannotSendRequest, http.client.CannotSendHeader,
+                        http.client.ResponseNotReady, http.client.BadStatusLine)
+
+# Always retry when an apiclient.errors.HttpError with one of these status
+# codes is raised.
+RETRIABLE_STATUS_CODES = [500, 502, 503, 504]
+
+# HttpError reasons of YouTube meaning "slow down" and "out of daily quota".
+# See: https://developers.google.com/youtube/v3/docs/errors
+RATE_LIMIT_REASONS = ['rateLimitExceeded', 'userRateLimitExceeded']
+QUOTA_REASONS = ['quotaExceeded', 'dailyLimitExceeded']
+
+
+class ErrorClass:
+    TRANSPORT = 'transport'
+    SERVER = 'server'
+    RATE_LIMIT = 'rate_limit'
+    QUOTA = 'quota'
+    FATAL = 'fatal'
+
+
+# delay of attempt n is random() * min(cap, base * 2 ** n) seconds
+Backoff = namedtuple('Backoff', ['base', 'cap', 'max_retries'])
+
+DEFAULT_BACKOFFS = {
+    ErrorClass.TRANSPORT: Backoff(base=1, cap=60, max_retries=MAX_RETRIES),
+    ErrorClass.SERVER: Backoff(base=1, cap=60, max_retries=MAX_RETRIES),
+    ErrorClass.RATE_LIMIT: Backoff(base=30, cap=15 * 60, max_retries=MAX_RETRIES),
+    # daily quota is reset at midnight Pacific Time
+    ErrorClass.QUOTA: Backoff(base=60 * 60, cap=6 * 60 * 60, max_retries=5),
+}
+
+
+def http_error_reason(error):
+    """Reason of the first error of a YouTube HttpError response, if any."""
+    try:
+        return json.loads(error.content)['error']['errors'][0]['reason']
+    except (ValueError, KeyError, IndexError, TypeError):
+        return None
+
+
+def classify_error(error):
+    """
+    ErrorClass of an exception raised by an API request.
+    """
+    if isinstance(error, HttpError):
+        status = error.resp.status
+        if status in RETRIABLE_STATUS_CODES:
+            return ErrorClass.SERVER
+        if status == 429:
+            return ErrorClass.RATE_LIMIT
+        if status == 403:
+            reason = http_error_reason(error)
+            if reason in RATE_LIMIT_REASONS:
+                return ErrorClass.RATE_LIMIT
+            if reason in QUOTA_REASONS:
+                return ErrorClass.QUOTA
+        return ErrorClass.FATAL
+    if isinstance(error, RETRIABLE_EXCEPTIONS):
+        return ErrorClass.TRANSPORT
+    return ErrorClass.FATAL
+
+
+def failure_details(error, error_class, attempts, elapsed):
+    """
+    Structured description of a failed upload, stored on UploadJob.failure.
+    """
+    resp = getattr(error, 'resp', None)
+    return {
+        'error_class': error_class,
+        'error': type(error).__name__,
+        'status': getattr(resp, 'status', None),
+        'reason': http_error_reason(error) if isinstance(error, HttpError) else None,
+        'message': str(error),
+        'attempts': attempts,
+        'elapsed': round(elapsed, 3),
+    }
+
+
+class RetryPolicy:
+    """
+    Exponential backoff with full jitter per ErrorClass, plus a deadline
+    budget for all attempts of an upload.
+
+    The policy only tells how long to wait; the caller reschedules the
+    attempt (i.e. UploadJob.available_at) instead of sleeping.
+    """
+
+    def __init__(self, backoffs=None, deadline=None, rand=random.random):
+        self.backoffs = dict(DEFAULT_BACKOFFS, **(backoffs or {}))
+        self.deadline = deadline
+        self.rand = rand
+
+    @classmethod
+    def from_settings(cls):
+        return cls(deadline=settings.YOUTUBE_API_CONFIG.get('UPLOAD_RETRY_DEADLINE'))
+
+    def next_delay(self, error_class, attempt, elapsed=0.0):
+        """
+        Seconds to wait after failed attempt number `attempt` (1 based),
+        `elapsed` seconds after the first attempt started.
+
+        return: delay in seconds or None to give up
+        """
+        backoff = self.backoffs.get(error_class)
+        if backoff is None or attempt > backoff.max_retries:
+            return None
+        delay = self.rand() * min(backoff.cap, backoff.base * 2 ** attempt)
+        if self.deadline is not None and elapsed + delay > self.deadline:
+            return None
+        return delay
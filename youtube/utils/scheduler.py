@@ -0,0 +1,187 @@
+import logging
+import time
+
+logger = logging.getLogger(__name__)
+
+# Backoff of keys whose publish failed, doubled after every failure.
+RETRY_BASE = 60.0
+RETRY_MAX = 60 * 60.0
+
+# Failed publishes of a key before the scheduler gives up on it.
+MAX_ATTEMPTS = 10
+
+
+class TimingWheel:
+    """
+    Hashed timing wheel: `slots` buckets of `tick` seconds, a key due at
+    `due` (epoch seconds) is kept in bucket int(due / tick) % slots.
+
+    Adding, moving and removing a key is O(1) and advance() only visits
+    the buckets of the ticks elapsed since the previous call, so firing
+    costs the number of keys in those buckets instead of the number of
+    scheduled keys. Keys fire at the latest at the end of their tick (up to
+    `tick` seconds early); keys due more than slots * tick ahead stay in
+    their bucket for the next turns.
+    """
+
+    def __init__(self, tick=1.0, slots=3600, start=None):
+        if tick <= 0 or slots <= 0:
+            raise ValueError("tick and slots must be positive")
+        self.tick = tick
+        self.slots = int(slots)
+        self._buckets = [{} for _ in range(self.slots)]
+        self._due = {}
+        # keys added behind the wheel, fired by the next advance()
+        self._overdue = {}
+        self._position = self._tick_of(time.time() if start is None else start) - 1
+
+    def __len__(self):
+        return len(self._due)
+
+    def __contains__(self, key):
+        return key in self._due
+
+    def due(self, key):
+        return self._due.get(key)
+
+    def add(self, key, due):
+        """Schedule `key` at `due`, moving it if it's scheduled already."""
+        self.remove(key)
+        self._due[key] = due
+        tick = self._tick_of(due)
+        if tick <= self._position:
+            self._overdue[key] = due
+        else:
+            self._buckets[tick % self.slots][key] = due
+
+    def remove(self, key):
+        due = self._due.pop(key, None)
+        if due is None:
+            return False
+        if self._overdue.pop(key, None) is None:
+            self._buckets[self._tick_of(due) % self.slots].pop(key, None)
+        return True
+
+    def advance(self, now):
+        """
+        Move the wheel to `now`.
+
+        return: keys due up to the tick of `now`, removed from the wheel,
+            sorted by due time
+        """
+        target = self._tick_of(now)
+        fired = list(self._overdue.items())
+        self._overdue.clear()
+        if target > self._position:
+            steps = min(target - self._position, self.slots)
+            for tick in range(target - steps + 1, target + 1):
+                bucket = self._buckets[tick % self.slots]
+                due_keys = [key for key, due in bucket.items() if self._tick_of(due) <= target]
+                for key in due_keys:
+                    fired.append((key, bucket.pop(key)))
+            self._position = target
+        for key, _ in fired:
+            del self._due[key]
+        fired.sort(key=lambda item: item[1])
+        return [key for key, _ in fired]
+
+    def _tick_of(self, at):
+        return int(at // self.tick)
+
+
+class PublishScheduler:
+    """
+    Fires scheduled publishes at their due time from a TimingWheel.
+
+    Every `refill_interval` seconds `load(until)` returns (key, due) of all
+    keys due before `until` = now + `horizon` (one indexed range query) and
+    they are put on the wheel; nothing is polled per key. Keys due in a
+    tick are passed to `publish(keys)` in lists of up to `batch_size`,
+    which returns {key: retry_at or None} of the keys it couldn't publish;
+    they are put back on the wheel at retry_at (a deferral, i.e. by the
+    quota) or with an exponential backoff (a failure). After `max_attempts`
+    failures of a key `give_up(key, failures)` is called, it must keep
+    `load()` from returning the key again. Keys that stopped being due must
+    be skipped by `publish()`. All times are epoch seconds.
+    """
+
+    def __init__(self, load, publish, tick=1.0, horizon=3600.0, refill_interval=60.0,
+                 batch_size=500, clock=time.time, max_attempts=MAX_ATTEMPTS, give_up=None):
+        self.load = load
+        self.publish = publish
+        self.max_attempts = max_attempts
+        self.give_up = give_up
+        self.horizon = horizon
+        self.refill_interval = refill_interval
+        self.batch_size = batch_size
+        self.clock = clock
+        self.wheel = TimingWheel(tick=tick, slots=max(1, int(horizon / tick)), start=clock())
+        self.refilled_at = None
+        # {key: (failures, retry_at)} of keys whose publish failed
+        self._retries = {}
+
+    def refill(self, now=None):
+        """
+        Put the keys due within the horizon on the wheel.
+
+        return: number of loaded keys
+        """
+        now = self.clock() if now is None else now
+        loaded = set()
+        for key, due in self.load(now + self.horizon):
+            retry = self._retries.get(key)
+            if retry is not None and retry[1] > now:
+                due = retry[1]
+            if self.wheel.due(key) != due:
+                self.wheel.add(key, due)
+            loaded.add(key)
+        # a key failed before is always due, unless it was published or deleted meanwhile
+        for key in set(self._retries) - loaded:
+            del self._retries[key]
+            self.wheel.remove(key)
+        self.refilled_at = now
+        return len(loaded)
+
+    def run_once(self, now=None):
+        """
+        Refill the wheel when it's time and publish the keys due at `now`.
+
+        return: number of keys passed to publish()
+        """
+        now = self.clock() if now is None else now
+        if self.refilled_at is None or now - self.refilled_at >= self.refill_interval:
+            self.refill(now)
+        keys = self.wheel.advance(now)
+        for start in range(0, len(keys), self.batch_size):
+            batch = keys[start:start + self.batch_size]
+            failed = self.publish(batch)
+            for key in batch:
+                if key in failed:
+                    self._retry(key, failed[key], now)
+                else:
+                    self._retries.pop(key, None)
+        return len(keys)
+
+    def run(self, should_stop=lambda: False):
+        while not should_stop():
+            self.run_once()
+            now = self.clock()
+            next_refill = self.refilled_at + self.refill_interval
+            # wake up every tick while keys are scheduled
+            wait = self.wheel.tick if len(self.wheel) else next_refill - now
+            time.sleep(max(min(wait, next_refill - now), 0.01))
+
+    def _retry(self, key, retry_at, now):
+        failures = self._retries.get(key, (0, None))[0]
+        if retry_at is None:
+            failures += 1
+            if failures >= self.max_attempts:
+                self._retries.pop(key, None)
+                logger.warning("Publish of %s failed %d times, giving up", key, failures)
+                if self.give_up is not None:
+                    self.give_up(key, failures)
+                return
+            retry_at = now + min(RETRY_BASE * 2 ** (failures - 1), RETRY_MAX)
+        self._retries[key] = failures, retry_at
+        self.wheel.add(key, retry_at)
+        logger.info("Publish of %s failed %d time(s), retry at %s", key, failures, retry_at)
@@ -0,0 +1,211 @@
+"""
+Full-text search over the title, description and tags of videos.
+
+PostgreSQL matches a SearchVector of the columns against a GIN expression index,
+SQLite an FTS5 table kept in sync with youtube_ytvideo by triggers. Other
+databases (or SQLite without FTS5) fall back to icontains scans.
+"""
+import re
+
+from django.db import OperationalError, connections
+from django.db.models import Q
+
+VIDEO_TABLE = 'youtube_ytvideo'
+
+# text search configuration of PostgreSQL, `simple` doesn't stem so search
+# works the same for every language; changing it needs a new index
+PG_CONFIG = 'simple'
+PG_INDEX = 'youtube_ytvideo_search_idx'
+
+
+# columns of the search document, in the order of the indexed expression
+SEARCH_FIELDS = ['title', 'description', 'tags']
+
+
+def pg_document():
+    """
+    Indexed tsvector expression, the SQL of SearchVector(*SEARCH_FIELDS,
+    config=PG_CONFIG) so PostgreSQL matches the queries to the index.
+    """
+    return "to_tsvector('{}', {})".format(
+        PG_CONFIG, " || ' ' || ".join(f"COALESCE({field}, '')" for field in SEARCH_FIELDS))
+
+
+FTS_TABLE = 'youtube_ytvideo_fts'
+FTS_TRIGGERS = {
+    f'{FTS_TABLE}_insert': f"""
+        CREATE TRIGGER IF NOT EXISTS {FTS_TABLE}_insert AFTER INSERT ON {VIDEO_TABLE} BEGIN
+            INSERT INTO {FTS_TABLE}(rowid, title, description, tags)
+            VALUES (new.id, new.title, new.description, new.tags);
+        END""",
+    f'{FTS_TABLE}_delete': f"""
+        CREATE TRIGGER IF NOT EXISTS {FTS_TABLE}_delete AFTER DELETE ON {VIDEO_TABLE} BEGIN
+            INSERT INTO {FTS_TABLE}({FTS_TABLE}, rowid, title, description, tags)
+            VALUES ('delete', old.id, old.title, old.description, old.tags);
+        END""",
+    f'{FTS_TABLE}_update': f"""
+        CREATE TRIGGER IF NOT EXISTS {FTS_TABLE}_update
+        AFTER UPDATE OF title, description, tags ON {VIDEO_TABLE} BEGIN
+            INSERT INTO {FTS_TABLE}({FTS_TABLE}, rowid, title, description, tags)
+            VALUES ('delete', old.id, old.title, old.description, old.tags);
+            INSERT INTO {FTS_TABLE}(rowid, title, description, tags)
+            VALUES (new.id, new.title, new.description, new.tags);
+        END""",
+}
+
+WORD_RE = re.compile(r'\w+')
+
+# {database alias: search backend}, see search_backend()
+_backends = {}
+
+
+def split_tags(tags):
+    """Tags of the comma separated `tags` of a YTVideo, without empty ones."""
+    return [tag.strip() for tag in tags.split(',') if tag.strip()]
+
+
+def normalize_tag(tag):
+    """Indexed form of a tag: lowercase, whitespace collapsed."""
+    return ' '.join(tag.lower().split())
+
+
+def normalized_tags(tags):
+    """Distinct normalized tags of the comma separated `tags`, in order."""
+    return list(dict.fromkeys(normalize_tag(tag) for tag in split_tags(tags)))
+
+
+def search_words(query):
+    return WORD_RE.findall(query.lower())
+
+
+class PostgresSearch:
+    """
+    SearchVector of title, description and tags matched with a raw
+    SearchQuery of prefixes of all words; the vector is the indexed
+    expression (see pg_document()) so PostgreSQL scans the GIN index.
+    """
+    name = 'postgresql'
+
+    def filter(self, queryset, words, rank=False):
+        # django.contrib.postgres needs psycopg2, only there on PostgreSQL
+        from django.contrib.postgres.search import SearchQuery, SearchRank, SearchVector
+
+        vector = SearchVector(*SEARCH_FIELDS, config=PG_CONFIG)
+        query = SearchQuery(
+            ' & '.join(f'{word}:*' for word in words), search_type='raw', config=PG_CONFIG)
+        queryset = queryset.annotate(search_document=vector).filter(search_document=query)
+        if rank:
+            queryset = queryset.annotate(rank=SearchRank(vector, query)).order_by('-rank', '-pk')
+        return queryset
+
+    @staticmethod
+    def install(connection):
+        with connection.cursor() as cursor:
+            cursor.execute(
+                f"CREATE INDEX IF NOT EXISTS {PG_INDEX} ON {VIDEO_TABLE} USING GIN ({pg_document()})")
+
+    @staticmethod
+    def uninstall(connection):
+        with connection.cursor() as cursor:
+            cursor.execute(f"DROP INDEX IF EXISTS {PG_INDEX}")
+
+
+class SQLiteSearch:
+    """
+    FTS5 table with the title, description and tags of videos (external
+    content of youtube_ytvideo), matched with prefixes of all words.
+    """
+    name = 'sqlite-fts5'
+
+    def filter(self, queryset, words, rank=False):
+        match = ' '.join(f'"{word}"*' for word in words)
+        queryset = queryset.extra(
+            where=[f"{VIDEO_TABLE}.id IN (SELECT rowid FROM {FTS_TABLE} WHERE {FTS_TABLE} MATCH %s)"],
+            params=[match])
+        if rank:
+            # bm25() is lower for better matches
+            queryset = queryset.extra(
+                select={'rank': f"(SELECT -bm25({FTS_TABLE}) FROM {FTS_TABLE} "
+                                f"WHERE {FTS_TABLE} MATCH %s AND rowid = {VIDEO_TABLE}.id)"},
+                select_params=[match]).order_by('-rank', '-pk')
+        return queryset
+
+    @staticmethod
+    def install(connection):
+        """
+        Create the FTS5 table and its triggers when missing and rebuild it
+        from youtube_ytvideo when a trigger was missing, i.e. after a
+        migration remade the table.
+
+        return: False when SQLite has no FTS5
+        """
+        with connection.cursor() as cursor:
+            try:
+                cursor.execute(
+                    f"CREATE VIRTUAL TABLE IF NOT EXISTS {FTS_TABLE} USING fts5("
+                    f"title, description, tags, content='{VIDEO_TABLE}', content_rowid='id', "
+                    f"prefix='2 3')")
+            except OperationalError:
+                return False
+            cursor.execute(
+                "SELECT name FROM sqlite_master WHERE type = 'trigger' AND tbl_name = %s",
+                [VIDEO_TABLE])
+            existing = {row[0] for row in cursor.fetchall()}
+            if set(FTS_TRIGGERS) - existing:
+                for sql in FTS_TRIGGERS.values():
+                    cursor.execute(sql)
+                cursor.execute(f"INSERT INTO {FTS_TABLE}({FTS_TABLE}) VALUES ('rebuild')")
+        return True
+
+    @staticmethod
+    def uninstall(connection):
+        with connection.cursor() as cursor:
+            for name in FTS_TRIGGERS:
+                cursor.execute(f"DROP TRIGGER IF EXISTS {name}")
+            cursor.execute(f"DROP TABLE IF EXISTS {FTS_TABLE}")
+
+
+class ScanSearch:
+    """icontains of all words on title, description or tags: a table scan."""
+    name = 'scan'
+
+    def filter(self, queryset, words, rank=False):
+        for word in words:
+            queryset = queryset.filter(
+                Q(title__icontains=word) | Q(description__icontains=word) | Q(tags__icontains=word))
+        return queryset
+
+
+def search_backend(alias='default'):
+    """Search backend of the database `alias`."""
+    backend = _backends.get(alias)
+    if backend is None:
+        connection = connections[alias]
+        backend = ScanSearch()
+        if connection.vendor == 'postgresql':
+            backend = PostgresSearch()
+        elif connection.vendor == 'sqlite':
+            with connection.cursor() as cursor:
+                cursor.execute("SELECT 1 FROM sqlite_master WHERE type = 'table' AND name = %s",
+                               [FTS_TABLE])
+                if cursor.fetchone():
+                    backend = SQLiteSearch()
+        _backends[alias] = backend
+    return backend
+
+
+def install_search(connection):
+    """Create the search index of the database of `connection` (migrations, post_migrate)."""
+    _backends.pop(connection.alias, None)
+    if connection.vendor == 'postgresql':
+        PostgresSearch.install(connection)
+    elif connection.vendor == 'sqlite':
+        SQLiteSearch.install(connection)
+
+
+def uninstall_search(connection):
+    _backends.pop(connection.alias, None)
+    if connection.vendor == 'postgresql':
+        PostgresSearch.uninstall(connection)
+    elif connection.vendor == 'sqlite':
+        SQLiteSearch.uninstall(connection)
@@ -0,0 +1,82 @@
+import datetime
+import os
+import threading
+
+import google_auth_httplib2
+from google.auth.transport.requests import Request
+
+from .metrics import metrics
+
+# Refresh credentials this long before they expire, so that a long upload
+# never starts with an access token which is about to expire.
+REFRESH_MARGIN = datetime.timedelta(minutes=5)
+
+
+def service_credentials(service):
+    """
+    Credentials of a googleapiclient service built with `credentials=`,
+    None for an unauthenticated one.
+    """
+    http = getattr(service, '_http', None)
+    if isinstance(http, google_auth_httplib2.AuthorizedHttp):
+        return http.credentials
+    return None
+
+
+class ServiceCache:
+    """
+    Lazy, thread-safe, process-local cache of an authenticated API service.
+
+    The service is built by `factory` on first use instead of import time.
+    Its credentials are refreshed in place (and passed to `on_refresh`, i.e.
+    to persist them) when they are about to expire, so the service itself is
+    built once per process. A forked process (i.e. gunicorn --preload) builds
+    its own service as httplib2 connections must not be shared.
+    """
+
+    def __init__(self, factory, on_refresh=None, refresh_margin=REFRESH_MARGIN):
+        self.factory = factory
+        self.on_refresh = on_refresh
+        self.refresh_margin = refresh_margin
+        self._lock = threading.Lock()
+        self._service = None
+        self._pid = None
+
+    def get(self):
+        """
+        return: the cached service, built or refreshed if needed
+        """
+        # fast path without locking
+        service = self._service
+        if service is not None and self._pid == os.getpid() and not self._expiring(service):
+            return service
+
+        with self._lock:
+            if self._service is None or self._pid != os.getpid():
+                with metrics().stage('auth'):
+                    self._service = self.factory()
+                self._pid = os.getpid()
+            elif self._expiring(self._service):
+                with metrics().stage('auth_refresh'):
+                    self._refresh(service_credentials(self._service))
+            return self._service
+
+    def clear(self):
+        with self._lock:
+            self._service = None
+            self._pid = None
+
+    def _expiring(self, service):
+        cred = service_credentials(service)
+        expiry = getattr(cred, 'expiry', None)
+        if expiry is None:
+            return False
+        # google-auth expiry is a naive UTC datetime
+        return expiry - self.refresh_margin <= datetime.datetime.utcnow()
+
+    def _refresh(self, cred):
+        if not getattr(cred, 'refresh_token', None):
+            return
+        cred.refresh(Request())
+        if self.on_refresh is not None:
+            self.on_refresh(cred)
@@ -0,0 +1,135 @@
+import hashlib
+import io
+import multiprocessing
+import os
+import threading
+from concurrent.futures import ProcessPoolExecutor
+from pathlib import Path
+
+from PIL import Image, UnidentifiedImageError
+
+# YouTube custom thumbnails: at most 2 MB, 1280x720 is the recommended size.
+# See: https://developers.google.com/youtube/v3/docs/thumbnails/set
+MAX_THUMBNAIL_BYTES = 2 * 1024 * 1024
+THUMBNAIL_SIZE = (1280, 720)
+
+# JPEG qualities tried until the thumbnail fits in MAX_THUMBNAIL_BYTES
+JPEG_QUALITIES = (90, 80, 70, 60, 50)
+
+# version of the output, part of the cache key
+PIPELINE_VERSION = b'1'
+
+# Image.LANCZOS moved to Image.Resampling in Pillow 9.1
+LANCZOS = getattr(Image, 'Resampling', Image).LANCZOS
+
+_pipeline = None
+_pipeline_lock = threading.Lock()
+
+
+class ThumbnailError(BaseException):
+    """
+    Raise when a thumbnail is not a valid image or can't be made small enough
+    """
+    pass
+
+
+def prepare_thumbnail(source, cache_dir):
+    """
+    Validate, resize to THUMBNAIL_SIZE and recompress the image `source`
+    to a JPEG of at most MAX_THUMBNAIL_BYTES.
+
+    The output is cached in `cache_dir` by the hash of the source content,
+    the same image is processed once. It runs in the processes of
+    ThumbnailPipeline, so it only depends on Pillow.
+
+    return: path of the prepared JPEG
+    """
+    with open(source, 'rb') as f:
+        data = f.read()
+    digest = hashlib.sha256(PIPELINE_VERSION + data).hexdigest()
+    output = Path(cache_dir) / f'{digest}.jpg'
+    if output.exists():
+        return str(output)
+
+    try:
+        image = Image.open(io.BytesIO(data))
+        # decode a JPEG at the smallest scale still larger than the output,
+        # much faster than decoding the full image and downscaling it
+        image.draft('RGB', THUMBNAIL_SIZE)
+        image.load()
+    except (UnidentifiedImageError, OSError, Image.DecompressionBombError) as error:
+        raise ThumbnailError(f"Invalid thumbnail image {source}: {error}")
+
+    if image.mode in ('RGBA', 'LA') or (image.mode == 'P' and 'transparency' in image.info):
+        image = image.convert('RGBA')
+        background = Image.new('RGB', image.size, (255, 255, 255))
+        background.paste(image, mask=image.getchannel('A'))
+        image = background
+    elif image.mode != 'RGB':
+        image = image.convert('RGB')
+    image.thumbnail(THUMBNAIL_SIZE, LANCZOS)
+
+    for quality in JPEG_QUALITIES:
+        buffer = io.BytesIO()
+        image.save(buffer, 'JPEG', quality=quality, optimize=True, progressive=True)
+        if buffer.tell() <= MAX_THUMBNAIL_BYTES:
+            break
+    else:
+        raise ThumbnailError(f"Thumbnail {source} is larger than {MAX_THUMBNAIL_BYTES} bytes")
+
+    output.parent.mkdir(parents=True, exist_ok=True)
+    # write and rename so a concurrent process never reads a partial file
+    tmp = output.with_suffix(f'.{os.getpid()}.tmp')
+    tmp.write_bytes(buffer.getvalue())
+    os.replace(tmp, output)
+    return str(output)
+
+
+class ThumbnailPipeline:
+    """
+    Prepare thumbnails (see prepare_thumbnail()) in a pool of `max_workers`
+    processes, next to the threads uploading videos.
+
+    The processes are spawned, not forked, as the upload worker is threaded.
+    """
+
+    def __init__(self, cache_dir, max_workers=None):
+        self.cache_dir = str(cache_dir)
+        self.max_workers = max_workers
+        self._lock = threading.Lock()
+        self._pool = None
+
+    def submit(self, source):
+        """
+        return: Future of the path of the prepared thumbnail
+        """
+        with self._lock:
+            if self._pool is None:
+                self._pool = ProcessPoolExecutor(
+                    max_workers=self.max_workers, mp_context=multiprocessing.get_context('spawn'))
+        return self._pool.submit(prepare_thumbnail, str(source), self.cache_dir)
+
+    def shutdown(self, wait=True):
+        with self._lock:
+            if self._pool is not None:
+                self._pool.shutdown(wait=wait)
+                self._pool = None
+
+
+def thumbnail_pipeline():
+    """
+    ThumbnailPipeline of the process configured by settings.YOUTUBE_API_CONFIG:
+    THUMBNAIL_WORKERS processes (default: number of CPUs) caching in
+    THUMBNAIL_CACHE_DIR (default: MEDIA_ROOT/youtube/thumbnail_cache).
+    """
+    global _pipeline
+    with _pipeline_lock:
+        if _pipeline is None:
+            from django.conf import settings
+            config = settings.YOUTUBE_API_CONFIG
+            _pipeline = ThumbnailPipeline(
+                config.get('THUMBNAIL_CACHE_DIR')
+                or Path(settings.MEDIA_ROOT) / 'youtube' / 'thumbnail_cache',
+                max_workers=config.get('THUMBNAIL_WORKERS') or None,
+            )
+        return _pipeline
@@ -0,0 +1,43 @@
+from django.conf import settings
+
+# uploadStatus / processingStatus values after which a video doesn't change anymore
+# See: https://developers.google.com/youtube/v3/docs/videos#status.uploadStatus
+UPLOAD_DONE_STATUSES = {'processed', 'failed', 'rejected', 'deleted'}
+PROCESSING_DONE_STATUSES = {'succeeded', 'failed', 'terminated'}
+
+# Partial response of the processing status checks.
+PROCESSING_PART = 'status,processingDetails'
+PROCESSING_FIELDS = 'items(id,status/uploadStatus,processingDetails/processingStatus)'
+
+
+def processing_done(upload_status, processing_status):
+    return upload_status in UPLOAD_DONE_STATUSES or processing_status in PROCESSING_DONE_STATUSES
+
+
+class PollSchedule:
+    """
+    Adaptive interval of processing status checks: a video is checked soon
+    after its upload, then less and less often.
+
+    initial: seconds before the first check
+    factor: growth of the interval after every check
+    maximum: longest interval in seconds
+    """
+
+    def __init__(self, initial=10.0, factor=1.5, maximum=600.0):
+        self.initial = initial
+        self.factor = factor
+        self.maximum = maximum
+
+    @classmethod
+    def from_settings(cls):
+        config = settings.YOUTUBE_API_CONFIG
+        return cls(
+            initial=config.get('PROCESSING_POLL_INITIAL', 10.0),
+            factor=config.get('PROCESSING_POLL_FACTOR', 1.5),
+            maximum=config.get('PROCESSING_POLL_MAX', 600.0),
+        )
+
+    def delay(self, checks):
+        """Seconds before the next check of a video checked `checks` times."""
+        return min(self.initial * self.factor ** checks, self.maximum)
@@ -0,0 +1,276 @@
+import json
+import multiprocessing
+import os
+import struct
+import subprocess
+import threading
+import time
+from collections import namedtuple
+from concurrent.futures import ProcessPoolExecutor
+from pathlib import Path
+
+# Codecs YouTube takes in an MP4 container as they are, other streams are
+# transcoded (video) or converted to AAC (audio).
+# See: https://support.google.com/youtube/answer/1722171
+MP4_VIDEO_CODECS = {'h264', 'hevc', 'av1', 'vp9', 'mpeg4'}
+MP4_AUDIO_CODECS = {'aac', 'mp3', 'ac3', 'eac3', 'opus', 'alac', 'flac'}
+
+# Bitrate of audio converted to AAC, the stereo recommendation of YouTube.
+AAC_BITRATE = '384k'
+
+# Stage of a prepared video, see prepare_video().
+NONE, REMUX, TRANSCODE = 'none', 'remux', 'transcode'
+
+# Top-level MP4 boxes read looking for moov, see faststart().
+MAX_BOXES = 64
+
+_pipeline = None
+_pipeline_lock = threading.Lock()
+
+# `reused` when the output of an earlier run was taken, see prepare_video()
+Preparation = namedtuple('Preparation', [
+    'action', 'path', 'source_bytes', 'output_bytes', 'probe_seconds', 'ffmpeg_seconds', 'reused'])
+
+
+class TranscodeError(BaseException):
+    """
+    Raise when a video can't be probed or ffmpeg failed on it
+    """
+    pass
+
+
+def probe(source, ffprobe='ffprobe'):
+    """
+    Container and streams of the video `source` by ffprobe.
+
+    return: ffprobe JSON output, with `format` and `streams`
+    """
+    try:
+        result = subprocess.run(
+            [ffprobe, '-v', 'error', '-print_format', 'json', '-show_format', '-show_streams',
+             str(source)],
+            stdin=subprocess.DEVNULL, capture_output=True, check=True)
+    except subprocess.CalledProcessError as error:
+        raise TranscodeError(f"ffprobe failed on {source}: {error.stderr.decode(errors='replace')}")
+    except OSError as error:
+        raise TranscodeError(f"Can't run {ffprobe}: {error}")
+    return json.loads(result.stdout)
+
+
+def faststart(source):
+    """
+    True when the moov box of the MP4 file `source` is before its media data,
+    so YouTube can read the index without waiting for the end of the file.
+    """
+    with open(source, 'rb') as f:
+        for _ in range(MAX_BOXES):
+            header = f.read(8)
+            if len(header) < 8:
+                return False
+            size, box = struct.unpack('>I4s', header)
+            if box == b'moov':
+                return True
+            if box == b'mdat':
+                return False
+            if size == 1:
+                size = struct.unpack('>Q', f.read(8))[0] - 8
+            elif size == 0:
+                return False
+            f.seek(size - 8, os.SEEK_CUR)
+    return False
+
+
+def bitrate(info, source):
+    """Total bits per second of the probed video, 0 when unknown."""
+    container = info.get('format', {})
+    if container.get('bit_rate'):
+        return int(container['bit_rate'])
+    duration = float(container.get('duration') or 0)
+    return int(os.path.getsize(source) * 8 / duration) if duration else 0
+
+
+def plan(info, source, max_bitrate=0):
+    """
+    Stage of the probed video `source`: TRANSCODE when it's over
+    `max_bitrate` (bits/s, 0 no limit) or its video codec isn't taken in an
+    MP4, REMUX (a stream copy) when it's not a faststart MP4, else NONE.
+
+    return: (action, audio codec option of ffmpeg)
+    """
+    streams = info.get('streams', [])
+    video = [s for s in streams if s.get('codec_type') == 'video'
+             and not s.get('disposition', {}).get('attached_pic')]
+    if not video:
+        raise TranscodeError(f"{source} has no video stream")
+    audio = [s for s in streams if s.get('codec_type') == 'audio']
+    audio_codec = 'copy' if all(s.get('codec_name') in MP4_AUDIO_CODECS for s in audio) else 'aac'
+
+    if video[0].get('codec_name') not in MP4_VIDEO_CODECS or \
+            (max_bitrate and bitrate(info, source) > max_bitrate):
+        return TRANSCODE, audio_codec
+    formats = info.get('format', {}).get('format_name', '').split(',')
+    if 'mp4' not in formats or audio_codec != 'copy' or not faststart(source):
+        return REMUX, audio_codec
+    return NONE, audio_codec
+
+
+def ffmpeg_command(source, output, action, audio_codec, max_bitrate=0, crf=20,
+                   preset='medium', threads=0, ffmpeg='ffmpeg'):
+    command = [ffmpeg, '-nostdin', '-v', 'error', '-y', '-i', str(source),
+               '-map', '0:v:0', '-map', '0:a?', '-threads', str(threads)]
+    if action == TRANSCODE:
+        command += ['-c:v', 'libx264', '-preset', preset, '-crf', str(crf), '-pix_fmt', 'yuv420p']
+        if max_bitrate:
+            command += ['-maxrate', str(max_bitrate), '-bufsize', str(2 * max_bitrate)]
+    else:
+        command += ['-c:v', 'copy']
+    command += ['-c:a', audio_codec]
+    if audio_codec == 'aac':
+        command += ['-b:a', AAC_BITRATE]
+    return command + ['-movflags', '+faststart', '-f', 'mp4', str(output)]
+
+
+def prepare_video(source, output, max_bitrate=0, crf=20, preset='medium', threads=0,
+                  ffmpeg='ffmpeg', ffprobe='ffprobe'):
+    """
+    Remux the video `source` to a faststart MP4 or transcode it when it's
+    over `max_bitrate`, see plan(). It's written to `output` with the
+    stage as suffix, i.e. `<output>.remux.mp4`.
+
+    An output left by an upload interrupted after the stage is reused as it
+    is, so a resumed upload session gets the same bytes. A transcode not
+    smaller than `source` is dropped. It runs in the processes of
+    TranscodePipeline.
+
+    return: Preparation, its path is `source` when nothing was written
+    """
+    source_bytes = os.path.getsize(source)
+    for action in (REMUX, TRANSCODE):
+        path = staged_output(output, action)
+        if os.path.exists(path):
+            return Preparation(action, path, source_bytes, os.path.getsize(path), 0.0, 0.0, True)
+
+    started = time.monotonic()
+    action, audio_codec = plan(probe(source, ffprobe), source, max_bitrate)
+    probe_seconds = time.monotonic() - started
+    if action == NONE:
+        return Preparation(NONE, source, source_bytes, source_bytes, probe_seconds, 0.0, False)
+
+    path = staged_output(output, action)
+    os.makedirs(os.path.dirname(path), exist_ok=True)
+    # write and rename so an interrupted ffmpeg never leaves a partial output
+    tmp = f'{path}.{os.getpid()}.tmp'
+    started = time.monotonic()
+    try:
+        subprocess.run(
+            ffmpeg_command(source, tmp, action, audio_codec, max_bitrate, crf, preset, threads,
+                           ffmpeg),
+            stdin=subprocess.DEVNULL, capture_output=True, check=True)
+    except subprocess.CalledProcessError as error:
+        _remove(tmp)
+        raise TranscodeError(f"ffmpeg {action} of {source} failed: "
+                             f"{error.stderr.decode(errors='replace')[-2000:]}")
+    except OSError as error:
+        _remove(tmp)
+        raise TranscodeError(f"Can't run {ffmpeg}: {error}")
+    ffmpeg_seconds = time.monotonic() - started
+    output_bytes = os.path.getsize(tmp)
+    if action == TRANSCODE and output_bytes >= source_bytes:
+        _remove(tmp)
+        return Preparation(NONE, source, source_bytes, source_bytes, probe_seconds, ffmpeg_seconds,
+                           False)
+    os.replace(tmp, path)
+    return Preparation(action, path, source_bytes, output_bytes, probe_seconds, ffmpeg_seconds,
+                       False)
+
+
+def staged_output(output, action):
+    """Path of the `action` output of prepare_video()."""
+    return f'{os.path.splitext(output)[0]}.{action}.mp4'
+
+
+def _remove(path):
+    try:
+        os.remove(path)
+    except FileNotFoundError:
+        pass
+
+
+def default_workers(threads=0):
+    """
+    Concurrent ffmpeg processes for the CPUs of this host: one per
+    `threads` CPUs, or one per four CPUs up to two when every ffmpeg uses
+    all CPUs (`threads` 0).
+    """
+    cpus = len(os.sched_getaffinity(0)) if hasattr(os, 'sched_getaffinity') else os.cpu_count()
+    cpus = cpus or 1
+    if threads:
+        return max(1, cpus // threads)
+    return max(1, min(2, cpus // 4))
+
+
+class TranscodePipeline:
+    """
+    Prepare videos before their upload (see prepare_video()) in a pool of
+    at most `max_workers` processes, each running one ffmpeg at a time.
+
+    The processes are spawned, not forked, as the upload worker is threaded.
+    """
+
+    def __init__(self, output_dir, max_workers=None, max_bitrate=0, crf=20, preset='medium',
+                 threads=0, ffmpeg='ffmpeg', ffprobe='ffprobe'):
+        self.output_dir = str(output_dir)
+        self.max_workers = max_workers or default_workers(threads)
+        self.options = dict(max_bitrate=max_bitrate, crf=crf, preset=preset, threads=threads,
+                            ffmpeg=ffmpeg, ffprobe=ffprobe)
+        self._lock = threading.Lock()
+        self._pool = None
+
+    def output(self, name):
+        """Output path of the video `name`, without the stage suffix."""
+        return os.path.join(self.output_dir, f'{name}.mp4')
+
+    def submit(self, source, name):
+        """
+        return: Future of the Preparation of `source`, written as `name`
+        """
+        with self._lock:
+            if self._pool is None:
+                self._pool = ProcessPoolExecutor(
+                    max_workers=self.max_workers, mp_context=multiprocessing.get_context('spawn'))
+        return self._pool.submit(prepare_video, str(source), self.output(name), **self.options)
+
+    def discard(self, name):
+        """Remove the outputs of the video `name`, i.e. after its upload."""
+        for action in (REMUX, TRANSCODE):
+            _remove(staged_output(self.output(name), action))
+
+    def shutdown(self, wait=True):
+        with self._lock:
+            if self._pool is not None:
+                self._pool.shutdown(wait=wait)
+                self._pool = None
+
+
+def transcode_pipeline():
+    """
+    TranscodePipeline of the process configured by settings.YOUTUBE_API_CONFIG:
+    TRANSCODE_WORKERS processes (default: from the CPUs and TRANSCODE_THREADS)
+    writing to TRANSCODE_DIR (default: MEDIA_ROOT/youtube/transcode).
+    """
+    global _pipeline
+    with _pipeline_lock:
+        if _pipeline is None:
+            from django.conf import settings
+            config = settings.YOUTUBE_API_CONFIG
+            _pipeline = TranscodePipeline(
+                config.get('TRANSCODE_DIR') or Path(settings.MEDIA_ROOT) / 'youtube' / 'transcode',
+                max_workers=config.get('TRANSCODE_WORKERS') or None,
+                max_bitrate=config.get('TRANSCODE_MAX_BITRATE', 0),
+                crf=config.get('TRANSCODE_CRF', 20),
+                preset=config.get('TRANSCODE_PRESET', 'medium'),
+                threads=config.get('TRANSCODE_THREADS', 0),
+                ffmpeg=config.get('FFMPEG', 'ffmpeg'),
+                ffprobe=config.get('FFPROBE', 'ffprobe'),
+            )
+        return _pipeline
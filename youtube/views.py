@@ -1,23 +1,95 @@
+import re
+
+from asgiref.sync import sync_to_async
+from django.conf import settings
 from django.contrib.auth.decorators import login_required
 from django.forms import ValidationError
-from django.shortcuts import render
+from django.http import Http404, HttpResponse, JsonResponse
+from django.shortcuts import get_object_or_404, render
+from django.urls import reverse
+from django.utils.dateparse import parse_datetime
+from django.utils.timezone import is_naive, make_aware, now
+from django.views.decorators.csrf import csrf_exempt, csrf_protect
+from django.views.decorators.http import require_http_methods, require_POST
+
+from .forms import YTVideoForm, YTVideoStreamForm
+from .models import STREAM_WORKER_ID, UploadJob, YTChannel, YTVideo, YTVideoQuerySet
+from .uploadhandlers import IngestionPolicy, SpoolFileUploadHandler, UploadRejected
+from .utils.aio import get_async_api
+from .utils.api import DEFAULT_CHUNK_SIZE, YTApiError
+from .utils.media import CHUNK_GRANULARITY
+from .utils.metrics import CONTENT_TYPE, authorized, metrics
+from .utils.pagination import CursorError, keyset_page
+from .utils.progress import ProgressStore
+
+CONTENT_RANGE_RE = re.compile(r'^bytes (\d+)-(\d+)/(\d+)$')
+
+# rows of a video_list page, by default and at most
+VIDEO_LIST_LIMIT = 50
+VIDEO_LIST_MAX_LIMIT = 500
 
-from .forms import YTVideoForm
+
+def stream_chunk_size():
+    """Largest chunk accepted by upload_stream_chunk."""
+    chunksize = settings.YOUTUBE_API_CONFIG.get('UPLOAD_CHUNK_SIZE', DEFAULT_CHUNK_SIZE)
+    return chunksize if chunksize > 0 else DEFAULT_CHUNK_SIZE
 
 
 @login_required
+@csrf_exempt
 def upload(request):
+    # upload handlers must be set before CSRF check reads request.POST
+    request.upload_handlers = [SpoolFileUploadHandler(request)]
+    if request.method == "POST":
+        # reading request.FILES parses the body and writes the spool file,
+        # before the CSRF check of _upload would do it
+        try:
+            with metrics().stage('parse_form', user=request.user.id) as stage:
+                stage.bytes = sum(file.size for file in request.FILES.values())
+        except UploadRejected as error:
+            # like a MultiPartParserError: empty POST and FILES instead of parsing
+            # the body again, i.e. when a 5xx response is logged with the request
+            request._mark_post_parse_error()
+            return _upload_rejected(request, error)
+    return _upload(request)
+
+
+def _upload_rejected(request, error):
+    """
+    The upload form with the reason `error` of refusing an upload. The body
+    was not read, nothing is saved so the CSRF check is not needed.
+    """
+    # the form is unbound, add_error() needs a validated form
+    response = render(request, 'youtube/upload.html', {
+        'form': YTVideoForm(),
+        'status': 'REJECTED',
+        'error': str(error),
+        'job': None,
+    }, status=error.status)
+    if error.retry_after:
+        response['Retry-After'] = str(error.retry_after)
+    return response
+
+
+@csrf_protect
+def _upload(request):
     status = 'NONE'
+    job = None
     form = YTVideoForm(request.POST or None, request.FILES or None)
     if request.method == "POST":
         if form.is_valid():
             success = True
             video = form.save(commit=False)
             video.user = request.user
+            video.channel = YTChannel.objects.default_for(request.user)
             try:
-                video.save()
-                status = 'SUCCESS'
-            except Exception as error:
+                # upload to YouTube is done by the upload worker
+                with metrics().stage('save_file', user=request.user.id):
+                    # saving a video with a file queues its UploadJob
+                    video.save()
+                job = video.upload_jobs.active().first()
+                status = 'QUEUED'
+            except Exception:
                 # print("ERROR:", error)
                 status = 'FAILED'
                 success = False
@@ -29,7 +101,299 @@ def upload(request):
                     "Video save failed by unexpected reason! Make sure everything right or try later."))
     context = {
         'form': form,
-        'status': status
+        'status': status,
+        'job': job,
     }
 
     return render(request, 'youtube/upload.html', context)
+
+
+@login_required
+@require_POST
+def upload_stream(request):
+    """
+    Start a streamed upload: the video is created from the form fields and the
+    file is then sent chunk by chunk to upload_stream_chunk, which forwards
+    every chunk to YouTube as it arrives.
+    """
+    form = YTVideoStreamForm(request.POST)
+    try:
+        size = int(request.POST.get('size', ''))
+    except ValueError:
+        size = 0
+    if size <= 0:
+        form.add_error(None, ValidationError("File size is required."))
+    if not form.is_valid():
+        return JsonResponse({'errors': form.errors}, status=400)
+    try:
+        IngestionPolicy.from_settings().check_size(size)
+    except UploadRejected as error:
+        metrics().inc('youtube_upload_rejections_total', reason=error.reason)
+        return JsonResponse({'errors': {'__all__': [str(error)]}}, status=error.status)
+
+    video = form.save(commit=False)
+    video.user = request.user
+    video.channel = YTChannel.objects.default_for(request.user)
+    video.save()
+    job = UploadJob.objects.create(
+        video=video, status=UploadJob.Status.RUNNING, worker_id=STREAM_WORKER_ID,
+        claimed_at=now(), attempts=1, total_bytes=size)
+    return JsonResponse({
+        'id': job.id,
+        'url': reverse('youtube:upload-stream-chunk', args=[job.id]),
+        'chunk_size': stream_chunk_size(),
+    }, status=201)
+
+
+@login_required
+@require_http_methods(['PUT'])
+def upload_stream_chunk(request, pk):
+    """
+    Take the chunk `Content-Range: bytes start-end/total` of a streamed upload.
+
+    Chunks must be sent in order, at most `chunk_size` bytes and, except the
+    last one, a multiple of 256 KiB. The response tells the offset to continue
+    from; on 409 or 502 the client continues (or retries) from that offset.
+    """
+    job = get_object_or_404(
+        UploadJob.objects.select_related('video__duplicate_of'), pk=pk, video__user=request.user,
+        worker_id=STREAM_WORKER_ID)
+    data, error_response = _read_stream_chunk(request, job)
+    if error_response is not None:
+        return error_response
+    try:
+        job.upload_stream_chunk(
+            data, job.bytes_uploaded, request.content_type or 'application/octet-stream')
+    except (Exception, YTApiError) as error:
+        job.last_error = f"{type(error).__name__}: {error}"
+        job.save(update_fields=['last_error'])
+        return _stream_state(job, status=502)
+    return _stream_state(job)
+
+
+async def upload_stream_chunk_async(request, pk):
+    """
+    Async upload_stream_chunk for ASGI (core.asgi), the chunk is forwarded to
+    YouTube with AsyncYTApi so the event loop serves other uploads meanwhile.
+    """
+    if request.method != 'PUT':
+        return JsonResponse({'error': "Method not allowed."}, status=405)
+    user = await _async_user(request)
+    if user is None:
+        return JsonResponse({'error': "Authentication is required."}, status=401)
+    try:
+        job = await sync_to_async(get_object_or_404)(
+            UploadJob.objects.select_related('video__duplicate_of'), pk=pk, video__user=user,
+            worker_id=STREAM_WORKER_ID)
+    except Http404:
+        return JsonResponse({'error': "Not found."}, status=404)
+    data, error_response = _read_stream_chunk(request, job)
+    if error_response is not None:
+        return error_response
+
+    api = get_async_api()
+    try:
+        if not job.session_uri:
+            job.session_uri = await api.start_session(
+                job.video, job.total_bytes, request.content_type or 'application/octet-stream')
+        bytes_uploaded, response = await api.upload_chunk(
+            job.session_uri, data, job.bytes_uploaded, job.total_bytes,
+            channel_id=job.video.channel_id)
+        await sync_to_async(job.save_stream_progress)(
+            job.session_uri, bytes_uploaded, job.total_bytes)
+        if response is not None:
+            await sync_to_async(job.finish_stream_upload)(response)
+    except (Exception, YTApiError) as error:
+        job.last_error = f"{type(error).__name__}: {error}"
+        await sync_to_async(job.save)(update_fields=['last_error'])
+        return _stream_state(job, status=502)
+    return _stream_state(job)
+
+
+async def upload_job_status_async(request, pk):
+    """
+    Async upload_job_status for ASGI, cheap to poll by many clients at once.
+    """
+    user = await _async_user(request)
+    if user is None:
+        return JsonResponse({'error': "Authentication is required."}, status=401)
+    try:
+        # youtube_video_id of a duplicate reads duplicate_of, no query in the event loop
+        job = await sync_to_async(get_object_or_404)(
+            UploadJob.objects.select_related('video__duplicate_of'), pk=pk, video__user=user)
+    except Http404:
+        return JsonResponse({'error': "Not found."}, status=404)
+    return _job_status(job)
+
+
+@sync_to_async
+def _async_user(request):
+    # request.user is lazy and loads the session from database
+    return request.user if request.user.is_authenticated else None
+
+
+def _read_stream_chunk(request, job):
+    """
+    Validate Content-Range of a streamed chunk and read it.
+
+    return: data, error_response
+    """
+    if job.status != UploadJob.Status.RUNNING:
+        return None, _stream_state(job, status=409)
+
+    match = CONTENT_RANGE_RE.match(request.headers.get('Content-Range', ''))
+    if not match:
+        return None, JsonResponse({'error': "Content-Range is required."}, status=400)
+    start, end, total = (int(value) for value in match.groups())
+    length = end - start + 1
+    last = end + 1 == total
+    if total != job.total_bytes or length <= 0 or length > stream_chunk_size() \
+            or (not last and length % CHUNK_GRANULARITY):
+        return None, JsonResponse({'error': "Invalid Content-Range."}, status=400)
+    if start != job.bytes_uploaded:
+        return None, _stream_state(job, status=409)
+
+    with metrics().stage('receive_chunk', job=job.id) as stage:
+        data = request.read(length)
+        stage.bytes = len(data)
+    if len(data) != length:
+        return None, JsonResponse({'error': "Incomplete chunk."}, status=400)
+    return data, None
+
+
+def _stream_state(job, status=200):
+    return JsonResponse({
+        'id': job.id,
+        'status': job.status,
+        'offset': job.bytes_uploaded,
+        'video_id': job.video.youtube_video_id,
+        'seconds': job.duration,
+        'error': job.last_error,
+    }, status=status)
+
+
+@login_required
+def upload_job_status(request, pk):
+    job = get_object_or_404(
+        UploadJob.objects.select_related('video__duplicate_of'), pk=pk, video__user=request.user)
+    return _job_status(job)
+
+
+@login_required
+def upload_job_progress(request, pk):
+    """
+    Live progress of an upload job (bytes, rate, ETA, retries) from the
+    ProgressStore, the database is read only when the store has none.
+    """
+    state = ProgressStore().get(pk)
+    if state is None or state['user_id'] != request.user.id:
+        job = get_object_or_404(
+            UploadJob.objects.select_related('video'), pk=pk, video__user=request.user)
+        state = job.progress()
+    return JsonResponse(state)
+
+
+@login_required
+def video_list(request):
+    """
+    Videos of the user as JSON, newest first, a page of `limit` rows.
+
+    Filters: q (words in title, description or tags), tag (repeatable),
+    privacy_status, upload_status, uploaded (true/false), publish_after
+    and publish_before (ISO 8601), channel (channel id);
+    staff users see the videos of all users or of `user` (id). `order` is
+    one of YTVideoQuerySet.LISTING_ORDERINGS. Pages are keyset paginated,
+    `next` is the URL of the next page.
+    """
+    params = request.GET
+    ordering = params.get('order', '-created')
+    if ordering not in YTVideoQuerySet.LISTING_ORDERINGS:
+        return JsonResponse({'error': f"Unknown order {ordering}"}, status=400)
+    try:
+        limit = min(int(params.get('limit', VIDEO_LIST_LIMIT)), VIDEO_LIST_MAX_LIMIT)
+        filters = {
+            'privacy_status': params.get('privacy_status'),
+            'upload_status': params.get('upload_status'),
+            'uploaded': _boolean_param(params, 'uploaded'),
+            'publish_after': _datetime_param(params, 'publish_after'),
+            'publish_before': _datetime_param(params, 'publish_before'),
+            'channel_id': params.get('channel'),
+            'query': params.get('q'),
+            'tags': params.getlist('tag'),
+        }
+        if not request.user.is_staff:
+            filters['user'] = request.user
+        elif params.get('user'):
+            filters['user'] = int(params['user'])
+    except ValueError as error:
+        return JsonResponse({'error': str(error)}, status=400)
+    if limit <= 0:
+        return JsonResponse({'error': "limit must be positive"}, status=400)
+
+    try:
+        videos, cursor = keyset_page(YTVideo.objects.listing(**filters), ordering,
+                                     cursor=params.get('cursor'), limit=limit)
+    except CursorError as error:
+        return JsonResponse({'error': str(error)}, status=400)
+    next_url = None
+    if cursor is not None:
+        query = params.copy()
+        query['cursor'] = cursor
+        next_url = f"{request.path}?{query.urlencode()}"
+    return JsonResponse({'results': videos, 'next': next_url})
+
+
+def _boolean_param(params, name):
+    value = params.get(name)
+    if value is None or value == '':
+        return None
+    if value.lower() not in ('true', 'false', '1', '0'):
+        raise ValueError(f"{name} must be true or false")
+    return value.lower() in ('true', '1')
+
+
+def _datetime_param(params, name):
+    value = params.get(name)
+    if not value:
+        return None
+    parsed = parse_datetime(value)
+    if parsed is None:
+        raise ValueError(f"Invalid {name} {value}")
+    return make_aware(parsed) if is_naive(parsed) else parsed
+
+
+def _job_status(job):
+    return JsonResponse({
+        'id': job.id,
+        'status': job.status,
+        'attempts': job.attempts,
+        'video_id': job.video.youtube_video_id,
+        'bytes_uploaded': job.bytes_uploaded,
+        'total_bytes': job.total_bytes,
+        'seconds': job.duration,
+        'error': job.last_error,
+        'upload_status': job.video.upload_status,
+        'processing_status': job.video.processing_status,
+    })
+
+
+def prometheus_metrics(request):
+    """
+    Metrics of the upload pipeline in this process in the Prometheus text
+    format, see youtube.utils.metrics. Not found when they are disabled.
+
+    Scrapers authenticate with METRICS_TOKEN as bearer token; without a
+    token configured only staff users get them.
+    """
+    instrumentation = metrics()
+    if not instrumentation.enabled:
+        raise Http404
+    token = settings.YOUTUBE_API_CONFIG.get('METRICS_TOKEN')
+    if token:
+        if not authorized(request.META.get('HTTP_AUTHORIZATION'), token):
+            response = HttpResponse(status=401)
+            response['WWW-Authenticate'] = 'Bearer'
+            return response
+    elif not request.user.is_staff:
+        raise Http404
+    return HttpResponse(instrumentation.render(), content_type=CONTENT_TYPE)